@@ -0,0 +1,548 @@
+# -*- coding: utf-8 -*-
+"""
+MIT License
+
+Copyright (c) 2019-2020 Arthur
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+"""
+Offline load test for the extensions in this repository.
+
+The cogs are loaded with in-process stand-ins for the discord objects and the bot, and are driven with synthetic
+traffic. Throughput and handler latencies are written to a JSON file, so runs of different versions can be compared.
+
+Requires `discord.py`, `utilsx` and the dependencies of the extensions themselves.
+
+Usage:
+    python benchmarks/bench_extensions.py --output bench_output.json
+"""
+import asyncio
+import importlib.util
+import json
+import platform
+import random
+import subprocess
+import sys
+import types
+from argparse import ArgumentParser
+from configparser import ConfigParser
+from datetime import datetime, timedelta
+from os import chdir, getcwd, path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from discord import Permissions
+from discord.abc import GuildChannel
+
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+WORDS = "the quick brown fox jumps over lazy dog exp level rank top spam hello world".split()
+
+# Simulated round trip of a discord API call, in seconds.
+API_LATENCY = 0.0
+
+
+async def _api_call():
+    if API_LATENCY:
+        await asyncio.sleep(API_LATENCY)
+
+
+class FakeRole:
+    def __init__(self, role_id: int, name: str, position: int = 1):
+        self.id = role_id
+        self.name = name
+        self.position = position
+        self.mention = f"<@&{role_id}>"
+        self.color = 0
+
+    def __eq__(self, other):
+        return isinstance(other, FakeRole) and other.id == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __repr__(self):
+        return f"<FakeRole id={self.id}>"
+
+
+class FakeMember:
+    def __init__(self, user_id: int, guild: "FakeGuild", roles: Optional[List[FakeRole]] = None, bot: bool = False):
+        self.id = user_id
+        self.guild = guild
+        self.roles = [guild.default_role] + (roles or [])
+        self.bot = bot
+        self.name = f"user{user_id}"
+        self.mention = f"<@!{user_id}>"
+        self.dms = 0
+
+    def __str__(self):
+        return self.name
+
+    @property
+    def top_role(self) -> FakeRole:
+        return max(self.roles, key=lambda role: role.position)
+
+    async def add_roles(self, *roles, reason=None):
+        await _api_call()
+        self.roles.extend(role for role in roles if role not in self.roles)
+
+    async def remove_roles(self, *roles, reason=None):
+        await _api_call()
+        self.roles = [role for role in self.roles if role not in roles]
+
+    async def send(self, content=None, **kwargs):
+        await _api_call()
+        self.dms += 1
+        return FakeMessage(0, self, None, content or "")
+
+    def copy(self) -> "FakeMember":
+        clone = FakeMember(self.id, self.guild, bot=self.bot)
+        clone.roles = list(self.roles)
+        return clone
+
+
+class FakeMessage:
+    def __init__(self, message_id: int, author: FakeMember, channel: Optional["FakeTextChannel"], content: str,
+                 created_at: Optional[datetime] = None):
+        self.id = message_id
+        self.author = author
+        self.channel = channel
+        self.guild = channel.guild if channel else None
+        self.content = content
+        self.created_at = created_at or datetime.utcnow()
+        self.attachments = []
+        self.embeds = []
+        self.deleted = False
+
+    async def edit(self, **kwargs):
+        await _api_call()
+
+    async def delete(self, **kwargs):
+        await _api_call()
+        self.deleted = True
+        if self.channel:
+            self.channel.remove(self)
+
+
+class FakeHistory:
+    """
+    Async iterator over the history of a channel, newest first unless `oldest_first` is set.
+    """
+
+    def __init__(self, messages: List[FakeMessage], limit: Optional[int], before=None, after=None,
+                 oldest_first: bool = False):
+        if before is not None:
+            messages = [m for m in messages if m.id < getattr(before, "id", before)]
+        if after is not None:
+            messages = [m for m in messages if m.id > getattr(after, "id", after)]
+
+        messages = messages if oldest_first else messages[::-1]
+        self.__messages = iter(messages[:limit] if limit is not None else messages)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self.__messages)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class FakeTextChannel(GuildChannel):
+    def __init__(self, channel_id: int, guild: "FakeGuild", category_id: Optional[int] = None):
+        # `mention` and `category` are provided by `GuildChannel`.
+        self.id = channel_id
+        self.guild = guild
+        self.name = f"channel{channel_id}"
+        self.category_id = category_id
+        self.messages: List[FakeMessage] = []
+        self.sent = 0
+        # The ids of the members who may not manage the messages of this channel.
+        self.denied: Set[int] = set()
+
+    def permissions_for(self, member: FakeMember) -> Permissions:
+        return Permissions.none() if member.id in self.denied else Permissions.all()
+
+    def remove(self, message: FakeMessage):
+        self.messages.remove(message)
+
+    async def send(self, content=None, **kwargs):
+        await _api_call()
+        self.sent += 1
+        message = FakeMessage(self.guild.next_id(), self.guild.me, self, content or "")
+        self.messages.append(message)
+        return message
+
+    def history(self, limit: Optional[int] = 100, before=None, after=None, oldest_first=None):
+        return FakeHistory(self.messages, limit, before, after, bool(oldest_first))
+
+    async def delete_messages(self, messages):
+        await _api_call()
+        doomed = {m.id for m in messages}
+        self.messages = [m for m in self.messages if m.id not in doomed]
+
+    async def purge(self, limit: int = 100, check: Callable[[FakeMessage], bool] = None, **kwargs):
+        deleted = [m for m in self.messages[::-1][:limit] if check is None or check(m)]
+        for start in range(0, len(deleted), 100):
+            await self.delete_messages(deleted[start:start + 100])
+        return deleted
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int, reward_roles: int = 3):
+        self.id = guild_id
+        self.name = f"guild{guild_id}"
+        self.icon_url = ""
+        self.default_role = FakeRole(guild_id, "@everyone", 0)
+        self.roles = [self.default_role] + [FakeRole(guild_id * 100 + idx, f"reward{idx}", idx + 1)
+                                            for idx in range(1, reward_roles + 1)]
+        self.members: Dict[int, FakeMember] = {}
+        self.channels: Dict[int, FakeTextChannel] = {}
+        self.me = FakeMember(1, self, bot=True)
+        self.__ids = guild_id * 10_000_000
+
+    def next_id(self) -> int:
+        self.__ids += 1
+        return self.__ids
+
+    def get_member(self, user_id: int) -> Optional[FakeMember]:
+        return self.members.get(user_id)
+
+    def get_channel(self, channel_id: int) -> Optional[FakeTextChannel]:
+        return self.channels.get(channel_id)
+
+    def get_role(self, role_id: int) -> Optional[FakeRole]:
+        return next((role for role in self.roles if role.id == role_id), None)
+
+    @property
+    def text_channels(self) -> List[FakeTextChannel]:
+        return list(self.channels.values())
+
+
+class FakeContext:
+    def __init__(self, author: FakeMember, channel: FakeTextChannel):
+        self.author = author
+        self.channel = channel
+        self.guild = channel.guild
+        self.message = FakeMessage(channel.guild.next_id(), author, channel, "")
+        self.bot = None
+        self.command = None
+
+    async def send(self, content=None, **kwargs):
+        return await self.channel.send(content, **kwargs)
+
+    async def send_help(self, *args):
+        pass
+
+
+class QuietPrintHandler:
+    def info(self, *args):
+        pass
+
+    def warn(self, *args):
+        pass
+
+    def error(self, *args):
+        pass
+
+    def fatal(self, *args):
+        print(*args, file=sys.stderr)
+
+
+class FakeBot:
+    def __init__(self, cfg: ConfigParser, guilds: List[FakeGuild]):
+        self.cfg = cfg
+        self.ph = QuietPrintHandler()
+        self.loop = asyncio.get_event_loop()
+        self.guilds = guilds
+        self.cogs = {}
+
+    def get_guild(self, guild_id: int) -> Optional[FakeGuild]:
+        return next((guild for guild in self.guilds if guild.id == guild_id), None)
+
+    def get_channel(self, channel_id: int) -> Optional[FakeTextChannel]:
+        return next((guild.channels[channel_id] for guild in self.guilds if channel_id in guild.channels), None)
+
+    def add_cog(self, cog):
+        self.cogs[type(cog).__name__] = cog
+
+    def get_cog(self, name: str):
+        return self.cogs.get(name)
+
+
+def _install_bot_modules(cfg: ConfigParser, guilds: List[FakeGuild]):
+    """
+    Provide the modules which the extensions import from the bot they are installed in.
+    """
+
+    def module(name: str, **attrs):
+        mod = types.ModuleType(name)
+        mod.__dict__.update(attrs)
+        sys.modules[name] = mod
+
+        parent, _, child = name.rpartition(".")
+        if parent:
+            setattr(sys.modules[parent], child, mod)
+        return mod
+
+    footer = {"text": "Role Notifier", "icon": "{guild.icon_url}", "timestamp": True}
+    module("config")
+    module("config.exp_roles", exp_roles={guild.id: {5 * idx: role.id for idx, role in enumerate(guild.roles[1:], 1)}
+                                          for guild in guilds})
+    module("config.lang",
+           exp_system={
+               "fetching": "Fetching data...",
+               "title": "{user} rank",
+               "message": "{user.mention} Level: {data.level} Exp: {data.exp}/{data.exp_next_level} "
+                          "Position {data.server_rank} of {data.server_total}",
+               "top_msg": "The requested amount can not be more than 25!",
+               "max_top": 25,
+               "top_title": "Top Users",
+               "top_line": "**{idx}**. <@!{user.id}>: {user.level} *({user.exp} exp)*",
+               "levelup_message": "Congratulations <@!{author.id}>, you just leveled up to level {lvl}! ",
+               "levelup_message_role": "And you have been awarded the {role.mention} role!"
+           },
+           purge_command={
+               "from": "from",
+               "started": "Started removing a maximum of {count} messages{ending}.",
+               "finished": "Removed {count} messages{ending}",
+               "finished_color": 0x00ff00
+           },
+           role_notifier={
+               "added": {"title": "Role received!", "content": "You have received {role.name} in {guild.name}!",
+                         "footer": footer, "color": {"random": False, "color": 0x00ff00}},
+               "removed": {"title": "Role removed!", "content": "{role.name} in {guild.name} has been removed!",
+                           "footer": footer, "color": {"random": False, "color": 0xff0000}}
+           })
+    module("utils", PrintHandler=QuietPrintHandler)
+    module("run", cfg=cfg)
+
+
+def _load_extension(relative: str, name: str):
+    spec = importlib.util.spec_from_file_location(name, path.join(ROOT, relative))
+    mod = importlib.util.module_from_spec(spec)
+    sys.modules[name] = mod
+    spec.loader.exec_module(mod)
+    return mod
+
+
+def _percentile(samples: List[float], percentile: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * percentile / 100), len(ordered) - 1)]
+
+
+async def _measure(calls: List[Callable[[], Awaitable[Any]]], concurrency: int = 1) -> Dict[str, float]:
+    """
+    Run the calls with a certain concurrency and summarize their latencies.
+    """
+    latencies: List[float] = []
+    pending = iter(calls)
+
+    async def worker():
+        for call in pending:
+            start = perf_counter()
+            await call()
+            latencies.append(perf_counter() - start)
+
+    start = perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = perf_counter() - start
+
+    return {
+        "ops": len(latencies),
+        "seconds": round(elapsed, 4),
+        "throughput": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(_percentile(latencies, 50) * 1000, 4),
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 4),
+    }
+
+
+async def bench_exp_messages(exp_system, guilds: List[FakeGuild], messages: int) -> Dict[str, float]:
+    members = [member for guild in guilds for member in guild.members.values()]
+    calls = []
+    for _ in range(messages):
+        member = random.choice(members)
+        channel = random.choice(member.guild.text_channels)
+        message = FakeMessage(member.guild.next_id(), member, channel, " ".join(random.choices(WORDS, k=6)))
+        calls.append(lambda msg=message: exp_system.on_message(msg))
+
+    result = await _measure(calls)
+    # Include the time it takes to persist what was buffered.
+    start = perf_counter()
+    await exp_system.db.flush()
+    result["flush_seconds"] = round(perf_counter() - start, 4)
+    return result
+
+
+async def bench_exp_queries(exp_system, guilds: List[FakeGuild], queries: int, concurrency: int) -> Dict[str, float]:
+    calls = []
+    for idx in range(queries):
+        guild = random.choice(guilds)
+        author = random.choice(list(guild.members.values()))
+        ctx = FakeContext(author, random.choice(guild.text_channels))
+        if idx % 2:
+            calls.append(lambda c=ctx: exp_system.rank.callback(exp_system, c, None))
+        else:
+            calls.append(lambda c=ctx: exp_system.top.callback(exp_system, c, 10))
+
+    return await _measure(calls, concurrency)
+
+
+async def bench_role_updates(role_notifier, guilds: List[FakeGuild], updates: int) -> Dict[str, float]:
+    members = [member for guild in guilds for member in guild.members.values()]
+    calls = []
+    for _ in range(updates):
+        before = random.choice(members)
+        after = before.copy()
+        after.roles.append(random.choice(before.guild.roles[1:]))
+        calls.append(lambda b=before, a=after: role_notifier.on_member_update(b, a))
+
+    return await _measure(calls)
+
+
+async def bench_purge(purge_command, guilds: List[FakeGuild], history: int, runs: int) -> Dict[str, float]:
+    guild = guilds[0]
+    moderator = FakeMember(2, guild, [guild.roles[1]])
+    channel = FakeTextChannel(guild.next_id(), guild)
+    guild.channels[channel.id] = channel
+    members = list(guild.members.values())
+
+    now = datetime.utcnow()
+    for idx in range(history):
+        author = random.choice(members)
+        channel.messages.append(FakeMessage(guild.next_id(), author, channel, random.choice(WORDS),
+                                            now - timedelta(seconds=history - idx)))
+
+    async def purge(ctx: FakeContext, authors: List[FakeMember]):
+        await purge_command.purge.callback(purge_command, ctx, 100, authors=authors)
+        # The purge runs in the background.
+        await purge_command.scheduler.wait()
+
+    calls = []
+    for _ in range(runs):
+        ctx = FakeContext(moderator, channel)
+        authors = random.sample(members, 2)
+        calls.append(lambda c=ctx, a=authors: purge(c, a))
+
+    return await _measure(calls)
+
+
+async def run(args) -> Dict[str, Any]:
+    global API_LATENCY
+    API_LATENCY = args.api_latency / 1000
+    random.seed(args.seed)
+
+    guilds = []
+    for guild_id in range(1, args.guilds + 1):
+        guild = FakeGuild(guild_id)
+        for channel_id in range(guild_id * 1000, guild_id * 1000 + 5):
+            guild.channels[channel_id] = FakeTextChannel(channel_id, guild)
+        for user_id in range(guild_id * 1_000_000, guild_id * 1_000_000 + args.users):
+            guild.members[user_id] = FakeMember(user_id, guild)
+        guilds.append(guild)
+
+    cfg = ConfigParser()
+    cfg.read_dict({
+        "LEVELING": {"notifications_channels": ", ".join(f"{g.id}:{g.id * 1000}" for g in guilds),
+                     "storage": args.storage},
+        "MODERATION": {"purge": guilds[0].roles[1].name},
+        "ROLE_NOTIFIER": {"enabled": "true", "specific": "false"},
+    })
+    _install_bot_modules(cfg, guilds)
+
+    exp_module = _load_extension("exp-system/ExpSystem.py", "ExpSystem")
+    purge_module = _load_extension("purge-command/PurgeCommand.py", "PurgeCommand")
+    notifier_module = _load_extension("role-notifier/RoleNotifier.py", "RoleNotifier")
+
+    bot = FakeBot(cfg, guilds)
+    exp_system = exp_module.ExpSystem(bot)
+    await exp_system.on_ready()
+    role_notifier = notifier_module.RoleNotifier(bot)
+
+    results = {
+        "exp_on_message": await bench_exp_messages(exp_system, guilds, args.messages),
+        "exp_rank_top": await bench_exp_queries(exp_system, guilds, args.queries, args.concurrency),
+        "role_notifier_updates": await bench_role_updates(role_notifier, guilds, args.updates),
+        "purge": await bench_purge(purge_module.PurgeCommand(bot), guilds, args.history, args.purges),
+    }
+
+    exp_system.cog_unload()
+    role_notifier.cog_unload()
+    await exp_system.db.close()
+    return results
+
+
+def _version() -> str:
+    try:
+        return subprocess.check_output(["git", "describe", "--always", "--dirty"], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = ArgumentParser(description="Offline load test for the bot extensions.")
+    parser.add_argument("--output", default="bench_output.json", help="The JSON file the results are written to.")
+    parser.add_argument("--guilds", type=int, default=3)
+    parser.add_argument("--users", type=int, default=2000, help="The amount of members per guild.")
+    parser.add_argument("--messages", type=int, default=20_000, help="The amount of messages sent to on_message.")
+    parser.add_argument("--queries", type=int, default=2000, help="The amount of rank and top invocations.")
+    parser.add_argument("--concurrency", type=int, default=50, help="The amount of concurrent rank/top invocations.")
+    parser.add_argument("--updates", type=int, default=5000, help="The amount of role updates.")
+    parser.add_argument("--history", type=int, default=20_000, help="The amount of messages in the purged channel.")
+    parser.add_argument("--purges", type=int, default=20, help="The amount of purge invocations.")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="Simulated discord API latency in ms.")
+    parser.add_argument("--storage", choices=("sqlite", "journal", "memory"), default="sqlite",
+                        help="The storage backend of the exp system.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    output = path.abspath(args.output)
+    cwd = getcwd()
+
+    with TemporaryDirectory() as tmp:
+        # The exp system creates its database relative to the working directory.
+        chdir(tmp)
+        try:
+            results = asyncio.get_event_loop().run_until_complete(run(args))
+        finally:
+            chdir(cwd)
+
+    report = {
+        "version": _version(),
+        "python": platform.python_version(),
+        "created": datetime.utcnow().isoformat(),
+        "parameters": vars(args),
+        "results": results,
+    }
+
+    with open(output, "w") as file:
+        json.dump(report, file, indent=2)
+
+    for name, result in results.items():
+        print(f"{name:<24} {result['throughput']:>12} ops/s  p50 {result['p50_ms']:>9} ms  p99 {result['p99_ms']:>9} ms")
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -23,28 +23,55 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 import random
-from asyncio import sleep
+from abc import ABC, abstractmethod
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict
+from argparse import ArgumentParser
+from asyncio import run, sleep, Lock, Queue, Event, Task, Future, TimeoutError, CancelledError, IncompleteReadError, \
+    StreamReader, StreamWriter, ensure_future, gather, wait_for, get_event_loop, start_unix_server, open_unix_connection
+from contextlib import asynccontextmanager, contextmanager
+from csv import DictReader, writer as csv_writer
+from importlib import reload
+from itertools import islice
+from json import loads, dumps
 from dataclasses import dataclass
-from math import sqrt
-from os import path, mkdir
-from os.path import isfile
-from typing import Callable, Awaitable, Any, List
+from datetime import datetime
+from distutils.util import strtobool
+from fractions import Fraction
+from math import ceil, inf
+from os import path, mkdir, makedirs, remove, replace, fsync
+from signal import SIGINT, SIGTERM
+from struct import Struct
+from sys import stderr
+from time import monotonic, perf_counter, time
+from typing import Callable, Awaitable, Any, List, Optional, AsyncIterator, Dict, Tuple, Iterable, Iterator, TextIO
 
 from aiosqlite import Connection, connect, Row
-from discord import Message, Member, Guild, Role
+from discord import File, Message, Member, Role, TextChannel, HTTPException, Forbidden, NotFound
 from discord.ext import commands
 from discord.ext.commands import Context
 from discord.utils import get
 from humanize import intword
 from utilsx.discord import Cog
 
-from config.exp_roles import exp_roles
+import config.exp_roles
 from config.lang import exp_system
 from utils import PrintHandler
 
+# Exp is tracked per guild, members are identified by a `(guild_id, user_id)` pair.
+_MemberKey = Tuple[int, int]
+# The maximum amount of members which is fetched at once while walking to a leaderboard page.
+_PAGE_WALK_SIZE = 1000
+
+# The current unix time in SQL, stored in the `last_active` column.
+_SQL_NOW = "CAST(strftime('%s', 'now') AS INTEGER)"
+
 
 @dataclass
 class _BaseUser:
+    # Large caches hold many of these, so they don't get a `__dict__`.
+    __slots__ = ("id", "exp", "exp_next_level", "level", "left")
+
     # The if of the user.
     id: int
     # The exp the user currently has.
@@ -57,166 +84,3065 @@ class _BaseUser:
     left: str
 
 
-@dataclass
-class _User(_BaseUser):
-    # The user their current rank compared to the server.
-    server_rank: int
-    # The total amount of users whom is registered in the database.
-    server_total: int
+@dataclass
+class _User(_BaseUser):
+    __slots__ = ("server_rank", "server_total")
+
+    # The user their current rank compared to the server.
+    server_rank: int
+    # The total amount of users whom is registered in the database.
+    server_total: int
+
+
+class _LevelCurve:
+    """
+    Maps exp to levels through a precomputed table of integer thresholds.
+
+    `thresholds[level]` is the minimum exp of a level, so resolving a level is a binary search and there is no float
+    rounding at the level boundaries. Supported curves are:
+        quadratic: `factor * (level + 1) ** 2`, the default `factor` of 2.25 is the original `sqrt(exp) / 1.5 - 1`.
+        linear: `step * level`.
+        custom: An explicit ascending list of thresholds starting at level 0, the last one is the highest level.
+    """
+
+    def __init__(self, curve: str = "quadratic", max_level: int = 10_000, factor: str = "2.25", step: int = 100,
+                 table: Optional[List[int]] = None):
+        """
+        @param curve: The name of the curve.
+        @param max_level: The highest level which can be reached.
+        @param factor: The factor of the quadratic curve, a string so it can be used as an exact fraction.
+        @param step: The amount of exp per level of the linear curve.
+        @param table: The thresholds of the custom curve.
+        """
+        if curve == "quadratic":
+            factor = Fraction(factor)
+            self.__formula = lambda level: ceil(factor * (level + 1) ** 2) if level > 0 else 0
+        elif curve == "linear":
+            self.__formula = lambda level: step * level
+        elif curve == "custom":
+            if not table or table[0] != 0 or table != sorted(table):
+                raise ValueError("A custom level curve requires an ascending table of thresholds, starting at 0.")
+            self.__formula = None
+        else:
+            raise ValueError(f"Unknown level curve `{curve}`.")
+
+        if self.__formula is None:
+            self.thresholds = list(table[:max_level + 1])
+        else:
+            self.thresholds = [self.__formula(level) for level in range(max_level + 1)]
+
+    @property
+    def max_level(self) -> int:
+        return len(self.thresholds) - 1
+
+    def level(self, exp: int, lo: int = 0) -> int:
+        """
+        The level which belongs to an amount of exp.
+
+        @param exp: The exp to be linked.
+        @param lo: A level which is known to be reached, this narrows the search.
+        """
+        return bisect_right(self.thresholds, exp, lo) - 1
+
+    def threshold(self, level: int) -> int:
+        """
+        The exp which is required for a level, levels past the max level continue the curve.
+        """
+        if level <= self.max_level:
+            return self.thresholds[level]
+
+        return self.__formula(level) if self.__formula else self.thresholds[-1]
+
+    def transitions(self, changes: Iterable[Tuple[int, int]]) -> List[Tuple[int, int]]:
+        """
+        Resolve the level before and after a batch of exp changes.
+
+        @param changes: `(old_exp, new_exp)` pairs.
+
+        @return: `(old_level, new_level)` pairs in the same order.
+        """
+        result = []
+        for old, new in changes:
+            before = self.level(old)
+            # Exp usually grows, so the old level bounds the search of the new one.
+            result.append((before, self.level(new, before + 1 if new >= old else 0)))
+        return result
+
+
+class _ConnectionManager:
+    """
+    Owns the long-lived sqlite connections of the exp system.
+
+    There is one writer connection, which is guarded by a lock so transactions never interleave, and an optional pool
+    of read-only connections. The database runs in WAL mode, so readers never have to wait behind the writer.
+    """
+
+    def __init__(self, logging: PrintHandler, file: str = "db/exp_system.db", read_pool_size: int = 2,
+                 cache_size: int = 8192, cached_statements: int = 128):
+        """
+        @param logging: The print handler of the bot.
+        @param file: The path of the database file.
+        @param read_pool_size: The amount of read-only connections, 0 makes reads go through the writer.
+        @param cache_size: The page cache size per connection in KiB.
+        @param cached_statements: The amount of prepared statements which are cached per connection.
+        """
+        self.log = logging
+        self.file = file
+        self.read_pool_size = max(read_pool_size, 0)
+        self.cache_size = cache_size
+        self.cached_statements = cached_statements
+
+        self.__writer: Optional[Connection] = None
+        self.__readers: List[Connection] = []
+        self.__idle_readers: Optional[Queue] = None
+        self.__open_lock = Lock()
+        self.__write_lock = Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self.__writer is not None
+
+    def __check_db_dir(self):
+        """
+        Check whether the db folder exists or not, if it doesn't it creates one.
+        """
+        directory = path.dirname(self.file)
+
+        if directory and not path.isdir(directory):
+            self.log.info(f"[DB] No existing `{directory}` directory found, creating new one...")
+            mkdir(directory, 0o777)
+            self.log.info(f"[DB] Successfully created new `{directory}` directory.")
+
+    async def __connect(self) -> Connection:
+        """
+        Open and configure a new connection to the database file.
+        """
+        conn = await connect(self.file, cached_statements=self.cached_statements)
+        conn.row_factory = Row
+        await conn.execute("PRAGMA journal_mode = WAL;")
+        await conn.execute("PRAGMA synchronous = NORMAL;")
+        await conn.execute(f"PRAGMA cache_size = -{self.cache_size};")
+        await conn.execute("PRAGMA temp_store = MEMORY;")
+        return conn
+
+    async def open(self, init: Callable[[Connection], Awaitable[None]]) -> None:
+        """
+        Open the writer and the read pool, this does nothing if they are already open.
+
+        @param init: Callback which prepares the schema, it is invoked on the writer before any reader is opened.
+        """
+        async with self.__open_lock:
+            if self.is_open:
+                return
+
+            self.__check_db_dir()
+            writer = await self.__connect()
+            await init(writer)
+
+            self.__idle_readers = Queue()
+            for _ in range(self.read_pool_size):
+                reader = await self.__connect()
+                await reader.execute("PRAGMA query_only = ON;")
+                self.__readers.append(reader)
+                self.__idle_readers.put_nowait(reader)
+
+            self.__writer = writer
+            self.log.info(f"[DB] Opened `{self.file}` with {self.read_pool_size} read connection(s).")
+
+    async def close(self) -> None:
+        """
+        Close all connections, pending writes are waited for.
+        """
+        async with self.__open_lock:
+            if not self.is_open:
+                return
+
+            async with self.__write_lock:
+                for reader in self.__readers:
+                    await reader.close()
+                await self.__writer.close()
+
+            self.__readers.clear()
+            self.__idle_readers = None
+            self.__writer = None
+            self.log.info(f"[DB] Closed `{self.file}`.")
+
+    @asynccontextmanager
+    async def writer(self) -> AsyncIterator[Connection]:
+        """
+        Exclusive access to the writer connection.
+        """
+        async with self.__write_lock:
+            yield self.__writer
+
+    @asynccontextmanager
+    async def reader(self) -> AsyncIterator[Connection]:
+        """
+        Borrow a connection from the read pool, or the writer if there is no pool.
+        """
+        if not self.__readers:
+            async with self.writer() as conn:
+                yield conn
+            return
+
+        pool = self.__idle_readers
+        conn = await pool.get()
+        try:
+            yield conn
+        finally:
+            pool.put_nowait(conn)
+
+    @asynccontextmanager
+    async def snapshot(self) -> AsyncIterator[Connection]:
+        """
+        A separate read only connection, so long reads never hold up the read pool or the writer.
+        """
+        conn = await self.__connect()
+        try:
+            await conn.execute("PRAGMA query_only = ON;")
+            yield conn
+        finally:
+            await conn.close()
+
+
+class _ExpStore(ABC):
+    """
+    The storage backend of the exp system, which holds the exp and the last activity of every member.
+
+    A store only has to keep the data, the buffering, indexes and caches are handled by `_DatabaseInteractions`. The
+    write methods are never invoked concurrently, reads may run while a write is in progress.
+    """
+
+    # The file in which the data is kept, imports and exports are stored next to it. Empty if nothing is on disk.
+    file: Optional[str] = None
+
+    @property
+    @abstractmethod
+    def is_open(self) -> bool:
+        """
+        Whether or not the store has been opened and not closed since.
+        """
+
+    @abstractmethod
+    async def open(self) -> None:
+        """
+        Open the store and create or recover its data, this does nothing if it is already open.
+        """
+
+    @abstractmethod
+    async def close(self) -> None:
+        """
+        Persist everything and close the store.
+        """
+
+    @abstractmethod
+    async def increment(self, increments: List[Tuple[_MemberKey, int]]) -> None:
+        """
+        Add exp to members in one atomic write, the members become active.
+
+        @param increments: The `(member, experience)` pairs.
+        """
+
+    @abstractmethod
+    async def get(self, guild_id: int, user_id: int) -> int:
+        """
+        The exp of a member, 0 if the member is unknown.
+        """
+
+    @abstractmethod
+    async def rank(self, guild_id: int, exp: int) -> Tuple[int, int]:
+        """
+        The position which an amount of exp has in a guild.
+
+        @return: The position, and the amount of ranked members of the guild.
+        """
+
+    @abstractmethod
+    async def top(self, guild_id: int, limit: int, after: Optional[Tuple[int, int]] = None) -> List[Tuple[int, int]]:
+        """
+        The `(exp, user_id)` keys of the ranked members of a guild, from high to low.
+
+        @param limit: The maximum amount of keys.
+        @param after: Only return the keys which are lower than this key.
+        """
+
+    @abstractmethod
+    def ranked(self, guild_id: Optional[int] = None) -> AsyncIterator[Tuple[int, List[Tuple[int, int]]]]:
+        """
+        The `(exp, user_id)` keys of all ranked members of a guild, or of every guild, from high to low.
+
+        @return: `(guild_id, keys)` pairs, guilds without ranked members are left out.
+        """
+
+    @abstractmethod
+    async def read_chunk(self, guild_id: int, after: int, limit: int) -> List[Tuple[int, int]]:
+        """
+        The `(user_id, exp)` pairs of a guild which follow a user identifier, ordered by user identifier.
+        """
+
+    @abstractmethod
+    def export(self, guild_id: Optional[int] = None,
+               chunk_size: int = 1000) -> AsyncIterator[List[Tuple[int, int, int]]]:
+        """
+        A consistent snapshot of the `(guild_id, user_id, exp)` rows of a guild, or of every guild, in chunks.
+        """
+
+    @abstractmethod
+    async def load(self, rows: List[Tuple[int, int, int]], replace: bool = False) -> None:
+        """
+        Write `(guild_id, user_id, exp)` rows in one atomic write, this doesn't change the activity of members.
+
+        @param replace: Whether the exp of existing members gets overwritten instead of added to.
+        """
+
+    @abstractmethod
+    async def last_rowid(self) -> int:
+        """
+        The highest row identifier, members keep their row identifier and new members get a higher one.
+        """
+
+    @abstractmethod
+    async def rewrite(self, first: int, last: int, factor: float, inactive_since: Optional[int] = None,
+                      guild_id: Optional[int] = None, season: Optional[str] = None) -> List[Tuple[int, int, int, int]]:
+        """
+        Multiply the exp of the ranked members within a row identifier range in one atomic write.
+
+        @param first: The first row identifier.
+        @param last: The last row identifier.
+        @param factor: The new exp is `exp * factor`, rounded down.
+        @param inactive_since: Only change the members which weren't active since this unix time.
+        @param guild_id: Only change the members of this guild, every guild if left empty.
+        @param season: Archive the exp of the changed members under this season first.
+
+        @return: The `(guild_id, user_id, old exp, new exp)` rows of the changed members.
+        """
+
+
+class _SQLiteStore(_ExpStore):
+    """
+    Keeps the exp in an sqlite database, every write is a transaction.
+    """
+
+    def __init__(self, logging: PrintHandler, legacy_guild: Optional[int] = None, **connection_options):
+        """
+        @param logging: The print handler of the bot.
+        @param legacy_guild: The guild to which the data of the old single guild layout belongs.
+        @param connection_options: Forwarded to the connection manager.
+        """
+        self.log = logging
+        self.legacy_guild = legacy_guild
+        self.connections = _ConnectionManager(logging, **connection_options)
+
+    @property
+    def file(self) -> str:
+        return self.connections.file
+
+    @property
+    def is_open(self) -> bool:
+        return self.connections.is_open
+
+    async def open(self) -> None:
+        await self.connections.open(self.__create_db)
+
+    async def close(self) -> None:
+        await self.connections.close()
+
+    async def __create_db(self, conn: Connection):
+        """
+        Initialize the database schema and migrate the single guild layout.
+        """
+        curr = await conn.execute("PRAGMA table_info(users);")
+        columns = [row[1] for row in await curr.fetchall()]
+        if columns and "guild_id" not in columns:
+            self.log.info("[DB] Found a single guild `users` table, moving it to `users_v1`...")
+            await conn.execute("DROP INDEX IF EXISTS users_exp;")
+            await conn.execute("ALTER TABLE users RENAME TO users_v1;")
+
+        await conn.execute("CREATE TABLE IF NOT EXISTS users ("
+                           "    guild_id INTEGER NOT NULL,"
+                           "    id INTEGER NOT NULL,"
+                           "    exp INTEGER NOT NULL,"
+                           "    last_active INTEGER NOT NULL DEFAULT 0,"
+                           "    PRIMARY KEY (guild_id, id)"
+                           ");")
+        await conn.execute("CREATE TABLE IF NOT EXISTS seasons ("
+                           "    season TEXT NOT NULL,"
+                           "    guild_id INTEGER NOT NULL,"
+                           "    id INTEGER NOT NULL,"
+                           "    exp INTEGER NOT NULL,"
+                           "    PRIMARY KEY (season, guild_id, id)"
+                           ");")
+
+        curr = await conn.execute("PRAGMA table_info(users);")
+        if "last_active" not in [row[1] for row in await curr.fetchall()]:
+            self.log.info("[DB] Adding the `last_active` column to `users`...")
+            await conn.execute("ALTER TABLE users ADD COLUMN last_active INTEGER NOT NULL DEFAULT 0;")
+        # Covers the rank, top and total queries of a single guild.
+        await conn.execute("CREATE INDEX IF NOT EXISTS users_guild_exp ON users (guild_id, exp, id);")
+
+        curr = await conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'users_v1';")
+        if await curr.fetchone():
+            if self.legacy_guild is None:
+                self.log.warn("[DB] The single guild data in `users_v1` can't be migrated because "
+                              "`notifications_guild` is not configured.")
+            else:
+                await conn.execute("INSERT OR IGNORE INTO users (guild_id, id, exp) SELECT ?, id, exp FROM users_v1;",
+                                   (self.legacy_guild,))
+                await conn.execute("DROP TABLE users_v1;")
+                self.log.info(f"[DB] Migrated the single guild data to guild `{self.legacy_guild}`.")
+
+        # Existing members count as active from the moment the column was added, this only matches rows once.
+        await conn.execute(f"UPDATE users SET last_active = {_SQL_NOW} WHERE last_active = 0;")
+        await conn.commit()
+
+    async def __execute_db(self, cb: Callable[[Connection], Awaitable[Any]], write: bool = False) -> Any:
+        """
+        Execute something through a callback.
+
+        @param cb: Callback which will be invoked in the db.
+        @param write: Whether or not the callback modifies the database, writes run on the single writer connection.
+
+        @return: The result of the callback.
+        """
+        async with (self.connections.writer() if write else self.connections.reader()) as db:
+            return await cb(db)
+
+    async def __write(self, stmt: str, rows: List[tuple]) -> None:
+        """
+        Execute a statement for every row in a single transaction.
+        """
+
+        async def helper(conn: Connection):
+            try:
+                await conn.executemany(stmt, rows)
+                await conn.commit()
+            except Exception:
+                await conn.rollback()
+                raise
+
+        await self.__execute_db(helper, True)
+
+    async def increment(self, increments: List[Tuple[_MemberKey, int]]) -> None:
+        await self.__write("INSERT INTO users (guild_id, id, exp, last_active) "
+                           f"VALUES (?, ?, ?, {_SQL_NOW}) ON CONFLICT (guild_id, id) "
+                           "DO UPDATE SET exp = exp + excluded.exp, last_active = excluded.last_active;",
+                           [(guild_id, user_id, exp) for (guild_id, user_id), exp in increments])
+
+    async def get(self, guild_id: int, user_id: int) -> int:
+        async def helper(conn: Connection):
+            curr = await conn.execute("SELECT exp FROM users WHERE guild_id = ? AND id = ?", (guild_id, user_id))
+            res = await curr.fetchone()
+            return tuple(res)[0] if res else 0
+
+        return await self.__execute_db(helper)
+
+    async def rank(self, guild_id: int, exp: int) -> Tuple[int, int]:
+        async def helper(conn: Connection):
+            # Fetch the position compared to all registered users of the guild.
+            curr = await conn.execute("SELECT COUNT(*) FROM users WHERE guild_id = ? AND exp > ?;", (guild_id, exp))
+            _pos = (await curr.fetchone())[0] + 1
+
+            curr = await conn.execute("SELECT COUNT(*) FROM users WHERE guild_id = ? AND exp > 0;", (guild_id,))
+            _total_pos = (await curr.fetchone())[0]
+
+            return _pos, _total_pos
+
+        return await self.__execute_db(helper)
+
+    async def top(self, guild_id: int, limit: int, after: Optional[Tuple[int, int]] = None) -> List[Tuple[int, int]]:
+        async def helper(conn: Connection):
+            if after is None:
+                curr = await conn.execute("SELECT exp, id FROM users WHERE guild_id = ? AND exp > 0 "
+                                          "ORDER BY exp DESC, id DESC LIMIT ?;", (guild_id, limit))
+            else:
+                curr = await conn.execute("SELECT exp, id FROM users WHERE guild_id = ? AND exp > 0 "
+                                          "AND (exp, id) < (?, ?) ORDER BY exp DESC, id DESC LIMIT ?;",
+                                          (guild_id, *after, limit))
+            return [tuple(row) for row in await curr.fetchall()]
+
+        return await self.__execute_db(helper)
+
+    async def ranked(self, guild_id: Optional[int] = None) -> AsyncIterator[Tuple[int, List[Tuple[int, int]]]]:
+        if guild_id is None:
+            query, params = "SELECT guild_id, exp, id FROM users WHERE exp > 0 " \
+                            "ORDER BY guild_id DESC, exp DESC, id DESC;", ()
+        else:
+            query, params = "SELECT guild_id, exp, id FROM users WHERE guild_id = ? AND exp > 0 " \
+                            "ORDER BY exp DESC, id DESC;", (guild_id,)
+
+        async with self.connections.reader() as conn:
+            guild, keys = None, []
+            async with conn.execute(query, params) as curr:
+                async for row in curr:
+                    if row[0] != guild:
+                        if guild is not None:
+                            yield guild, keys
+                        guild, keys = row[0], []
+                    keys.append((row[1], row[2]))
+
+            if guild is not None:
+                yield guild, keys
+
+    async def read_chunk(self, guild_id: int, after: int, limit: int) -> List[Tuple[int, int]]:
+        async def helper(conn: Connection):
+            curr = await conn.execute("SELECT id, exp FROM users WHERE guild_id = ? AND id > ? ORDER BY id LIMIT ?;",
+                                      (guild_id, after, limit))
+            return [tuple(row) for row in await curr.fetchall()]
+
+        return await self.__execute_db(helper)
+
+    async def export(self, guild_id: Optional[int] = None,
+                     chunk_size: int = 1000) -> AsyncIterator[List[Tuple[int, int, int]]]:
+        if guild_id is None:
+            query, params = "SELECT guild_id, id, exp FROM users ORDER BY guild_id, id;", ()
+        else:
+            query, params = "SELECT guild_id, id, exp FROM users WHERE guild_id = ? ORDER BY id;", (guild_id,)
+
+        # A cursor on a separate connection, so the export never holds up the other queries.
+        async with self.connections.snapshot() as conn:
+            async with conn.execute(query, params) as curr:
+                while True:
+                    rows = await curr.fetchmany(chunk_size)
+                    if not rows:
+                        return
+                    yield [tuple(row) for row in rows]
+
+    async def load(self, rows: List[Tuple[int, int, int]], replace: bool = False) -> None:
+        await self.__write(f"INSERT INTO users (guild_id, id, exp, last_active) VALUES (?, ?, ?, {_SQL_NOW}) "
+                           "ON CONFLICT (guild_id, id) DO UPDATE " +
+                           ("SET exp = excluded.exp;" if replace else "SET exp = exp + excluded.exp;"), rows)
+
+    async def last_rowid(self) -> int:
+        async def helper(conn: Connection):
+            curr = await conn.execute("SELECT MAX(rowid) FROM users;")
+            return (await curr.fetchone())[0] or 0
+
+        return await self.__execute_db(helper)
+
+    async def rewrite(self, first: int, last: int, factor: float, inactive_since: Optional[int] = None,
+                      guild_id: Optional[int] = None, season: Optional[str] = None) -> List[Tuple[int, int, int, int]]:
+        where, params = "rowid BETWEEN ? AND ? AND exp > 0", (first, last)
+        if inactive_since is not None:
+            where, params = where + " AND last_active < ?", (*params, inactive_since)
+        if guild_id is not None:
+            where, params = where + " AND guild_id = ?", (*params, guild_id)
+        new_exp = "CAST(exp * ? AS INTEGER)"
+
+        async def helper(conn: Connection):
+            curr = await conn.execute(f"SELECT guild_id, id, exp, {new_exp} FROM users WHERE {where};",
+                                      (factor, *params))
+            rows = [tuple(row) for row in await curr.fetchall()]
+            if not rows:
+                return rows
+
+            try:
+                if season is not None:
+                    await conn.execute("INSERT OR REPLACE INTO seasons (season, guild_id, id, exp) SELECT ?, "
+                                       f"guild_id, id, exp FROM users WHERE {where};", (season, *params))
+                await conn.execute(f"UPDATE users SET exp = {new_exp} WHERE {where};", (factor, *params))
+                await conn.commit()
+            except Exception:
+                await conn.rollback()
+                raise
+            return rows
+
+        return await self.__execute_db(helper, True)
+
+
+class _MemoryStore(_ExpStore):
+    """
+    Keeps the exp in memory only, for tests and benchmarks. The data is lost when the process exits.
+
+    Every write is applied without awaiting anything, so writes are atomic to the readers.
+    """
+
+    def __init__(self, logging: PrintHandler):
+        """
+        @param logging: The print handler of the bot.
+        """
+        self.log = logging
+        # Maps every member to its `[exp, last_active]`.
+        self.users: Dict[_MemberKey, List[int]] = {}
+        # The `(exp, user_id)` keys of every member of a guild, sorted from low to high.
+        self.guilds: Dict[int, _SortedList] = {}
+        # The user ids of every member of a guild, sorted from low to high, for the chunked reads.
+        self.members: Dict[int, _SortedList] = {}
+        # The members in the order they were created in, the row identifier is the index + 1.
+        self.rows: List[_MemberKey] = []
+        # Maps `(season, guild_id, user_id)` to the archived exp.
+        self.seasons: Dict[Tuple[str, int, int], int] = {}
+        self._open = False
+
+    @property
+    def is_open(self) -> bool:
+        return self._open
+
+    async def open(self) -> None:
+        self._open = True
+
+    async def close(self) -> None:
+        self._open = False
+
+    def _set(self, member: _MemberKey, exp: int, now: int, active: bool = True) -> int:
+        """
+        Change the exp of a member, and create the member if it is unknown.
+
+        @param now: The unix time of the change.
+        @param active: Whether or not the member becomes active, new members always are.
+
+        @return: The previous exp.
+        """
+        guild_id, user_id = member
+        keys = self.guilds.get(guild_id)
+        if keys is None:
+            keys = self.guilds[guild_id] = _SortedList()
+        record = self.users.get(member)
+        if record is None:
+            self.users[member] = [exp, now]
+            self.rows.append(member)
+            keys.add((exp, user_id))
+            if guild_id not in self.members:
+                self.members[guild_id] = _SortedList()
+            self.members[guild_id].add(user_id)
+            return 0
+
+        previous = record[0]
+        if exp != previous:
+            keys.remove((previous, user_id))
+            keys.add((exp, user_id))
+            record[0] = exp
+        if active:
+            record[1] = now
+        return previous
+
+    def _increment(self, increments: List[Tuple[_MemberKey, int]], now: int) -> None:
+        for member, exp in increments:
+            record = self.users.get(member)
+            self._set(member, (record[0] if record else 0) + exp, now)
+
+    def _load(self, rows: List[Tuple[int, int, int]], replace: bool, now: int) -> None:
+        for guild_id, user_id, exp in rows:
+            record = self.users.get((guild_id, user_id))
+            self._set((guild_id, user_id), exp if replace or record is None else record[0] + exp, now, False)
+
+    def _rewrite(self, first: int, last: int, factor: float, inactive_since: Optional[int], guild_id: Optional[int],
+                 season: Optional[str]) -> List[Tuple[int, int, int, int]]:
+        changed = []
+        for member in self.rows[max(first, 1) - 1:max(last, 0)]:
+            exp, last_active = self.users[member]
+            if exp <= 0 or (guild_id is not None and member[0] != guild_id) \
+                    or (inactive_since is not None and last_active >= inactive_since):
+                continue
+
+            new = int(exp * factor)
+            if season is not None:
+                self.seasons[(season, *member)] = exp
+            self._set(member, new, last_active, False)
+            changed.append((*member, exp, new))
+        return changed
+
+    async def increment(self, increments: List[Tuple[_MemberKey, int]]) -> None:
+        self._increment(increments, int(time()))
+
+    async def get(self, guild_id: int, user_id: int) -> int:
+        record = self.users.get((guild_id, user_id))
+        return record[0] if record else 0
+
+    async def rank(self, guild_id: int, exp: int) -> Tuple[int, int]:
+        keys = self.guilds.get(guild_id) or _SortedList()
+        return len(keys) - keys.bisect_right((exp, inf)) + 1, len(keys) - keys.bisect_right((0, inf))
+
+    async def top(self, guild_id: int, limit: int, after: Optional[Tuple[int, int]] = None) -> List[Tuple[int, int]]:
+        keys = self.guilds.get(guild_id) or _SortedList()
+        end = len(keys) if after is None else keys.bisect_left(after)
+        start = max(keys.bisect_right((0, inf)), end - limit)
+        return keys.slice(start, end)[::-1]
+
+    async def ranked(self, guild_id: Optional[int] = None) -> AsyncIterator[Tuple[int, List[Tuple[int, int]]]]:
+        for guild in list(self.guilds) if guild_id is None else [guild_id]:
+            keys = self.guilds.get(guild) or _SortedList()
+            ranked = keys.slice(keys.bisect_right((0, inf)), len(keys))[::-1]
+            if ranked:
+                yield guild, ranked
+
+    async def read_chunk(self, guild_id: int, after: int, limit: int) -> List[Tuple[int, int]]:
+        members = self.members.get(guild_id) or _SortedList()
+        start = members.bisect_right(after)
+        return [(user_id, self.users[(guild_id, user_id)][0]) for user_id in members.slice(start, start + limit)]
+
+    async def export(self, guild_id: Optional[int] = None,
+                     chunk_size: int = 1000) -> AsyncIterator[List[Tuple[int, int, int]]]:
+        rows = sorted((*member, record[0]) for member, record in self.users.items()
+                      if guild_id is None or member[0] == guild_id)
+        for start in range(0, len(rows), chunk_size):
+            yield rows[start:start + chunk_size]
+
+    async def load(self, rows: List[Tuple[int, int, int]], replace: bool = False) -> None:
+        self._load(rows, replace, int(time()))
+
+    async def last_rowid(self) -> int:
+        return len(self.rows)
+
+    async def rewrite(self, first: int, last: int, factor: float, inactive_since: Optional[int] = None,
+                      guild_id: Optional[int] = None, season: Optional[str] = None) -> List[Tuple[int, int, int, int]]:
+        return self._rewrite(first, last, factor, inactive_since, guild_id, season)
+
+
+class _JournalStore(_MemoryStore):
+    """
+    Keeps the exp in memory and appends every write to a journal file, which is replayed on startup.
+
+    Every `snapshot_interval` writes the whole state is written to a snapshot file, after which the journal starts
+    over. The journal records are numbered and the snapshot remembers the last record it contains, so records which
+    are replayed twice after a crash between the two steps are skipped.
+    """
+
+    def __init__(self, logging: PrintHandler, file: str = "db/exp_system.journal", snapshot_interval: int = 10_000,
+                 sync: bool = False):
+        """
+        @param logging: The print handler of the bot.
+        @param file: The path of the journal, the snapshot is kept next to it.
+        @param snapshot_interval: The amount of journal records after which a snapshot is taken.
+        @param sync: Whether or not every write waits until the journal is on disk, instead of leaving it to the OS.
+        """
+        super().__init__(logging)
+        self.file = file
+        self.snapshot_file = f"{file}.snapshot"
+        self.snapshot_interval = snapshot_interval
+        self.sync = sync
+
+        self.__journal: Optional[TextIO] = None
+        self.__sequence = 0
+        self.__records = 0
+
+    async def open(self) -> None:
+        if self.is_open:
+            return
+
+        directory = path.dirname(self.file)
+        if directory:
+            makedirs(directory, exist_ok=True)
+
+        self.__recover()
+        self.__journal = open(self.file, "a", encoding="utf-8")
+        await super().open()
+
+    async def close(self) -> None:
+        if not self.is_open:
+            return
+
+        # The next startup doesn't have to replay anything.
+        if self.__records:
+            await self.__snapshot()
+        self.__journal.close()
+        self.__journal = None
+        await super().close()
+        self.log.info(f"[DB] Closed `{self.file}`.")
+
+    def __recover(self) -> None:
+        """
+        Load the snapshot and replay the journal records which aren't part of it.
+        """
+        self.__sequence, replayed = 0, 0
+
+        if path.exists(self.snapshot_file):
+            keys: Dict[int, List[Tuple[int, int]]] = {}
+            with open(self.snapshot_file, encoding="utf-8") as file:
+                self.__sequence = loads(file.readline())["sequence"]
+                for line in file:
+                    record = loads(line)
+                    if record[0] == "user":
+                        _, guild_id, user_id, exp, last_active = record
+                        self.users[(guild_id, user_id)] = [exp, last_active]
+                        self.rows.append((guild_id, user_id))
+                        keys.setdefault(guild_id, []).append((exp, user_id))
+                    else:
+                        _, season, guild_id, user_id, exp = record
+                        self.seasons[(season, guild_id, user_id)] = exp
+
+            # Sorting once is a lot faster than inserting every member on its own.
+            for guild_id, guild_keys in keys.items():
+                self.guilds[guild_id] = _SortedList()
+                self.guilds[guild_id].load(guild_keys)
+                self.members[guild_id] = _SortedList()
+                self.members[guild_id].load([user_id for _, user_id in guild_keys])
+
+        if path.exists(self.file):
+            with open(self.file, "rb+") as file:
+                valid = 0
+                for line in file:
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError
+                        record = loads(line)
+                    except ValueError:
+                        # The last record was only partially written before a crash.
+                        self.log.warn(f"[DB] Dropping a partially written record at the end of `{self.file}`.")
+                        break
+
+                    valid += len(line)
+                    if record[0] > self.__sequence:
+                        self.__apply(record)
+                        self.__sequence, replayed = record[0], replayed + 1
+                file.truncate(valid)
+
+        self.__records = replayed
+        self.log.info(f"[DB] Recovered {len(self.users)} member(s) from `{self.file}`, "
+                      f"replayed {replayed} journal record(s).")
+
+    def __apply(self, record: list) -> Any:
+        """
+        Apply a journal record to the in-memory state.
+        """
+        _, action, *args = record
+        if action == "increment":
+            increments, now = args
+            return self._increment([((guild_id, user_id), exp) for guild_id, user_id, exp in increments], now)
+        if action == "load":
+            rows, overwrite, now = args
+            return self._load(rows, overwrite, now)
+        return self._rewrite(*args)
+
+    async def __append(self, action: str, *args) -> Any:
+        """
+        Write a record to the journal, and apply it once it was written.
+
+        @return: The result of applying the record.
+        """
+        record = [self.__sequence + 1, action, *args]
+        self.__journal.write(dumps(record, separators=(",", ":")) + "\n")
+        self.__journal.flush()
+        if self.sync:
+            await get_event_loop().run_in_executor(None, fsync, self.__journal.fileno())
+
+        self.__sequence += 1
+        result = self.__apply(record)
+
+        self.__records += 1
+        if self.__records >= self.snapshot_interval:
+            await self.__snapshot()
+        return result
+
+    async def __snapshot(self) -> None:
+        """
+        Write the whole state to the snapshot file and start a new journal.
+
+        Writes are never invoked concurrently, so nothing can be appended to the journal while this runs.
+        """
+        lines = [dumps({"sequence": self.__sequence}) + "\n"]
+        lines.extend(dumps(["user", *member, *self.users[member]]) + "\n" for member in self.rows)
+        lines.extend(dumps(["season", *key, exp]) + "\n" for key, exp in self.seasons.items())
+
+        def write():
+            with open(f"{self.snapshot_file}.tmp", "w", encoding="utf-8") as file:
+                file.writelines(lines)
+                file.flush()
+                fsync(file.fileno())
+            replace(f"{self.snapshot_file}.tmp", self.snapshot_file)
+
+        await get_event_loop().run_in_executor(None, write)
+        self.__journal.truncate(0)
+        self.__records = 0
+
+    async def increment(self, increments: List[Tuple[_MemberKey, int]]) -> None:
+        await self.__append("increment", [(*member, exp) for member, exp in increments], int(time()))
+
+    async def load(self, rows: List[Tuple[int, int, int]], replace: bool = False) -> None:
+        await self.__append("load", rows, replace, int(time()))
+
+    async def rewrite(self, first: int, last: int, factor: float, inactive_since: Optional[int] = None,
+                      guild_id: Optional[int] = None, season: Optional[str] = None) -> List[Tuple[int, int, int, int]]:
+        return await self.__append("rewrite", first, last, factor, inactive_since, guild_id, season)
+
+
+# The storage backends which can be configured.
+_STORAGES = ("sqlite", "journal", "memory")
+
+
+def _create_store(logging: PrintHandler, storage: str = "sqlite", file: Optional[str] = None,
+                  legacy_guild: Optional[int] = None, snapshot_interval: int = 10_000, journal_sync: bool = False,
+                  **connection_options) -> _ExpStore:
+    """
+    Create a storage backend.
+
+    @param logging: The print handler of the bot.
+    @param storage: `sqlite`, `journal` or `memory`.
+    @param file: The file of the store, the default file of the backend if left empty.
+    @param legacy_guild: sqlite: the guild to which the data of the old single guild layout belongs.
+    @param snapshot_interval: journal: the amount of journal records after which a snapshot is taken.
+    @param journal_sync: journal: whether or not every write waits until the journal is on disk.
+    @param connection_options: sqlite: forwarded to the connection manager.
+    """
+    if storage == "memory":
+        return _MemoryStore(logging)
+    if storage == "journal":
+        return _JournalStore(logging, file or "db/exp_system.journal", snapshot_interval, journal_sync)
+    if storage != "sqlite":
+        raise ValueError(f"unknown storage `{storage}`, use one of {', '.join(_STORAGES)}")
+
+    if file:
+        connection_options["file"] = file
+    return _SQLiteStore(logging, legacy_guild, **connection_options)
+
+
+class _ExpBuffer:
+    """
+    Write-behind buffer for exp increments.
+
+    Increments are summed per member in memory and written by a background task in a single transaction, either every
+    `flush_interval` seconds or as soon as `flush_size` members are pending. The last persisted exp of recently active
+    members is kept next to it, so the exact total of a member is always known without reading the database.
+    """
+
+    def __init__(self, logging: PrintHandler, write: Callable[[List[Tuple[_MemberKey, int]]], Awaitable[None]],
+                 flush_interval: float = 1.0, flush_size: int = 500, max_staleness: float = 10.0,
+                 cache_size: int = 100_000):
+        """
+        @param logging: The print handler of the bot.
+        @param write: Persists a list of `(member, increment)` pairs in one transaction.
+        @param flush_interval: The amount of seconds between two flushes.
+        @param flush_size: The amount of pending members which triggers an early flush.
+        @param max_staleness: The amount of seconds an increment may stay pending before new increments wait for a
+                              flush.
+        @param cache_size: The amount of persisted totals which are kept in memory.
+        """
+        self.log = logging
+        self.__write = write
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.max_staleness = max_staleness
+        self.cache_size = cache_size
+
+        self.__persisted: Dict[_MemberKey, int] = {}
+        self.__pending: Dict[_MemberKey, int] = {}
+        self.__in_flight: Dict[_MemberKey, int] = {}
+        self.__oldest: Optional[float] = None
+        self.__wake = Event()
+        self.__flush_lock = Lock()
+        self.__task: Optional[Task] = None
+
+    @property
+    def pending(self) -> int:
+        return len(self.__pending)
+
+    @property
+    def is_stale(self) -> bool:
+        return self.__oldest is not None and monotonic() - self.__oldest >= self.max_staleness
+
+    def start(self) -> None:
+        """
+        Start the background flush task.
+        """
+        if self.__task is None:
+            self.__task = ensure_future(self.__run())
+
+    async def stop(self) -> None:
+        """
+        Stop the background flush task and write everything which is still pending.
+        """
+        if self.__task is not None:
+            self.__task.cancel()
+            try:
+                await self.__task
+            except CancelledError:
+                pass
+            self.__task = None
+
+        await self.flush()
+
+    def knows(self, member: _MemberKey) -> bool:
+        return member in self.__persisted
+
+    def remember(self, member: _MemberKey, exp: int) -> None:
+        """
+        Store the persisted exp of a member, this should be called before the first `add` of the member.
+
+        @param member: The `(guild_id, user_id)` pair of the member.
+        @param exp: The exp which is currently stored in the database.
+        """
+        self.__persisted.setdefault(member, exp)
+
+    def overwrite(self, member: _MemberKey, exp: int, add: bool = False) -> None:
+        """
+        Correct the persisted exp of a member after the database was changed directly, unknown members are ignored.
+
+        This must be called while holding the writer, so no batch gets written in between.
+
+        @param member: The `(guild_id, user_id)` pair of the member.
+        @param exp: The new persisted exp, or the exp which was added to it.
+        @param add: Whether or not `exp` was added to the persisted exp.
+        """
+        if member in self.__persisted:
+            self.__persisted[member] = self.__persisted[member] + exp if add else exp
+
+    def unwritten(self) -> List[Tuple[_MemberKey, int, int]]:
+        """
+        The members with increments which aren't persisted yet, with their persisted and their total exp.
+        """
+        members = {**self.__in_flight, **self.__pending}
+        return [(member, self.__persisted[member], self.total(member)) for member in members]
+
+    def total(self, member: _MemberKey) -> Optional[int]:
+        """
+        The exp of a member including everything that hasn't been written yet, `None` if the member is unknown.
+
+        @param member: The `(guild_id, user_id)` pair of the member.
+        """
+        if member not in self.__persisted:
+            return None
+
+        return self.__persisted[member] + self.__in_flight.get(member, 0) + self.__pending.get(member, 0)
+
+    def add(self, member: _MemberKey, experience: int) -> int:
+        """
+        Buffer an increment, the member must be known.
+
+        @param member: The `(guild_id, user_id)` pair of the member.
+        @param experience: The experience which the member has gained.
+
+        @return: The exp of the member before this increment.
+        """
+        previous = self.total(member)
+        # Re-insert the persisted total so the dict stays ordered by activity, which `__trim` relies on.
+        self.__persisted[member] = self.__persisted.pop(member)
+        self.__pending[member] = self.__pending.get(member, 0) + experience
+
+        if self.__oldest is None:
+            self.__oldest = monotonic()
+
+        if len(self.__pending) >= self.flush_size:
+            self.__wake.set()
+
+        return previous
+
+    async def flush(self) -> None:
+        """
+        Write all pending increments in one transaction.
+        """
+        async with self.__flush_lock:
+            if not self.__pending:
+                return
+
+            batch, oldest = self.__pending, self.__oldest
+            self.__pending, self.__oldest, self.__in_flight = {}, None, batch
+
+            try:
+                await self.__write(list(batch.items()))
+            except Exception:
+                # Merge the batch back, so the next flush retries it.
+                for member, exp in batch.items():
+                    self.__pending[member] = self.__pending.get(member, 0) + exp
+                self.__oldest = oldest
+                raise
+            else:
+                for member, exp in batch.items():
+                    self.__persisted[member] += exp
+            finally:
+                self.__in_flight = {}
+
+            self.__trim()
+
+    def __trim(self) -> None:
+        """
+        Forget the least recently active persisted totals once the cache is full.
+        """
+        overflow = len(self.__persisted) - self.cache_size
+        if overflow <= 0:
+            return
+
+        for member in [m for m in self.__persisted if m not in self.__pending][:overflow]:
+            del self.__persisted[member]
+
+    async def __run(self) -> None:
+        while True:
+            try:
+                await wait_for(self.__wake.wait(), self.flush_interval)
+            except TimeoutError:
+                pass
+
+            self.__wake.clear()
+
+            try:
+                await self.flush()
+            except Exception as e:
+                self.log.warn(f"[DB] Failed to flush {self.pending} pending exp increments, retrying later. ({e})")
+
+
+class _SortedList:
+    """
+    Sorted multiset which stays fast for millions of values.
+
+    The values are kept in ascending buckets of roughly `load` items, and a Fenwick tree over the bucket sizes counts
+    everything in front of a bucket. Inserting, removing and finding the position of a value are all a few bisects and
+    O(log n) tree operations, instead of moving every value behind it like a plain sorted list does.
+    """
+
+    def __init__(self, load: int = 1000):
+        """
+        @param load: The preferred bucket size.
+        """
+        self.__load = load
+        self.__buckets: List[list] = []
+        self.__maxes: list = []
+        self.__tree: List[int] = [0]
+        self.__size = 0
+
+    def __len__(self) -> int:
+        return self.__size
+
+    def __iter__(self) -> Iterator[Any]:
+        for bucket in self.__buckets:
+            yield from bucket
+
+    def __rebuild_tree(self) -> None:
+        tree = [0] + [len(bucket) for bucket in self.__buckets]
+        for idx in range(1, len(tree)):
+            parent = idx + (idx & -idx)
+            if parent < len(tree):
+                tree[parent] += tree[idx]
+        self.__tree = tree
+
+    def __tree_add(self, idx: int, delta: int) -> None:
+        idx += 1
+        while idx < len(self.__tree):
+            self.__tree[idx] += delta
+            idx += idx & -idx
+
+    def __tree_prefix(self, idx: int) -> int:
+        """
+        The amount of values in the first `idx` buckets.
+        """
+        total = 0
+        while idx > 0:
+            total += self.__tree[idx]
+            idx -= idx & -idx
+        return total
+
+    def __locate(self, position: int) -> Tuple[int, int]:
+        """
+        The bucket which holds a zero based position, and the position within that bucket.
+        """
+        idx, step = 0, 1 << (len(self.__tree) - 1).bit_length()
+        while step:
+            if idx + step < len(self.__tree) and self.__tree[idx + step] <= position:
+                idx += step
+                position -= self.__tree[idx]
+            step >>= 1
+        return idx, position
+
+    def load(self, values: Iterable[Any]) -> None:
+        """
+        Replace the contents of the list.
+        """
+        values = sorted(values)
+        self.__buckets = [values[idx:idx + self.__load] for idx in range(0, len(values), self.__load)]
+        self.__maxes = [bucket[-1] for bucket in self.__buckets]
+        self.__size = len(values)
+        self.__rebuild_tree()
+
+    def add(self, value: Any) -> None:
+        if not self.__buckets:
+            self.__buckets.append([value])
+            self.__maxes.append(value)
+            self.__size += 1
+            self.__rebuild_tree()
+            return
+
+        idx = min(bisect_left(self.__maxes, value), len(self.__maxes) - 1)
+        bucket = self.__buckets[idx]
+        insort(bucket, value)
+        self.__maxes[idx] = bucket[-1]
+        self.__size += 1
+
+        if len(bucket) > self.__load * 2:
+            self.__buckets[idx:idx + 1] = [bucket[:self.__load], bucket[self.__load:]]
+            self.__maxes[idx:idx + 1] = [bucket[self.__load - 1], bucket[-1]]
+            self.__rebuild_tree()
+        else:
+            self.__tree_add(idx, 1)
+
+    def remove(self, value: Any) -> None:
+        """
+        Remove a value, this does nothing if the value isn't in the list.
+        """
+        idx = bisect_left(self.__maxes, value)
+        if idx == len(self.__maxes):
+            return
+
+        bucket = self.__buckets[idx]
+        pos = bisect_left(bucket, value)
+        if bucket[pos] != value:
+            return
+
+        del bucket[pos]
+        self.__size -= 1
+
+        if bucket:
+            self.__maxes[idx] = bucket[-1]
+            self.__tree_add(idx, -1)
+        else:
+            del self.__buckets[idx]
+            del self.__maxes[idx]
+            self.__rebuild_tree()
+
+    def bisect_left(self, value: Any) -> int:
+        """
+        The amount of values which are smaller than `value`.
+        """
+        idx = bisect_left(self.__maxes, value)
+        if idx == len(self.__maxes):
+            return self.__size
+        return self.__tree_prefix(idx) + bisect_left(self.__buckets[idx], value)
+
+    def bisect_right(self, value: Any) -> int:
+        """
+        The amount of values which are smaller than or equal to `value`.
+        """
+        idx = bisect_right(self.__maxes, value)
+        if idx == len(self.__maxes):
+            return self.__size
+        return self.__tree_prefix(idx) + bisect_right(self.__buckets[idx], value)
+
+    def slice(self, start: int, end: int) -> list:
+        """
+        The values from zero based position `start` up to `end`, in ascending order.
+        """
+        start, end = max(start, 0), min(end, self.__size)
+        if start >= end:
+            return []
+
+        idx, offset = self.__locate(start)
+        result = []
+        while len(result) < end - start:
+            result.extend(self.__buckets[idx][offset:offset + end - start - len(result)])
+            idx, offset = idx + 1, 0
+        return result
+
+
+class _RankIndex(_SortedList):
+    """
+    Sorted multiset of the exp of every ranked user, so a `rank` lookup never has to scan the table.
+
+    Users without any exp aren't ranked.
+    """
+
+    def load(self, values: Iterable[int]) -> None:
+        """
+        Replace the contents of the index.
+
+        @param values: The exp of every user, values below 1 are ignored.
+        """
+        super().load(value for value in values if value > 0)
+
+    def add(self, value: int) -> None:
+        if value > 0:
+            super().add(value)
+
+    def remove(self, value: int) -> None:
+        if value > 0:
+            super().remove(value)
+
+    def update(self, old: int, new: int) -> None:
+        """
+        Move a user from one exp value to another.
+
+        @param old: The previous exp of the user, 0 if the user wasn't ranked.
+        @param new: The current exp of the user.
+        """
+        self.remove(old)
+        self.add(new)
+
+    def count_above(self, value: int) -> int:
+        """
+        The amount of ranked users with strictly more exp than `value`.
+        """
+        return len(self) - self.bisect_right(value)
+
+
+class _Leaderboard:
+    """
+    The `capacity` users with the most exp, kept up to date by the exp write path.
+
+    A user outside of the cache can only enter it by passing the last cached user, which keeps the cache exact without
+    ever querying the database. A cached user whose exp drops below the last cached user leaves the cache, as users
+    who aren't cached might have more exp now. The user objects are built on the first read after a change.
+    """
+
+    def __init__(self, convert: Callable[[int, int], _BaseUser], capacity: int = 100):
+        """
+        @param convert: Converts a user identifier and exp to a user object.
+        @param capacity: The amount of users which are kept.
+        """
+        self.__convert = convert
+        self.capacity = capacity
+
+        # Ascending `(exp, user_id)` keys, the same order as the `users_guild_exp` index.
+        self.__keys: List[Tuple[int, int]] = []
+        self.__users: Dict[int, Optional[_BaseUser]] = {}
+        # Whether or not every ranked user is in the cache.
+        self.complete = True
+
+    def __len__(self) -> int:
+        return len(self.__keys)
+
+    def load(self, keys: Iterable[Tuple[int, int]], complete: bool) -> None:
+        """
+        Replace the contents of the cache.
+
+        @param keys: The `(exp, user_id)` keys of the users with the most exp.
+        @param complete: Whether or not these are all the ranked users.
+        """
+        self.__keys = sorted(keys)[-self.capacity:]
+        self.__users = {user_id: None for _, user_id in self.__keys}
+        self.complete = complete
+
+    def update(self, user_id: int, old: int, new: int) -> None:
+        """
+        Process an exp change of a user.
+
+        @param user_id: The discord user identifier.
+        @param old: The previous exp of the user.
+        @param new: The current exp of the user.
+        """
+        if user_id in self.__users:
+            del self.__keys[bisect_left(self.__keys, (old, user_id))]
+            del self.__users[user_id]
+
+            if new <= 0 or (not self.complete and (not self.__keys or (new, user_id) < self.__keys[0])):
+                return
+        elif new <= 0:
+            return
+        elif not self.complete or len(self.__keys) >= self.capacity:
+            if not self.__keys or (new, user_id) < self.__keys[0]:
+                # The user ranks below a full cache, so it no longer holds every ranked user.
+                self.complete = False
+                return
+
+            if len(self.__keys) >= self.capacity:
+                _, evicted = self.__keys.pop(0)
+                del self.__users[evicted]
+                self.complete = False
+
+        insort(self.__keys, (new, user_id))
+        self.__users[user_id] = None
+
+    def covers(self, end: int) -> bool:
+        """
+        Whether or not the first `end` positions can be served from the cache.
+        """
+        return self.complete or end <= len(self.__keys)
+
+    def key_at(self, position: int) -> Tuple[int, int]:
+        """
+        The `(exp, user_id)` key of the user at a zero based position.
+        """
+        return self.__keys[len(self.__keys) - 1 - position]
+
+    def keys(self, start: int, amount: int) -> List[Tuple[int, int]]:
+        """
+        The `(exp, user_id)` keys from zero based position `start` onwards.
+        """
+        end = len(self.__keys) - start
+        return self.__keys[max(end - amount, 0):max(end, 0)][::-1]
+
+    def slice(self, start: int, amount: int) -> List[_BaseUser]:
+        """
+        The users from zero based position `start` onwards.
+        """
+        result = []
+        for idx in range(len(self.__keys) - 1 - start, max(len(self.__keys) - 1 - start - amount, -1), -1):
+            exp, user_id = self.__keys[idx]
+            user = self.__users[user_id]
+            if user is None:
+                user = self.__users[user_id] = self.__convert(user_id, exp)
+            result.append(user)
+        return result
+
+
+class _UserCache:
+    """
+    LRU cache of the `rank` results of members, with a time to live.
+
+    An entry is dropped as soon as the exp of its member changes. The position also changes when other members pass
+    the member, the time to live limits how long such a position can be outdated.
+    """
+
+    def __init__(self, size: int = 10_000, ttl: float = 5.0):
+        """
+        @param size: The maximum amount of cached members.
+        @param ttl: The amount of seconds an entry stays valid.
+        """
+        self.size = size
+        self.ttl = ttl
+
+        self.__entries: "OrderedDict[_MemberKey, Tuple[float, _User]]" = OrderedDict()
+        # The amount of running reads per member, and the amount of changes which happened during a read.
+        self.__reading: Dict[_MemberKey, int] = {}
+        self.__races = 0
+
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def get(self, member: _MemberKey) -> Optional[_User]:
+        entry = self.__entries.get(member)
+        if entry is not None:
+            if entry[0] > monotonic():
+                self.__entries.move_to_end(member)
+                self.hits += 1
+                return entry[1]
+            del self.__entries[member]
+
+        self.misses += 1
+        return None
+
+    def begin(self, member: _MemberKey) -> int:
+        """
+        Mark a member as being read, this should be followed by `finish`.
+
+        @return: The token which has to be passed to `finish`.
+        """
+        self.__reading[member] = self.__reading.get(member, 0) + 1
+        return self.__races
+
+    def finish(self, member: _MemberKey, token: int, user: Optional[_User]) -> None:
+        """
+        Store the result of a read, unless the member changed while it was read.
+
+        @param token: The token which was returned by `begin`.
+        @param user: The result, `None` if the read failed.
+        """
+        remaining = self.__reading.pop(member) - 1
+        if remaining:
+            self.__reading[member] = remaining
+
+        if user is None or token != self.__races or self.size <= 0:
+            return
+
+        self.__entries[member] = (monotonic() + self.ttl, user)
+        self.__entries.move_to_end(member)
+        if len(self.__entries) > self.size:
+            self.__entries.popitem(last=False)
+
+    def invalidate(self, member: _MemberKey) -> None:
+        self.__entries.pop(member, None)
+        if member in self.__reading:
+            self.__races += 1
+
+    def clear(self, guild_id: int) -> None:
+        """
+        Drop the entries of every member of a guild.
+        """
+        for member in [member for member in self.__entries if member[0] == guild_id]:
+            del self.__entries[member]
+        if any(member[0] == guild_id for member in self.__reading):
+            self.__races += 1
+
+
+class _DatabaseInteractions:
+    """Handles everything which relates with the data of the exp system."""
+
+    def __init__(self, logging: PrintHandler, curve: Optional[_LevelCurve] = None, legacy_guild: Optional[int] = None,
+                 rank_index: bool = True, leaderboard_size: int = 100, page_cursor_ttl: float = 60.0,
+                 write_behind: bool = True, flush_interval: float = 1.0, flush_size: int = 500,
+                 max_staleness: float = 10.0, log_sample_rate: float = 0.0, store: Optional[_ExpStore] = None,
+                 on_rewrite: Optional[Callable[[List[Tuple[int, int, int, int]]], Any]] = None,
+                 user_cache_size: int = 10_000, user_cache_ttl: float = 5.0, **connection_options):
+        """
+        @param logging: The print handler of the bot.
+        @param curve: The level curve, the default quadratic curve if left empty.
+        @param legacy_guild: The guild to which the data of the old single guild layout belongs.
+        @param rank_index: Whether or not ranks are served from memory instead of counting rows in the database.
+        @param leaderboard_size: The amount of top users per guild which are kept in memory, 0 to disable.
+        @param page_cursor_ttl: The amount of seconds a remembered leaderboard page boundary stays valid.
+        @param write_behind: Whether or not exp increments get buffered and written in batches.
+        @param flush_interval: The amount of seconds between two batch writes.
+        @param flush_size: The amount of pending members which triggers an early batch write.
+        @param max_staleness: The maximum age in seconds of a buffered increment.
+        @param log_sample_rate: The fraction of the per message queries which get logged, 0 to disable.
+        @param store: The storage backend, an sqlite database if left empty.
+        @param on_rewrite: Called with the `(guild, user, old exp, new exp)` changes of every chunk of a decay or a
+                           season reset.
+        @param user_cache_size: The amount of `rank` results which are cached, 0 to disable.
+        @param user_cache_ttl: The amount of seconds a cached `rank` result stays valid.
+        @param connection_options: Forwarded to the connection manager of the sqlite database.
+        """
+        self.log = logging
+        self.curve = curve or _LevelCurve()
+        self.store = store or _SQLiteStore(logging, legacy_guild, **connection_options)
+        self.buffer = _ExpBuffer(logging, self.__write_increments, flush_interval, flush_size, max_staleness) \
+            if write_behind else None
+        self.rank_index = rank_index
+        self.leaderboard_size = leaderboard_size
+        self.page_cursor_ttl = page_cursor_ttl
+        self.log_sample_rate = log_sample_rate
+        self.on_rewrite = on_rewrite
+        self.users = _UserCache(user_cache_size, user_cache_ttl)
+
+        self.ranks: Dict[int, _RankIndex] = {}
+        self.leaderboards: Dict[int, _Leaderboard] = {}
+        self.__open = False
+        self.__open_lock = Lock()
+        # Writes to the store never run concurrently, this also keeps the in-memory state in line with the store.
+        self.__write_lock = Lock()
+        # The guilds which are being imported, their indexes are rebuilt once the import is done.
+        self.__importing: set = set()
+        # Incremented by every import or maintenance chunk, so a read which raced one can be detected.
+        self.__rewrites = 0
+        # Only one decay or season reset runs at a time.
+        self.__maintenance_lock = Lock()
+        # Maps a guild to `(page_size, page)` and the expiry time and the key of the last user on the page before it.
+        self.__page_cursors: Dict[int, Dict[Tuple[int, int], Tuple[float, Tuple[int, int]]]] = {}
+
+    @property
+    def is_open(self) -> bool:
+        return self.__open
+
+    async def open(self) -> None:
+        """
+        Open the store and load the in-memory indexes, this does nothing if it is already open.
+        """
+        async with self.__open_lock:
+            if self.__open:
+                return
+
+            await self.store.open()
+
+            if self.rank_index or self.leaderboard_size > 0:
+                # Nothing is handed out before the indexes are loaded, so no increment can be missed while loading.
+                self.ranks.clear()
+                self.leaderboards.clear()
+                async for guild_id, keys in self.store.ranked():
+                    self.__load_guild(guild_id, keys)
+                self.log.info(f"[DB] Loaded the exp indexes of {len(self.ranks) or len(self.leaderboards)} guild(s).")
+
+            self.__open = True
+            if self.buffer:
+                self.buffer.start()
+
+    async def __ready(self) -> _ExpStore:
+        """
+        The store, which gets opened first if required.
+        """
+        if not self.__open:
+            await self.open()
+        return self.store
+
+    async def flush(self) -> None:
+        """
+        Write all buffered exp increments.
+        """
+        if self.buffer:
+            await self.buffer.flush()
+
+    async def close(self) -> None:
+        """
+        Write all buffered exp increments and close the store.
+        """
+        if self.buffer:
+            await self.buffer.stop()
+
+        async with self.__open_lock:
+            await self.store.close()
+            self.__open = False
+
+    def __load_guild(self, guild_id: int, keys: List[Tuple[int, int]]) -> None:
+        """
+        Fill the in-memory indexes of a guild.
+
+        @param guild_id: The discord guild identifier.
+        @param keys: The `(exp, user_id)` keys of every ranked member, sorted from high to low.
+        """
+        if self.rank_index:
+            self.ranks[guild_id] = _RankIndex()
+            self.ranks[guild_id].load(exp for exp, _ in keys)
+
+        if self.leaderboard_size > 0:
+            self.leaderboards[guild_id] = _Leaderboard(self.convert_to_baseuser, self.leaderboard_size)
+            self.leaderboards[guild_id].load(keys[:self.leaderboard_size], len(keys) <= self.leaderboard_size)
+
+    def convert_exp_to_level(self, exp: int) -> int:
+        """
+        Converts a certain exp to the linked level.
+
+        @param exp: The exp to be linked.
+        """
+        return self.curve.level(exp)
+
+    def convert_level_to_exp(self, level: int) -> int:
+        """
+        Converts a certain level to the linked exp which is required for the level.
+
+        @param level: The level to be linked.
+        """
+        return self.curve.threshold(level)
+
+    def _convert_to_user(self, user_id: int, exp: int, pos: int, total: int):
+        """
+        Converts a user to an user object, and performs the EXP and level calculations.
+
+        @param user_id: The discord user identifier.
+        @param exp: The exp the user currently holds.
+        @param pos: The position of the user compared to the server.
+        @param total: The total number of registered users.
+        """
+        lvl = self.convert_exp_to_level(exp)
+        exp_next = self.convert_level_to_exp(lvl + 1)
+        return _User(user_id, intword(exp), intword(exp_next), lvl, intword(max(exp_next - exp, 0)), pos, total)
+
+    def convert_to_baseuser(self, user_id: int, exp: int):
+        """
+        Converts a user to an user object, and performs the EXP and level calculations.
+
+        @param user_id: The discord user identifier.
+        @param exp: The exp the user currently holds.
+        """
+        lvl = self.convert_exp_to_level(exp)
+        exp_next = self.convert_level_to_exp(lvl + 1)
+        return _BaseUser(user_id, intword(exp), intword(exp_next), lvl, intword(max(exp_next - exp, 0)))
+
+    async def get_user_data(self, guild_id: int, user_id: int) -> _User:
+        """
+        Fetch the data from a member and calculate the appropriate values.
+
+        @param guild_id: The discord guild identifier.
+        @param user_id: The discord user identifier.
+        """
+        member = (guild_id, user_id)
+        user = self.users.get(member)
+        if user is not None:
+            return user
+
+        token = self.users.begin(member)
+        try:
+            user = self._convert_to_user(user_id, *await self.get_rank(guild_id, user_id))
+        finally:
+            self.users.finish(member, token, user)
+        return user
+
+    async def get_rank(self, guild_id: int, user_id: int) -> Tuple[int, int, int]:
+        """
+        Fetch the exp and the position of a member.
+
+        @param guild_id: The discord guild identifier.
+        @param user_id: The discord user identifier.
+
+        @return: The exp, the position and the amount of ranked members of the guild.
+        """
+        # The message only gets formatted if it is sampled.
+        if self.log_sample_rate and random.random() < self.log_sample_rate:
+            self.log.info(f"[DB] Fetching experience data from `{user_id}` in `{guild_id}`")
+
+        store = await self.__ready()
+        _exp = self.buffer.total((guild_id, user_id)) if self.buffer else None
+        if _exp is None:
+            _exp = await store.get(guild_id, user_id)
+
+        if self.rank_index:
+            ranks = self.ranks.get(guild_id) or _RankIndex()
+            return _exp, ranks.count_above(_exp) + 1, len(ranks)
+
+        return (_exp, *await store.rank(guild_id, _exp))
+
+    async def get_position(self, guild_id: int, exp: int) -> int:
+        """
+        The position which an amount of exp has in a guild, members with the same exp share a position.
+
+        @param guild_id: The discord guild identifier.
+        @param exp: The amount of exp.
+        """
+        store = await self.__ready()
+        if self.rank_index:
+            ranks = self.ranks.get(guild_id)
+            return ranks.count_above(exp) + 1 if ranks else 1
+
+        return (await store.rank(guild_id, exp))[0]
+
+    async def __write_increments(self, increments: List[Tuple[_MemberKey, int]]) -> None:
+        """
+        Persist a batch of exp increments in a single write.
+
+        @param increments: The `(member, experience)` pairs.
+        """
+        async with self.__write_lock:
+            await self.store.increment(increments)
+
+    def __track(self, guild_id: int, user_id: int, old: int, new: int) -> None:
+        """
+        Keep the in-memory rank index, leaderboard and user cache of a guild in sync with an exp change.
+        """
+        self.users.invalidate((guild_id, user_id))
+        if guild_id in self.__importing:
+            return
+
+        cursors = self.__page_cursors.get(guild_id)
+        if cursors:
+            # A user who passed a page boundary shifts the pages after it, so that boundary is dropped.
+            for page, (_, cursor) in list(cursors.items()):
+                if (old > 0 and (old, user_id) >= cursor) != (new > 0 and (new, user_id) >= cursor):
+                    del cursors[page]
+
+        if self.rank_index:
+            if guild_id not in self.ranks:
+                self.ranks[guild_id] = _RankIndex()
+            self.ranks[guild_id].update(old, new)
+
+        if self.leaderboard_size > 0:
+            if guild_id not in self.leaderboards:
+                self.leaderboards[guild_id] = _Leaderboard(self.convert_to_baseuser, self.leaderboard_size)
+            self.leaderboards[guild_id].update(user_id, old, new)
+
+    async def add_experience(self, guild_id: int, user_id: int, experience: int) -> int:
+        """
+        Give a member experience.
+
+        With write-behind enabled the increment is buffered and written in the next batch.
+
+        @param guild_id: The discord guild identifier.
+        @param user_id: The discord user identifier.
+        @param experience: The experience which the member has gained.
+
+        @return: The exp the member had before this increment.
+        """
+        store = await self.__ready()
+        if self.buffer:
+            member = (guild_id, user_id)
+            while not self.buffer.knows(member):
+                rewrites = self.__rewrites
+                exp = await store.get(guild_id, user_id)
+                # An import or maintenance chunk might have been written while the exp was being read.
+                if rewrites == self.__rewrites:
+                    self.buffer.remember(member, exp)
+
+            if self.buffer.is_stale:
+                await self.buffer.flush()
+
+            previous = self.buffer.add(member, experience)
+            self.__track(guild_id, user_id, previous, previous + experience)
+            return previous
+
+        if self.log_sample_rate and random.random() < self.log_sample_rate:
+            self.log.info(f"[DB] Adding `{experience}` experience to `{user_id}` in `{guild_id}`")
+
+        async with self.__write_lock:
+            previous = await store.get(guild_id, user_id)
+            await store.increment([((guild_id, user_id), experience)])
+
+        self.__track(guild_id, user_id, previous, previous + experience)
+        return previous
+
+    async def iter_guild(self, guild_id: int, chunk_size: int = 1000) -> AsyncIterator[List[Tuple[int, int]]]:
+        """
+        Stream the `(user_id, exp)` pairs of a guild in chunks.
+
+        Every chunk is a separate short read, so the connection is never held while the chunk is processed.
+
+        @param guild_id: The discord guild identifier.
+        @param chunk_size: The amount of members per chunk.
+        """
+        await self.flush()
+        last = -1
+
+        while True:
+            chunk = await self.read_chunk(guild_id, last, chunk_size)
+            if not chunk:
+                return
+
+            yield chunk
+            last = chunk[-1][0]
+
+    async def read_chunk(self, guild_id: int, after: int, limit: int) -> List[Tuple[int, int]]:
+        """
+        Read the `(user_id, exp)` pairs of a guild which follow a user identifier.
+
+        @param guild_id: The discord guild identifier.
+        @param after: The user identifier after which the chunk starts, -1 to start at the beginning.
+        @param limit: The maximum amount of members in the chunk.
+        """
+        return await (await self.__ready()).read_chunk(guild_id, after, limit)
+
+    async def export_rows(self, guild_id: Optional[int] = None,
+                          chunk_size: int = 1000) -> AsyncIterator[List[Tuple[int, int, int]]]:
+        """
+        Stream the `(guild_id, user_id, exp)` rows of a guild, or of every guild, in chunks.
+
+        The export is a consistent snapshot of the store, which never holds up the other queries.
+
+        @param guild_id: The discord guild identifier, every guild if left empty.
+        @param chunk_size: The amount of rows per chunk.
+        """
+        store = await self.__ready()
+        await self.flush()
+
+        async for chunk in store.export(guild_id, chunk_size):
+            yield chunk
+
+    async def import_rows(self, rows: Iterable[Tuple[int, int, int]], replace: bool = False,
+                          chunk_size: int = 1000) -> int:
+        """
+        Write `(guild_id, user_id, exp)` rows, every chunk is written in its own transaction.
+
+        The rows are consumed lazily, so a file of any size can be imported with constant memory. The in-memory
+        indexes of the imported guilds aren't updated during the import, they are rebuilt afterwards.
+
+        @param rows: The rows which should be imported.
+        @param replace: Whether the exp of existing members gets overwritten instead of added to.
+        @param chunk_size: The amount of rows per transaction.
+
+        @return: The amount of imported rows.
+        """
+        store = await self.__ready()
+        rows, count, guilds = iter(rows), 0, set()
+        # Exp which was earned before the import gets overwritten as well in the replace mode.
+        await self.flush()
+
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+
+            try:
+                async with self.__write_lock:
+                    self.__importing.update(guild_id for guild_id, _, _ in chunk)
+                    self.__rewrites += 1
+                    await store.load(chunk, replace)
+
+                    for guild_id, user_id, exp in chunk:
+                        self.users.invalidate((guild_id, user_id))
+                        if self.buffer:
+                            self.buffer.overwrite((guild_id, user_id), exp, not replace)
+            finally:
+                guilds.update(guild_id for guild_id, _, _ in chunk)
+            count += len(chunk)
+
+        for guild_id in guilds:
+            await self.__reload_guild(guild_id)
+
+        self.log.info(f"[DB] Imported {count} row(s) into {len(guilds)} guild(s).")
+        return count
+
+    async def __reload_guild(self, guild_id: int) -> None:
+        """
+        Rebuild the in-memory indexes of a guild from the store.
+        """
+        self.__page_cursors.pop(guild_id, None)
+        self.users.clear(guild_id)
+        if not self.rank_index and self.leaderboard_size <= 0:
+            self.__importing.discard(guild_id)
+            return
+
+        # Holding the write lock makes sure no batch gets written while the guild is being loaded.
+        async with self.__write_lock:
+            keys = []
+            async for _, keys in self.store.ranked(guild_id):
+                pass
+            self.__load_guild(guild_id, keys)
+            self.__importing.discard(guild_id)
+
+            # Buffered increments aren't in the store yet.
+            for (guild, user_id), persisted, total in self.buffer.unwritten() if self.buffer else ():
+                if guild == guild_id:
+                    self.__track(guild, user_id, persisted, total)
+
+    async def __maintain(self, factor: float, inactive_since: Optional[int], guild_id: Optional[int],
+                         season: Optional[str], chunk_size: int, pause: float) -> int:
+        """
+        Multiply the exp of every matching member, one rowid range at a time.
+
+        Every range is a short write, and the store is released between the ranges, so exp keeps being processed while
+        the job runs. The in-memory state is updated with the changes of every range.
+
+        @param factor: The new exp is `exp * factor`, rounded down.
+        @param inactive_since: Only change the members which weren't active since this unix time.
+        @param guild_id: Only change the members of this guild, every guild if left empty.
+        @param season: Archive the exp of the changed members under this season first.
+        @param chunk_size: The amount of rowids per transaction.
+        @param pause: The amount of seconds between two transactions.
+
+        @return: The amount of changed members.
+        """
+        store = await self.__ready()
+
+        async with self.__maintenance_lock:
+            # Buffered exp was earned before the job, so it should be changed as well.
+            await self.flush()
+
+            changed, guilds = 0, set()
+            for start in range(1, await store.last_rowid() + 1, chunk_size):
+                async with self.__write_lock:
+                    self.__rewrites += 1
+                    rows = await store.rewrite(start, start + chunk_size - 1, factor, inactive_since, guild_id, season)
+
+                    changes = []
+                    for guild, user_id, old, new in rows:
+                        member = (guild, user_id)
+                        # Increments which are being written right now stay on top of the new exp.
+                        unwritten = self.buffer.total(member) - old if self.buffer and self.buffer.knows(member) \
+                            else 0
+                        if self.buffer:
+                            self.buffer.overwrite(member, new)
+                        self.__track(guild, user_id, old + unwritten, new + unwritten)
+                        changes.append((guild, user_id, old + unwritten, new + unwritten))
+
+                    if self.on_rewrite and changes:
+                        self.on_rewrite(changes)
+
+                changed += len(rows)
+                guilds.update(guild for guild, _, _, _ in rows)
+                await sleep(pause)
+
+        # Leaderboards lose members whose exp dropped below users who aren't cached, so refill those.
+        for guild in guilds:
+            leaderboard = self.leaderboards.get(guild)
+            if leaderboard is not None and not leaderboard.complete and len(leaderboard) < self.leaderboard_size:
+                await self.__reload_guild(guild)
+
+        return changed
+
+    async def decay(self, inactive_since: float, rate: float, guild_id: Optional[int] = None, chunk_size: int = 5000,
+                    pause: float = 0.01) -> int:
+        """
+        Remove a part of the exp of every member who hasn't earned exp for a while.
+
+        @param inactive_since: The unix time since which the members haven't been active.
+        @param rate: The part of the exp which gets removed, between 0 and 1.
+        @param guild_id: Only decay the members of this guild, every guild if left empty.
+        @param chunk_size: The amount of rowids per transaction.
+        @param pause: The amount of seconds between two transactions.
+
+        @return: The amount of decayed members.
+        """
+        return await self.__maintain(1 - rate, int(inactive_since), guild_id, None, chunk_size, pause)
+
+    async def reset_season(self, guild_id: int, season: Optional[str] = None, chunk_size: int = 5000,
+                           pause: float = 0.01) -> int:
+        """
+        Reset the exp of every member of a guild to 0.
+
+        @param guild_id: The discord guild identifier.
+        @param season: Archive the exp under this season name first, the exp is lost if left empty.
+        @param chunk_size: The amount of rowids per transaction.
+        @param pause: The amount of seconds between two transactions.
+
+        @return: The amount of reset members.
+        """
+        return await self.__maintain(0, None, guild_id, season, chunk_size, pause)
+
+    async def get_top(self, guild_id: int, amount: int) -> List[_BaseUser]:
+        """
+        Returns the top x members of a guild by exp.
+
+        @param guild_id: The discord guild identifier.
+        @param amount: The amount of members that have to be fetched.
+        """
+        return await self.get_page(guild_id, 1, amount)
+
+    def __find_page_cursor(self, guild_id: int, page: int, size: int) -> Tuple[int, Optional[Tuple[int, int]]]:
+        """
+        Find the closest known page boundary in front of a page.
+
+        @return: The page from which can be started, and the key of the last member in front of that page.
+        """
+        start_page, cursor = 1, None
+
+        leaderboard = self.leaderboards.get(guild_id)
+        if leaderboard is not None and len(leaderboard) >= size:
+            # Full cached pages are free, so the walk can start right after them.
+            cached = min(len(leaderboard) // size, page - 1)
+            if cached:
+                start_page, cursor = cached + 1, leaderboard.key_at(cached * size - 1)
+
+        now = monotonic()
+        cursors = self.__page_cursors.get(guild_id, {})
+        for key, (expires, key_cursor) in list(cursors.items()):
+            if expires < now:
+                del cursors[key]
+            elif key[0] == size and start_page < key[1] <= page:
+                start_page, cursor = key[1], key_cursor
+
+        return start_page, cursor
+
+    async def get_page(self, guild_id: int, page: int, size: int = 10) -> List[_BaseUser]:
+        """
+        Returns a page of the leaderboard of a guild.
+
+        Pages which aren't cached are fetched with keyset pagination on `(exp, id)`, starting from the closest
+        boundary which is known. The members in between are walked in chunks of `_PAGE_WALK_SIZE`, the boundaries of
+        these chunks are remembered for `page_cursor_ttl` seconds.
+
+        @param guild_id: The discord guild identifier.
+        @param page: The page number, starting at 1.
+        @param size: The amount of members on a page.
+        """
+        leaderboard = self.leaderboards.get(guild_id) if self.__open else None
+        if leaderboard is not None and leaderboard.covers(page * size):
+            # The cached user objects are reused.
+            return leaderboard.slice((page - 1) * size, size)
+
+        keys = await self.get_page_keys(guild_id, page, size)
+        return [self.convert_to_baseuser(user_id, exp) for exp, user_id in keys]
+
+    async def get_page_keys(self, guild_id: int, page: int, size: int = 10) -> List[Tuple[int, int]]:
+        """
+        Returns the `(exp, user_id)` keys of a page of the leaderboard of a guild, see `get_page`.
+        """
+        store = await self.__ready()
+        start = (page - 1) * size
+        if self.leaderboard_size > 0:
+            leaderboard = self.leaderboards.get(guild_id)
+            if leaderboard is None:
+                # Every guild with ranked members got loaded, so this guild has none.
+                return []
+
+            if leaderboard.covers(start + size):
+                return leaderboard.keys(start, size)
+
+        if self.log_sample_rate and random.random() < self.log_sample_rate:
+            self.log.info(f"[DB] Fetching leaderboard page `{page}` of `{size}` members in `{guild_id}`!")
+        start_page, cursor = self.__find_page_cursor(guild_id, page, size)
+
+        # Make sure the database is as recent as the in-memory state.
+        await self.flush()
+
+        # Walk to the page in bounded chunks, so a deep page never loads every member in front of it.
+        walk = max(_PAGE_WALK_SIZE // size, 1)
+        while start_page < page:
+            pages = min(page - start_page, walk)
+            keys = await store.top(guild_id, pages * size, cursor)
+            if len(keys) < pages * size:
+                return []
+
+            start_page, cursor = start_page + pages, keys[-1]
+            self.__page_cursors.setdefault(guild_id, {})[(size, start_page)] = (monotonic() + self.page_cursor_ttl,
+                                                                                cursor)
+
+        return await store.top(guild_id, size, cursor)
+
+    async def get_member_count(self, guild_id: int) -> int:
+        """
+        The amount of ranked members of a guild.
+        """
+        # Nobody has the user id 0, so this only counts the members.
+        return (await self.get_rank(guild_id, 0))[2]
+
+
+# The file formats which can be imported and exported, by file extension.
+_TRANSFER_FORMATS = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl", ".json": "jsonl"}
+
+
+def _transfer_format(file: str) -> str:
+    """
+    The import/export format of a file, based on its extension.
+    """
+    fmt = _TRANSFER_FORMATS.get(path.splitext(file)[1].lower())
+    if fmt is None:
+        raise ValueError(f"`{path.basename(file)}` is not a .csv or .jsonl file")
+    return fmt
+
+
+def _read_rows(file: TextIO, fmt: str, guild_id: Optional[int] = None) -> Iterator[Tuple[int, int, int]]:
+    """
+    Lazily parse the `(guild_id, user_id, exp)` rows of an export file.
+
+    @param file: The opened file.
+    @param fmt: `csv` or `jsonl`.
+    @param guild_id: The guild the rows get imported into, the `guild_id` column of the file is used if left empty.
+    """
+    records = DictReader(file) if fmt == "csv" else (loads(line) for line in file if line.strip())
+
+    for line, record in enumerate(records, 1):
+        try:
+            row = (guild_id if guild_id is not None else int(record["guild_id"]),
+                   int(record["user_id"] if "user_id" in record else record["id"]), int(record["exp"]))
+        except (KeyError, TypeError, ValueError):
+            columns = "`user_id` and `exp`" if guild_id is not None else "`guild_id`, `user_id` and `exp`"
+            raise ValueError(f"row {line} needs a {columns} value")
+
+        if row[2] < 0:
+            raise ValueError(f"row {line} has a negative exp value")
+        yield row
+
+
+def _validate_file(file: str, fmt: str, guild_id: Optional[int] = None) -> None:
+    """
+    Parse every row of an export file, raises a ValueError for the first invalid row.
+    """
+    with open(file, newline="", encoding="utf-8") as handle:
+        for _ in _read_rows(handle, fmt, guild_id):
+            pass
+
+
+async def _import_file(db: _DatabaseInteractions, file: str, guild_id: Optional[int] = None, replace: bool = False,
+                       chunk_size: int = 1000) -> int:
+    """
+    Import a CSV or JSONL export file.
+
+    @return: The amount of imported rows.
+    """
+    fmt = _transfer_format(file)
+    # Validate the whole file first, so an invalid row doesn't leave a partial import behind. Parsing a large file
+    # takes seconds, so it runs in a worker thread instead of blocking the event loop.
+    await get_event_loop().run_in_executor(None, _validate_file, file, fmt, guild_id)
+
+    with open(file, newline="", encoding="utf-8") as handle:
+        return await db.import_rows(_read_rows(handle, fmt, guild_id), replace, chunk_size)
+
+
+async def _export_file(db: _DatabaseInteractions, file: str, guild_id: Optional[int] = None,
+                       chunk_size: int = 1000) -> int:
+    """
+    Export the exp of a guild, or of every guild, to a CSV or JSONL file.
+
+    @return: The amount of exported rows.
+    """
+    fmt, count = _transfer_format(file), 0
+    with open(file, "w", newline="", encoding="utf-8") as handle:
+        writer = csv_writer(handle) if fmt == "csv" else None
+        if writer:
+            writer.writerow(("guild_id", "user_id", "exp"))
+
+        async for chunk in db.export_rows(guild_id, chunk_size):
+            if writer:
+                writer.writerows(chunk)
+            else:
+                handle.writelines(dumps({"guild_id": g, "user_id": u, "exp": e}) + "\n" for g, u, e in chunk)
+            count += len(chunk)
+
+    return count
+
+
+async def _run_decay(db: _DatabaseInteractions, logging: PrintHandler, decay_after: float, rate: float,
+                     interval: float, on_decay: Optional[Callable[[int], Any]] = None, **options) -> None:
+    """
+    Decay the exp of the inactive members of every guild, every `interval` seconds.
+
+    @param decay_after: The amount of seconds without earning exp after which a member is inactive.
+    @param rate: The fraction of the exp which an inactive member loses.
+    @param on_decay: Called with the amount of decayed members after every run.
+    @param options: Forwarded to `_DatabaseInteractions.decay`.
+    """
+    while True:
+        await sleep(interval)
+
+        try:
+            decayed = await db.decay(time() - decay_after, rate, **options)
+        except Exception as e:
+            logging.warn(f"[EXP] Failed to decay the exp of inactive members, retrying next time. ({e})")
+            continue
+
+        if on_decay:
+            on_decay(decayed)
+        logging.info(f"[EXP] Decayed the exp of {decayed} inactive member(s).")
+
+
+# The exp service protocol. Every frame is a header with the payload length, the opcode and the request identifier,
+# followed by the payload. A reply carries the opcode and identifier of its request, or `_OP_ERROR` and a message.
+_FRAME = Struct("!IBI")
+_OP_ADD, _OP_RANK, _OP_PAGE, _OP_CHUNK, _OP_FLUSH, _OP_DECAY, _OP_SEASON, _OP_ERROR, _OP_POSITION = range(1, 10)
+# guild_id, user_id, experience -> previous exp
+_ADD = Struct("!QQQ")
+# guild_id, user_id -> exp, position, total
+_MEMBER = Struct("!QQ")
+_RANK = Struct("!QQQ")
+# guild_id, exp -> position
+_POSITION = Struct("!QQ")
+# guild_id, page, size -> (exp, user_id) pairs
+_PAGE = Struct("!QII")
+# The highest page and page size which fit in `_PAGE`.
+_MAX_UINT = 2 ** 32 - 1
+# guild_id, after, limit -> (user_id, exp) pairs
+_CHUNK = Struct("!QqI")
+_PAIR = Struct("!QQ")
+# guild_id (0 for every guild), inactive_since, rate -> amount
+_DECAY = Struct("!Qdd")
+# guild_id followed by the season name -> amount
+_COUNT = Struct("!Q")
+
+
+class _ServiceError(Exception):
+    """
+    Raised when the exp service can't be reached or a request failed.
+    """
+
+
+class _ExpService:
+    """
+    Owns the database on behalf of several bot processes, which connect to it over a unix socket.
+
+    The increments of every process end up in the same write-behind buffer, so they get written in shared batches and
+    only one process ever writes to the database.
+    """
+
+    def __init__(self, logging: PrintHandler, db: _DatabaseInteractions, socket_path: str,
+                 max_frame: int = 1 << 16):
+        """
+        @param logging: The print handler.
+        @param db: The database which is served.
+        @param socket_path: The path of the unix socket.
+        @param max_frame: The maximum payload size of a request, the connection is closed if it is exceeded.
+        """
+        self.log = logging
+        self.db = db
+        self.socket_path = socket_path
+        self.max_frame = max_frame
+        self.__server = None
+        self.__clients: set = set()
+        # The requests which are being handled, a reference is kept so they aren't garbage collected.
+        self.__requests: set = set()
+        self.__handlers: Dict[int, Callable[[bytes], Awaitable[bytes]]] = {
+            _OP_ADD: self.__add, _OP_RANK: self.__rank, _OP_PAGE: self.__page, _OP_CHUNK: self.__chunk,
+            _OP_FLUSH: self.__flush, _OP_DECAY: self.__decay, _OP_SEASON: self.__season,
+            _OP_POSITION: self.__position
+        }
+
+    async def start(self) -> None:
+        await self.db.open()
+
+        # A socket file which is left behind by a crashed service would make the bind fail.
+        if path.exists(self.socket_path):
+            remove(self.socket_path)
+
+        self.__server = await start_unix_server(self.__serve, path=self.socket_path)
+        self.log.info(f"[EXP] Serving the exp system on `{self.socket_path}`.")
+
+    async def stop(self) -> None:
+        if self.__server is not None:
+            self.__server.close()
+            # The clients notice the closed connection and reconnect once the service is back.
+            for writer in self.__clients:
+                writer.close()
+            await self.__server.wait_closed()
+            self.__server = None
+
+        # Nobody receives the replies of unfinished requests anymore.
+        for task in self.__requests:
+            task.cancel()
+        await gather(*self.__requests, return_exceptions=True)
+
+        await self.db.close()
+        if path.exists(self.socket_path):
+            remove(self.socket_path)
+
+    async def __serve(self, reader: StreamReader, writer: StreamWriter) -> None:
+        lock = Lock()
+        self.__clients.add(writer)
+        try:
+            while True:
+                length, op, request_id = _FRAME.unpack(await reader.readexactly(_FRAME.size))
+                if length > self.max_frame:
+                    self.log.warn(f"[EXP] Closing a connection which sent a {length} byte frame.")
+                    break
+
+                # Requests are handled concurrently, the replies carry the request identifier.
+                task = ensure_future(self.__respond(writer, lock, op, request_id, await reader.readexactly(length)))
+                self.__requests.add(task)
+                task.add_done_callback(self.__requests.discard)
+        except (IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.__clients.discard(writer)
+            writer.close()
+
+    async def __respond(self, writer: StreamWriter, lock: Lock, op: int, request_id: int, payload: bytes) -> None:
+        try:
+            handler = self.__handlers.get(op)
+            if handler is None:
+                raise _ServiceError(f"Unknown opcode `{op}`.")
+            reply = await handler(payload)
+        except Exception as e:
+            op, reply = _OP_ERROR, str(e).encode()
+
+        async with lock:
+            writer.write(_FRAME.pack(len(reply), op, request_id) + reply)
+            try:
+                await writer.drain()
+            except ConnectionError:
+                pass
+
+    async def __add(self, payload: bytes) -> bytes:
+        return _COUNT.pack(await self.db.add_experience(*_ADD.unpack(payload)))
+
+    async def __rank(self, payload: bytes) -> bytes:
+        return _RANK.pack(*await self.db.get_rank(*_MEMBER.unpack(payload)))
+
+    async def __position(self, payload: bytes) -> bytes:
+        return _COUNT.pack(await self.db.get_position(*_POSITION.unpack(payload)))
+
+    async def __page(self, payload: bytes) -> bytes:
+        return b"".join(_PAIR.pack(*key) for key in await self.db.get_page_keys(*_PAGE.unpack(payload)))
+
+    async def __chunk(self, payload: bytes) -> bytes:
+        return b"".join(_PAIR.pack(*pair) for pair in await self.db.read_chunk(*_CHUNK.unpack(payload)))
+
+    async def __flush(self, _: bytes) -> bytes:
+        await self.db.flush()
+        return b""
+
+    async def __decay(self, payload: bytes) -> bytes:
+        guild_id, inactive_since, rate = _DECAY.unpack(payload)
+        return _COUNT.pack(await self.db.decay(inactive_since, rate, guild_id or None))
+
+    async def __season(self, payload: bytes) -> bytes:
+        guild_id, = _COUNT.unpack_from(payload)
+        return _COUNT.pack(await self.db.reset_season(guild_id, payload[_COUNT.size:].decode() or None))
+
+
+class _ExpServiceClient(_DatabaseInteractions):
+    """
+    The client mode of the database interactions, everything is forwarded to an exp service.
+
+    This allows several bot processes to share one database. The level calculations are still done locally, so every
+    process needs the same level curve.
+    """
+
+    def __init__(self, logging: PrintHandler, socket_path: str, curve: Optional[_LevelCurve] = None,
+                 timeout: float = 10.0, user_cache_size: int = 10_000, user_cache_ttl: float = 5.0):
+        """
+        @param logging: The print handler of the bot.
+        @param socket_path: The path of the unix socket of the exp service.
+        @param curve: The level curve, the default quadratic curve if left empty.
+        @param timeout: The amount of seconds to wait for a reply.
+        @param user_cache_size: The amount of `rank` results which are cached, 0 to disable. Changes made by other
+                                processes are only noticed once an entry expires.
+        @param user_cache_ttl: The amount of seconds a cached `rank` result stays valid.
+        """
+        super().__init__(logging, curve=curve, rank_index=False, leaderboard_size=0, write_behind=False,
+                         user_cache_size=user_cache_size, user_cache_ttl=user_cache_ttl)
+        self.socket_path = socket_path
+        self.timeout = timeout
+
+        self.__writer: Optional[StreamWriter] = None
+        self.__receiver: Optional[Task] = None
+        self.__pending: Dict[int, Future] = {}
+        self.__last_id = 0
+        self.__connect_lock = Lock()
+        self.__write_lock = Lock()
+
+    async def open(self) -> None:
+        async with self.__connect_lock:
+            if self.__writer is not None:
+                return
+
+            try:
+                reader, self.__writer = await open_unix_connection(self.socket_path)
+            except OSError as e:
+                raise _ServiceError(f"Could not connect to the exp service at `{self.socket_path}`. ({e})")
+
+            self.__receiver = ensure_future(self.__receive(reader))
+            self.log.info(f"[EXP] Connected to the exp service at `{self.socket_path}`.")
+
+    async def close(self) -> None:
+        if self.__writer is not None:
+            self.__writer.close()
+        if self.__receiver is not None:
+            self.__receiver.cancel()
+
+    async def __receive(self, reader: StreamReader) -> None:
+        error = _ServiceError("The connection to the exp service was closed.")
+        try:
+            while True:
+                length, op, request_id = _FRAME.unpack(await reader.readexactly(_FRAME.size))
+                payload = await reader.readexactly(length)
+
+                future = self.__pending.pop(request_id, None)
+                if future is None or future.done():
+                    continue
+
+                if op == _OP_ERROR:
+                    future.set_exception(_ServiceError(payload.decode()))
+                else:
+                    future.set_result(payload)
+        except (IncompleteReadError, ConnectionError) as e:
+            error = _ServiceError(f"Lost the connection to the exp service. ({e})")
+            self.log.warn(f"[EXP] {error}")
+        finally:
+            # The next request reconnects.
+            self.__writer = None
+            for future in self.__pending.values():
+                if not future.done():
+                    future.set_exception(error)
+            self.__pending.clear()
+
+    async def __request(self, op: int, payload: bytes = b"", job: bool = False) -> bytes:
+        """
+        Send a request and wait for the reply.
+
+        @param job: Whether or not the request starts a job which takes a while, those aren't timed out.
+        """
+        if self.__writer is None:
+            await self.open()
+        writer = self.__writer
+
+        request_id = self.__last_id = (self.__last_id + 1) & 0xFFFFFFFF
+        future = self.__pending[request_id] = get_event_loop().create_future()
+
+        try:
+            async with self.__write_lock:
+                writer.write(_FRAME.pack(len(payload), op, request_id) + payload)
+                await writer.drain()
+
+            return await wait_for(future, None if job else self.timeout)
+        except TimeoutError:
+            raise _ServiceError("The exp service didn't reply in time.")
+        except ConnectionError as e:
+            raise _ServiceError(f"Lost the connection to the exp service. ({e})")
+        finally:
+            self.__pending.pop(request_id, None)
+
+    async def flush(self) -> None:
+        await self.__request(_OP_FLUSH)
+
+    async def add_experience(self, guild_id: int, user_id: int, experience: int) -> int:
+        self.users.invalidate((guild_id, user_id))
+        return _COUNT.unpack(await self.__request(_OP_ADD, _ADD.pack(guild_id, user_id, experience)))[0]
+
+    async def get_rank(self, guild_id: int, user_id: int) -> Tuple[int, int, int]:
+        return _RANK.unpack(await self.__request(_OP_RANK, _MEMBER.pack(guild_id, user_id)))
+
+    async def get_position(self, guild_id: int, exp: int) -> int:
+        return _COUNT.unpack(await self.__request(_OP_POSITION, _POSITION.pack(guild_id, exp)))[0]
+
+    async def get_page_keys(self, guild_id: int, page: int, size: int = 10) -> List[Tuple[int, int]]:
+        if not 0 < page <= _MAX_UINT or not 0 < size <= _MAX_UINT:
+            raise ValueError(f"The page `{page}` of `{size}` members can't be requested from the exp service.")
+        return list(_PAIR.iter_unpack(await self.__request(_OP_PAGE, _PAGE.pack(guild_id, page, size))))
+
+    async def read_chunk(self, guild_id: int, after: int, limit: int) -> List[Tuple[int, int]]:
+        return list(_PAIR.iter_unpack(await self.__request(_OP_CHUNK, _CHUNK.pack(guild_id, after, limit))))
+
+    async def export_rows(self, guild_id: Optional[int] = None,
+                          chunk_size: int = 1000) -> AsyncIterator[List[Tuple[int, int, int]]]:
+        if guild_id is None:
+            raise _ServiceError("Only a single guild can be exported through the exp service.")
+
+        async for chunk in self.iter_guild(guild_id, chunk_size):
+            yield [(guild_id, user_id, exp) for user_id, exp in chunk]
+
+    async def import_rows(self, rows: Iterable[Tuple[int, int, int]], replace: bool = False,
+                          chunk_size: int = 1000) -> int:
+        raise _ServiceError("Imports aren't possible through the exp service, stop it and use the command line import.")
+
+    async def decay(self, inactive_since: float, rate: float, guild_id: Optional[int] = None, chunk_size: int = 5000,
+                    pause: float = 0.01) -> int:
+        # The service uses its own chunk size and pause.
+        payload = _DECAY.pack(guild_id or 0, inactive_since, rate)
+        return _COUNT.unpack(await self.__request(_OP_DECAY, payload, True))[0]
+
+    async def reset_season(self, guild_id: int, season: Optional[str] = None, chunk_size: int = 5000,
+                           pause: float = 0.01) -> int:
+        payload = _COUNT.pack(guild_id) + (season or "").encode()
+        return _COUNT.unpack(await self.__request(_OP_SEASON, payload, True))[0]
+
+
+class _EarnPolicy:
+    """
+    Decides whether a message earns exp, before anything touches the database.
+
+    Every member who sent a message recently has one `(last_award, last_seen, content_hash)` entry. The entries are
+    kept in the order they were last seen, so expired entries are always at the front and get evicted in one sweep.
+    """
+
+    def __init__(self, cooldown: float = 0.0, min_length: int = 0, ignore_duplicates: bool = False,
+                 duplicate_window: float = 60.0, excluded_channels: Iterable[int] = (),
+                 channel_multipliers: Optional[Dict[int, float]] = None, evict_interval: float = 60.0):
+        """
+        @param cooldown: The amount of seconds after an award in which a member can't earn exp again.
+        @param min_length: The minimum amount of characters a message needs to earn exp.
+        @param ignore_duplicates: Whether or not a message identical to the previous message of the member is ignored.
+        @param duplicate_window: The amount of seconds in which a repeated message counts as a duplicate.
+        @param excluded_channels: The channels in which no exp can be earned.
+        @param channel_multipliers: Multiplies the earned exp per channel.
+        @param evict_interval: The minimum amount of seconds between two eviction sweeps.
+        """
+        self.cooldown = cooldown
+        self.min_length = min_length
+        self.ignore_duplicates = ignore_duplicates
+        self.duplicate_window = duplicate_window
+        self.excluded_channels = frozenset(excluded_channels)
+        self.channel_multipliers = channel_multipliers or {}
+        self.evict_interval = evict_interval
+
+        # Entries only matter as long as either the cooldown or the duplicate window applies.
+        self.__ttl = max(cooldown, duplicate_window if ignore_duplicates else 0)
+        self.__entries: Dict[_MemberKey, Tuple[float, float, int]] = {}
+        self.__last_eviction = monotonic()
+
+        self.awarded = 0
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def __evict(self, now: float) -> None:
+        self.__last_eviction = now
+        expired = now - self.__ttl
+        stale = []
+
+        for key, (_, last_seen, _) in self.__entries.items():
+            if last_seen > expired:
+                break
+            stale.append(key)
+
+        for key in stale:
+            del self.__entries[key]
+
+    def award(self, message: Message, earned: int) -> int:
+        """
+        Apply the policy to a message.
+
+        @param message: The message which was sent.
+        @param earned: The exp the message would earn without the policy.
+
+        @return: The exp the message earns, 0 if the award was dropped.
+        """
+        if message.channel.id in self.excluded_channels or len(message.content.strip()) < self.min_length:
+            self.dropped += 1
+            return 0
+
+        earned = round(earned * self.channel_multipliers.get(message.channel.id, 1))
+
+        if self.__ttl > 0:
+            now = monotonic()
+            if now - self.__last_eviction >= self.evict_interval:
+                self.__evict(now)
+
+            key = (message.guild.id, message.author.id)
+            content_hash = hash(message.content) if self.ignore_duplicates else 0
+            last_award, last_seen, last_hash = self.__entries.pop(key, (float("-inf"), float("-inf"), None))
+
+            if now - last_award < self.cooldown or (
+                    self.ignore_duplicates and content_hash == last_hash and now - last_seen < self.duplicate_window):
+                earned = 0
+
+            # Re-inserting keeps the entries ordered by `last_seen`.
+            self.__entries[key] = (now if earned > 0 else last_award, now, content_hash)
+
+        if earned <= 0:
+            self.dropped += 1
+            return 0
+
+        self.awarded += 1
+        return earned
+
+
+# Every extension carries the same copy of this helper, tests/test_shared_helpers.py keeps them in sync.
+class _RateLimiter:
+    """
+    Token bucket which allows `rate` calls per `per` seconds.
+    """
+
+    def __init__(self, rate: int, per: float):
+        self.rate = rate
+        self.per = per
+        self.__tokens = float(rate)
+        self.__updated = monotonic()
+
+    async def acquire(self) -> None:
+        """
+        Wait until a call is allowed.
+        """
+        while True:
+            now = monotonic()
+            self.__tokens = min(self.rate, self.__tokens + (now - self.__updated) * self.rate / self.per)
+            self.__updated = now
+
+            if self.__tokens >= 1:
+                self.__tokens -= 1
+                return
+
+            await sleep((1 - self.__tokens) * self.per / self.rate)
 
 
-class _DatabaseInteractions:
-    """Handles everything which relates with the data of the exp system."""
+class _Dispatcher(ABC):
+    """
+    Processes jobs of members in the background.
 
-    def __init__(self, logging: PrintHandler):
-        self.log = logging
+    Jobs wait in a bounded queue, a job for a member who is already queued is merged into the queued job. The workers
+    respect a rate limit per target and retry failed jobs with an exponential back off, so bursts never block the
+    message handler.
+    """
 
-    def __check_db_file(self):
+    # Used in the log messages.
+    name = "job"
+
+    def __init__(self, logging: PrintHandler, deliver: Callable[[Any], Awaitable[Any]], max_queue: int = 1000,
+                 workers: int = 2, rate: int = 5, per: float = 5.0, retries: int = 3, max_backoff: float = 30.0):
         """
-        Check whether the db folder exists or not, if it doesn't it creates one.
+        @param logging: The print handler of the bot.
+        @param deliver: Processes a single job.
+        @param max_queue: The amount of members that can have a queued job, new jobs are dropped after.
+        @param workers: The amount of jobs which can be processed at the same time.
+        @param rate: The amount of jobs per target within `per` seconds.
+        @param per: The rate limit window in seconds.
+        @param retries: The amount of times a failed job gets retried.
+        @param max_backoff: The maximum amount of seconds between two attempts.
+        """
+        self.log = logging
+        self.__deliver = deliver
+        self.workers = workers
+        self.rate = rate
+        self.per = per
+        self.retries = retries
+        self.max_backoff = max_backoff
+
+        self.__queue: Queue = Queue(max_queue)
+        self.__pending: Dict[_MemberKey, Any] = {}
+        self.__limiters: Dict[int, _RateLimiter] = {}
+        self.__tasks: List[Task] = []
+
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.failed = 0
+
+    @property
+    def depth(self) -> int:
+        return self.__queue.qsize()
+
+    def stats(self) -> Dict[str, int]:
+        return {"depth": self.depth, "sent": self.sent, "coalesced": self.coalesced, "dropped": self.dropped,
+                "failed": self.failed}
+
+    def start(self) -> None:
+        if not self.__tasks:
+            self.__tasks = [ensure_future(self.__work()) for _ in range(self.workers)]
+
+    def stop(self) -> None:
+        for task in self.__tasks:
+            task.cancel()
+        self.__tasks = []
+
+    @abstractmethod
+    def _target(self, job: Any) -> int:
+        """
+        The identifier of the object which the rate limit applies to.
         """
-        if not path.isdir("db"):
-            self.log.info("[DB] No existing `db` directory found, creating new one...")
-            mkdir("db", 0o777)
-            self.log.info("[DB] Successfully created new `db` directory.")
 
-    async def __execute_db(self, cb: Callable[[Connection], Awaitable[Any]], check_file: bool = True) -> Any:
+    @abstractmethod
+    def _merge(self, queued: Any, job: Any) -> None:
+        """
+        Merge a new job into the job which is already queued for the member.
         """
-        Execute something through a callback.
 
-        @param cb: Callback which will be invoked in the db.
-        @param check_file: Whether or not it should check the file, leave this at true unless you are initializing the
-                           database.
+    def _submit(self, key: _MemberKey, job: Any) -> bool:
+        """
+        Queue a job, this never waits.
 
-        @return: The result of the callback.
+        @return: Whether or not the job was queued or merged.
         """
-        self.__check_db_file()
+        queued = self.__pending.get(key)
 
-        if check_file and not isfile("db/exp_system.db"):
-            await self.__create_db()
+        if queued is not None:
+            self._merge(queued, job)
+            self.coalesced += 1
+            return True
 
-        async with connect("db/exp_system.db") as db:
-            db.row_factory = Row
-            return await cb(db)
+        if self.__queue.full():
+            if not self.dropped % 100:
+                self.log.warn(f"[EXP] The {self.name} queue is full, {self.dropped + 1} {self.name}(s) dropped so far.")
+            self.dropped += 1
+            return False
+
+        self.__pending[key] = job
+        self.__queue.put_nowait(key)
+        self.start()
+        return True
 
-    async def __create_db(self):
+    async def _submit_wait(self, key: _MemberKey, job: Any) -> None:
         """
-        Initialize a new database.
+        Queue a job, waiting for room in the queue instead of dropping it.
         """
+        queued = self.__pending.get(key)
 
-        async def helper(conn: Connection):
-            self.log.info("[DB] Creating users table...")
-            await conn.execute("CREATE TABLE users ("
-                               "    id INTEGER PRIMARY KEY,"
-                               "    exp INTEGER NOT NULL"
-                               ");")
-            await conn.commit()
-            self.log.info("[DB] Created users table!")
+        if queued is not None:
+            self._merge(queued, job)
+            self.coalesced += 1
+            return
 
-        await self.__execute_db(helper, False)
+        self.start()
+        # Jobs which are submitted while this one waits for room get merged into it.
+        self.__pending[key] = job
+        try:
+            await self.__queue.put(key)
+        except CancelledError:
+            # The key never reached the queue, so no worker would ever remove the entry.
+            del self.__pending[key]
+            raise
+
+    async def __attempt(self, job: Any) -> None:
+        target = self._target(job)
+        limiter = self.__limiters.get(target)
+        if limiter is None:
+            limiter = self.__limiters[target] = _RateLimiter(self.rate, self.per)
+
+        for attempt in range(self.retries + 1):
+            await limiter.acquire()
+            try:
+                await self.__deliver(job)
+                self.sent += 1
+                return
+            except (Forbidden, NotFound) as e:
+                # Retrying won't fix missing permissions or a deleted target.
+                self.log.warn(f"[EXP] Could not process a {self.name} for `{target}`. ({e})")
+                break
+            except HTTPException as e:
+                if attempt == self.retries:
+                    self.log.warn(f"[EXP] Giving up on a {self.name} for `{target}`. ({e})")
+                    break
+                await sleep(min(2 ** attempt, self.max_backoff))
+
+        self.failed += 1
+
+    async def __work(self) -> None:
+        while True:
+            key = await self.__queue.get()
+            # Removing the entry first makes new jobs of the member queue a new job.
+            job = self.__pending.pop(key)
+
+            try:
+                await self.__attempt(job)
+            except Exception as e:
+                self.failed += 1
+                self.log.warn(f"[EXP] Failed to process a {self.name}. ({e})")
 
-    @staticmethod
-    def convert_exp_to_level(exp: int) -> int:
+
+@dataclass
+class _LevelUp:
+    # The channel in which the notification will be sent.
+    channel: TextChannel
+    # The member who leveled up.
+    member: Member
+    # The highest level the member reached.
+    level: int
+    # The reward roles which were reached on the way.
+    roles: List[Role]
+
+
+class _NotificationDispatcher(_Dispatcher):
+    """
+    Sends level up notifications in the background, rate limited per channel.
+
+    Level ups of a member who is still waiting for a notification are merged into that notification.
+    """
+
+    name = "level up notification"
+
+    def _target(self, job: _LevelUp) -> int:
+        return job.channel.id
+
+    def _merge(self, queued: _LevelUp, job: _LevelUp) -> None:
+        queued.level = max(queued.level, job.level)
+        queued.roles.extend(job.roles)
+
+    def notify(self, channel: TextChannel, member: Member, level: int, role: Optional[Role] = None) -> None:
         """
-        Converts a certain exp to the linked level.
+        Queue a level up notification, this never waits.
 
-        @param exp: The exp to be linked.
+        @param channel: The channel in which the notification will be sent.
+        @param member: The member who leveled up.
+        @param level: The new level of the member.
+        @param role: The reward role of the new level.
         """
-        return int(sqrt(exp) / 1.5 - 1)
+        self._submit((member.guild.id, member.id), _LevelUp(channel, member, level, [role] if role else []))
+
+
+@dataclass
+class _RoleGrant:
+    # The member who should receive the roles.
+    member: Member
+    # The level which the roles were calculated for.
+    level: int
+    # The reward roles which the member is missing.
+    roles: List[Role]
+
+
+class _RoleReconciler(_Dispatcher):
+    """
+    Gives members the reward roles of every level they have reached, rate limited per guild.
+
+    The desired roles are compared with the roles the member already has, so an API call only happens when a reward
+    is actually missing.
+    """
+
+    name = "role grant"
+
+    def _target(self, job: _RoleGrant) -> int:
+        return job.member.guild.id
+
+    def _merge(self, queued: _RoleGrant, job: _RoleGrant) -> None:
+        queued.level = max(queued.level, job.level)
+        queued.roles.extend(role for role in job.roles if role not in queued.roles)
 
     @staticmethod
-    def convert_level_to_exp(level: int) -> float:
+    def missing(member: Member, rewards: Dict[int, Role], level: int) -> List[Role]:
         """
-        Converts a certain level to the linked exp which is required for the level.
+        The reward roles up to a level which a member doesn't have yet.
 
-        @param level: The level to be linked.
+        @param member: The member whom should be checked.
+        @param rewards: The reward roles of the guild of the member, by level.
+        @param level: The level of the member.
         """
-        return ((level + 1) * 1.5) ** 2
+        current = {role.id for role in member.roles}
+        return [role for lvl, role in rewards.items() if lvl <= level and role.id not in current]
 
-    def __convert_to_user(self, user_id: int, exp: int, pos: int, total: int):
+    def reconcile(self, member: Member, rewards: Dict[int, Role], level: int) -> bool:
         """
-        Converts a user to an user object, and performs the EXP and level calculations.
+        Queue the missing reward roles of a member, this never waits.
 
-        @param user_id: The discord user identifier.
-        @param exp: The exp the user currently holds.
-        @param pos: The position of the user compared to the server.
-        @param total: The total number of registered users.
+        @return: Whether or not a grant was queued.
         """
-        lvl = self.convert_exp_to_level(exp)
-        exp_next = self.convert_level_to_exp(lvl + 1)
-        return _User(user_id, intword(exp), intword(exp_next), lvl, intword(int(exp_next - exp)), pos, total)
+        roles = self.missing(member, rewards, level)
+        return bool(roles) and self._submit((member.guild.id, member.id), _RoleGrant(member, level, roles))
 
-    def convert_to_baseuser(self, user_id: int, exp: int):
+    async def reconcile_wait(self, member: Member, rewards: Dict[int, Role], level: int) -> bool:
         """
-        Converts a user to an user object, and performs the EXP and level calculations.
+        Queue the missing reward roles of a member, waiting for room in the queue.
 
-        @param user_id: The discord user identifier.
-        @param exp: The exp the user currently holds.
+        @return: Whether or not a grant was queued.
         """
-        lvl = self.convert_exp_to_level(exp)
-        exp_next = self.convert_level_to_exp(lvl + 1)
-        return _BaseUser(user_id, intword(exp), intword(exp_next), lvl, intword(int(exp_next - exp)))
+        roles = self.missing(member, rewards, level)
+        if roles:
+            await self._submit_wait((member.guild.id, member.id), _RoleGrant(member, level, roles))
+        return bool(roles)
+
+
+@dataclass
+class ExpAwarded:
+    guild_id: int
+    user_id: int
+    # The exp which was earned.
+    amount: int
+    # The exp of the member after earning it.
+    exp: int
+
+
+@dataclass
+class LevelChanged:
+    guild_id: int
+    user_id: int
+    old_level: int
+    new_level: int
+
+
+@dataclass
+class RewardRoleGranted:
+    guild_id: int
+    user_id: int
+    # The level which the roles were given for.
+    level: int
+    role_ids: List[int]
+
 
-    async def get_user_data(self, user_id: int) -> _User:
+@dataclass
+class LeaderboardPositionChanged:
+    guild_id: int
+    user_id: int
+    # The previous position, `None` if the member wasn't ranked yet.
+    old_position: Optional[int]
+    new_position: int
+
+
+class _Subscription:
+    """
+    Delivers the events of one subscriber from a bounded queue, so a slow subscriber only delays itself.
+    """
+
+    def __init__(self, logging: PrintHandler, callback: Callable[[Any], Awaitable[Any]], types: Tuple[type, ...],
+                 max_queue: int, batch_size: int, batch_delay: float):
+        self.log = logging
+        self.callback = callback
+        self.types = types
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+
+        self.__queue: Queue = Queue(max_queue)
+        self.__task: Optional[Task] = None
+
+        self.delivered = 0
+        self.dropped = 0
+        self.failed = 0
+
+    @property
+    def depth(self) -> int:
+        return self.__queue.qsize()
+
+    def put(self, event: Any) -> bool:
         """
-        Fetch the data from a user and calculate the appropriate values.
+        Queue an event, it is dropped if the queue is full.
 
-        @param user_id: The discord user identifier.
+        @return: Whether or not the event was queued.
         """
-        self.log.info(f"[DB] Fetching experience data from `{user_id}`")
+        if self.__queue.full():
+            if not self.dropped % 100:
+                self.log.warn(f"[EXP] The event queue of `{getattr(self.callback, '__qualname__', self.callback)}` "
+                              f"is full, {self.dropped + 1} event(s) dropped so far.")
+            self.dropped += 1
+            return False
+
+        self.__queue.put_nowait(event)
+        if self.__task is None:
+            self.__task = ensure_future(self.__run())
+        return True
+
+    def stop(self) -> None:
+        if self.__task is not None:
+            self.__task.cancel()
+            self.__task = None
+
+    async def __run(self) -> None:
+        while True:
+            events = [await self.__queue.get()]
+            if self.batch_size:
+                # Give the batch some time to fill up.
+                if self.batch_delay:
+                    await sleep(self.batch_delay)
+                while len(events) < self.batch_size and not self.__queue.empty():
+                    events.append(self.__queue.get_nowait())
+
+            try:
+                await self.callback(events if self.batch_size else events[0])
+                self.delivered += len(events)
+            except Exception as e:
+                self.failed += len(events)
+                self.log.warn(f"[EXP] An event subscriber failed to process {len(events)} event(s). ({e})")
+
+
+class _EventBus:
+    """
+    Publishes the events of the exp system to the subscribers in the same process.
 
-        async def helper(conn: Connection):
-            curr = await conn.execute("SELECT exp FROM users WHERE id = ?", (user_id,))
-            _exp = tuple(await curr.fetchone() or 0)[0]
+    Publishing never waits, every subscriber has its own bounded queue and worker. Other extensions subscribe through
+    `bot.get_cog("ExpSystem").events`.
+    """
 
-            # Fetch the current user their position compared to all registered users.
-            curr = await conn.execute(
-                "SELECT COUNT(*) FROM users WHERE exp < (SELECT exp FROM users WHERE id = ?) ORDER BY exp DESC;",
-                (user_id,))
-            _pos = tuple(await curr.fetchone() or 0)[0] + 1
+    def __init__(self, logging: PrintHandler):
+        """
+        @param logging: The print handler of the bot.
+        """
+        self.log = logging
+        self.subscriptions: List[_Subscription] = []
+        self.__by_type: Dict[type, List[_Subscription]] = {}
+        self.published = 0
+        self.dropped = 0
 
-            curr = await conn.execute("SELECT COUNT(*) FROM users;")
-            _total_pos = tuple(await curr.fetchone() or 0)[0]
+    def subscribe(self, callback: Callable[[Any], Awaitable[Any]], *types: type, max_queue: int = 1000,
+                  batch_size: int = 0, batch_delay: float = 0.0) -> _Subscription:
+        """
+        Deliver events to a coroutine function.
 
-            return _exp, _pos, _total_pos
+        @param callback: Invoked with every event, or with a list of events if `batch_size` is set.
+        @param types: The event types to receive, every event type if left empty.
+        @param max_queue: The amount of events which can wait for the subscriber, new events are dropped after.
+        @param batch_size: The maximum amount of events per invocation, 0 delivers the events one by one.
+        @param batch_delay: The amount of seconds to wait for more events before a batch is delivered.
 
-        return self.__convert_to_user(user_id, *await self.__execute_db(helper))
+        @return: The subscription, which can be passed to `unsubscribe`.
+        """
+        types = types or (ExpAwarded, LevelChanged, RewardRoleGranted, LeaderboardPositionChanged)
+        subscription = _Subscription(self.log, callback, types, max_queue, batch_size, batch_delay)
+        self.subscriptions.append(subscription)
+        for event_type in types:
+            self.__by_type.setdefault(event_type, []).append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: _Subscription) -> None:
+        """
+        Stop delivering events to a subscriber, queued events are discarded.
+        """
+        if subscription in self.subscriptions:
+            self.subscriptions.remove(subscription)
+            for event_type in subscription.types:
+                self.__by_type[event_type].remove(subscription)
+        subscription.stop()
 
-    async def add_experience(self, user_id: int, experience: int) -> None:
+    def wants(self, event_type: type) -> bool:
+        """
+        Whether or not anyone subscribed to an event type, so events which nobody receives aren't created.
         """
-        Give a user experience.
+        return bool(self.__by_type.get(event_type))
 
-        @param user_id: The discord user identifier.
-        @param experience: The experience which the user has gained.
+    def publish(self, event: Any) -> None:
+        """
+        Queue an event for its subscribers, this never waits.
         """
-        self.log.info(f"[DB] Adding `{experience}` experience to `{user_id}`")
+        subscriptions = self.__by_type.get(type(event))
+        if subscriptions:
+            self.published += 1
+            for subscription in subscriptions:
+                if not subscription.put(event):
+                    self.dropped += 1
 
-        async def helper(conn: Connection):
-            curr = await conn.execute("SELECT exp FROM users WHERE id = ?", (user_id,))
-            res = await curr.fetchone()
-            stmt = "UPDATE users SET exp = exp + ? WHERE id = ?" if res \
-                else "INSERT INTO users (exp, id) VALUES (?, ?)"
+    @property
+    def depth(self) -> int:
+        return sum(subscription.depth for subscription in self.subscriptions)
 
-            await conn.execute(stmt, (experience, user_id))
-            await conn.commit()
+    def stop(self) -> None:
+        for subscription in self.subscriptions:
+            subscription.stop()
 
-            return tuple(res)[0] if res else 0
 
-        return await self.__execute_db(helper)
+# Every extension carries the same copy of this helper, tests/test_shared_helpers.py keeps them in sync.
+class _Metrics:
+    """
+    Counters and latency histograms of an extension.
+
+    The metrics get registered in `bot.extension_metrics`, from where the metrics exporter extension renders them.
+    """
+
+    # The upper bounds in seconds of the latency histogram buckets.
+    buckets = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
 
-    async def get_top(self, amount: int) -> List[_BaseUser]:
+    def __init__(self, namespace: str):
         """
-        Returns the top x users by exp.
+        @param namespace: The prefix of every metric name.
+        """
+        self.namespace = namespace
+        self.counters: Dict[str, int] = {}
+        # Maps a name to the (non cumulative) bucket counts, with a last `+Inf` bucket, and the sum of the observations.
+        self.histograms: Dict[str, Tuple[List[int], List[float]]] = {}
+        # Maps a name to the kind (`counter` or `gauge`) and a callable which reads the current value.
+        self.callbacks: Dict[str, Tuple[str, Callable[[], float]]] = {}
+
+    def register(self, bot) -> None:
+        if not hasattr(bot, "extension_metrics"):
+            bot.extension_metrics = {}
+        bot.extension_metrics[self.namespace] = self
 
-        @param amount: The amount of users that have to be fetched.
+    def unregister(self, bot) -> None:
+        getattr(bot, "extension_metrics", {}).pop(self.namespace, None)
+
+    def inc(self, name: str, amount: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def track(self, name: str, value: Callable[[], float], kind: str = "gauge") -> None:
         """
-        self.log.info(f"[DB] Fetching top `{amount}` members!")
+        Expose a value which is already kept somewhere else.
+        """
+        self.callbacks[name] = (kind, value)
 
-        async def helper(conn: Connection):
-            curr = await conn.execute("SELECT id, exp FROM users ORDER BY exp DESC LIMIT ?;", (amount,))
-            return map(tuple, await curr.fetchall())
+    def observe(self, name: str, seconds: float) -> None:
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = ([0] * (len(self.buckets) + 1), [0.0])
 
-        return list(map(lambda usr: self.convert_to_baseuser(*usr), await self.__execute_db(helper)))
+        histogram[0][bisect_left(self.buckets, seconds)] += 1
+        histogram[1][0] += seconds
+
+    @contextmanager
+    def timed(self, name: str) -> Iterator[None]:
+        """
+        Observe the duration of the block, failures are also counted in the `{name}_errors` counter.
+        """
+        start = perf_counter()
+        try:
+            yield
+        except Exception:
+            self.inc(f"{name}_errors")
+            raise
+        finally:
+            self.observe(name, perf_counter() - start)
 
 
 class ExpSystem(Cog):
@@ -233,90 +3159,344 @@ class ExpSystem(Cog):
             self.cfg = None
             self.bot.ph.warn("`LEVELING` section missing in `config.cfg`, disabling certain features.")
 
+        # The guild of the old single guild configuration, the data and flat `exp_roles` belong to this guild.
+        self._legacy_guild: Optional[int] = self._get_cfg("notifications_guild", None)
+
+        self._channel_ids: Dict[int, int] = self._get_cfg("notifications_channels", {}, self.__parse_guild_map)
+        legacy_channel = self._get_cfg("notifications_channel", None)
+        if self._legacy_guild and legacy_channel:
+            self._channel_ids.setdefault(self._legacy_guild, legacy_channel)
+
+        if not self._channel_ids:
+            self.bot.ph.warn("`notifications_channels` (or `notifications_guild` and `notifications_channel`) is "
+                             "missing/mis-configured in the `LEVELING` section in `config.cfg`. This disables the "
+                             "level up notifications.")
+
+        self._role_ids: Dict[int, Dict[int, int]] = self.__parse_roles(config.exp_roles.exp_roles)
+
+        self.policy = _EarnPolicy(cooldown=self._get_cfg("cooldown", 0, float),
+                                  min_length=self._get_cfg("min_message_length", 0),
+                                  ignore_duplicates=self._get_cfg("ignore_duplicates", False, strtobool),
+                                  duplicate_window=self._get_cfg("duplicate_window", 60, float),
+                                  excluded_channels=self._get_cfg("excluded_channels", (), self.__parse_ids),
+                                  channel_multipliers=self._get_cfg("channel_multipliers", {},
+                                                                    self.__parse_multipliers))
+
+        self.notifications = _NotificationDispatcher(self.bot.ph, self.__send_levelup,
+                                                     max_queue=self._get_cfg("notification_queue_size", 1000),
+                                                     workers=self._get_cfg("notification_workers", 2),
+                                                     rate=self._get_cfg("notification_rate", 5),
+                                                     per=self._get_cfg("notification_per", 5, float),
+                                                     retries=self._get_cfg("notification_retries", 3))
+        self.rewards = _RoleReconciler(self.bot.ph, self.__grant_roles,
+                                       max_queue=self._get_cfg("role_queue_size", 1000),
+                                       workers=self._get_cfg("role_workers", 2),
+                                       rate=self._get_cfg("role_rate", 10),
+                                       per=self._get_cfg("role_per", 10, float),
+                                       retries=self._get_cfg("role_retries", 3))
+        # Other extensions subscribe to the exp events through `bot.get_cog("ExpSystem").events`.
+        self.events = _EventBus(self.bot.ph)
+
+        # These get resolved to the discord objects once the bot is ready.
+        self.notification_channels: Dict[int, TextChannel] = {}
+        self.roles: Dict[int, Dict[int, Role]] = {}
+
         try:
-            self._notifications_guild = int(self.cfg.get("notifications_guild"))
-            self.notifications_channel = int(self.cfg.get("notifications_channel"))
-        except (AttributeError, ValueError):
-            self.notifications_channel = None
+            curve = _LevelCurve(self._get_cfg("level_curve", "quadratic", str),
+                                max_level=self._get_cfg("max_level", 10_000),
+                                factor=self._get_cfg("level_curve_factor", "2.25", str),
+                                step=self._get_cfg("level_curve_step", 100),
+                                table=self._get_cfg("level_curve_table", None,
+                                                    lambda v: [int(t) for t in v.split(",") if t.strip()]))
+        except ValueError as e:
+            self.bot.ph.warn(f"Invalid level curve in the `LEVELING` section ({e}), using the default curve.")
+            curve = _LevelCurve()
+
+        # The unix socket of the exp service, the database gets opened by this process if left empty.
+        self._service: Optional[str] = self._get_cfg("service_socket", None, str)
+        if self._service:
+            self.db = _ExpServiceClient(self.bot.ph, self._service, curve,
+                                        timeout=self._get_cfg("service_timeout", 10, float),
+                                        user_cache_size=self._get_cfg("user_cache_size", 10_000),
+                                        user_cache_ttl=self._get_cfg("user_cache_ttl", 5, float))
+        else:
+            store_options = dict(legacy_guild=self._legacy_guild,
+                                 snapshot_interval=self._get_cfg("snapshot_interval", 10_000),
+                                 journal_sync=self._get_cfg("journal_sync", False, strtobool),
+                                 read_pool_size=self._get_cfg("read_pool_size", 2),
+                                 cache_size=self._get_cfg("cache_size", 8192),
+                                 cached_statements=self._get_cfg("cached_statements", 128))
+            try:
+                store = _create_store(self.bot.ph, self._get_cfg("storage", "sqlite", str).lower(),
+                                      self._get_cfg("storage_file", None, str), **store_options)
+            except ValueError as e:
+                self.bot.ph.warn(f"Invalid storage in the `LEVELING` section ({e}), using sqlite.")
+                store = _create_store(self.bot.ph, **store_options)
+
+            self.db = _DatabaseInteractions(self.bot.ph,
+                                            curve=curve,
+                                            store=store,
+                                            rank_index=self._get_cfg("rank_index", True, strtobool),
+                                            leaderboard_size=self._get_cfg("leaderboard_size", 100),
+                                            page_cursor_ttl=self._get_cfg("page_cursor_ttl", 60),
+                                            write_behind=self._get_cfg("write_behind", True, strtobool),
+                                            flush_interval=self._get_cfg("flush_interval", 1000) / 1000,
+                                            flush_size=self._get_cfg("flush_size", 500),
+                                            max_staleness=self._get_cfg("max_staleness", 10000) / 1000,
+                                            log_sample_rate=self._get_cfg("log_sample_rate", 0, float),
+                                            user_cache_size=self._get_cfg("user_cache_size", 10_000),
+                                            user_cache_ttl=self._get_cfg("user_cache_ttl", 5, float),
+                                            on_rewrite=self.__exp_rewritten)
+
+        # Members who haven't earned exp for `decay_after` days lose `decay_rate` percent every `decay_interval` hours.
+        self.decay_after: float = self._get_cfg("decay_after", 0, float) * 86400
+        self.decay_rate: float = min(max(self._get_cfg("decay_rate", 10, float), 0), 100) / 100
+        self.decay_interval: float = self._get_cfg("decay_interval", 24, float) * 3600
+        self.__decay_task: Optional[Task] = None
+
+        self.metrics = _Metrics("exp_system")
+        self.metrics.track("messages_awarded", lambda: self.policy.awarded, "counter")
+        self.metrics.track("messages_dropped", lambda: self.policy.dropped, "counter")
+        self.metrics.track("buffered_members", lambda: self.db.buffer.pending if self.db.buffer else 0)
+        for dispatcher, prefix in ((self.notifications, "notification"), (self.rewards, "role_grant")):
+            self.metrics.track(f"{prefix}_queue_depth", lambda d=dispatcher: d.depth)
+            for stat in ("sent", "coalesced", "dropped", "failed"):
+                self.metrics.track(f"{prefix}s_{stat}", lambda d=dispatcher, s=stat: getattr(d, s), "counter")
+        self.metrics.track("events_published", lambda: self.events.published, "counter")
+        self.metrics.track("events_dropped", lambda: self.events.dropped, "counter")
+        self.metrics.track("event_queue_depth", lambda: self.events.depth)
+        self.metrics.track("user_cache_hits", lambda: self.db.users.hits, "counter")
+        self.metrics.track("user_cache_misses", lambda: self.db.users.misses, "counter")
+        self.metrics.track("user_cache_size", lambda: len(self.db.users))
+        self.metrics.register(self.bot)
+
+    def __parse_roles(self, exp_roles: dict) -> Dict[int, Dict[int, int]]:
+        """
+        Group the reward roles of `exp_roles.py` by guild.
+
+        @param exp_roles: Either maps levels to role ids, or guild ids to such a mapping.
+        """
+        if exp_roles and all(isinstance(roles, dict) for roles in exp_roles.values()):
+            return {int(guild): dict(roles) for guild, roles in exp_roles.items()}
 
-        if not self.cfg or not self.notifications_channel:
-            self.bot.ph.warn("`notifications_channel` or `notifications_guild` is missing/mis-configured in the "
-                             "`LEVELING` section in `config.cfg`.  This disables the level up notifications.")
+        if exp_roles and self._legacy_guild:
+            return {self._legacy_guild: dict(exp_roles)}
 
-        self.roles = exp_roles
+        if exp_roles:
+            self.bot.ph.warn("`exp_roles.py` doesn't contain guild ids and `notifications_guild` is missing, so no "
+                             "role rewards will be given.")
+        return {}
 
-        self.db = _DatabaseInteractions(self.bot.ph)
+    def __resolve_roles(self) -> None:
+        """
+        Fetch the role objects of the configured reward roles.
+        """
+        self.roles = {}
+        for guild_id, role_ids in self._role_ids.items():
+            guild = self.bot.get_guild(guild_id)
+            if guild is None:
+                self.bot.ph.warn(f"Guild `{guild_id}` from the `exp_roles.py` file could not be found, so no roles "
+                                 f"shall be given in that guild.")
+                continue
+
+            usable = {}
+            for lvl, role in role_ids.items():
+                fetched = get(guild.roles, id=role)
+                if fetched is None:
+                    self.bot.ph.warn(f"Role with id `{role}` could not be found in guild `{guild.name}` (`{guild.id}`), "
+                                     f"so no role shall be given for level {lvl}. Please check the `exp_roles.py` file "
+                                     f"contents.")
+                    continue
+
+                usable[lvl] = fetched
+
+            self.roles[guild_id] = usable
+
+    @staticmethod
+    def __parse_ids(value: str) -> List[int]:
+        """
+        Parse a `id, id` config value.
+        """
+        return [int(item) for item in value.split(",") if item.strip()]
+
+    @staticmethod
+    def __parse_multipliers(value: str) -> Dict[int, float]:
+        """
+        Parse a `channel_id:multiplier, channel_id:multiplier` config value.
+        """
+        result = {}
+        for pair in value.split(","):
+            if pair.strip():
+                channel_id, multiplier = pair.split(":")
+                result[int(channel_id)] = float(multiplier)
+        return result
+
+    @staticmethod
+    def __parse_guild_map(value: str) -> Dict[int, int]:
+        """
+        Parse a `guild_id:value, guild_id:value` config value.
+        """
+        result = {}
+        for pair in value.split(","):
+            if pair.strip():
+                guild_id, item = pair.split(":")
+                result[int(guild_id)] = int(item)
+        return result
+
+    def _get_cfg(self, key: str, fallback: Any, cast: Callable[[str], Any] = int) -> Any:
+        """
+        Fetch an optional value from the `LEVELING` section.
+
+        @param key: The name of the config value.
+        @param fallback: The value which gets used if the key is missing or invalid.
+        @param cast: Converts the raw config string.
+        """
+        if not self.cfg or self.cfg.get(key) is None:
+            return fallback
+
+        try:
+            return cast(self.cfg.get(key))
+        except ValueError:
+            self.bot.ph.warn(f"Invalid value for `{key}` in the `LEVELING` section, falling back to `{fallback}`.")
+            return fallback
+
+    def cog_unload(self):
+        self.metrics.unregister(self.bot)
+        if self.__decay_task is not None:
+            self.__decay_task.cancel()
+        self.notifications.stop()
+        self.rewards.stop()
+        self.events.stop()
+        self.bot.loop.create_task(self.db.close())
 
     @Cog.listener()
     async def on_ready(self):
-        if not self._notifications_guild:
-            self.bot.ph.warn("`notifications_guild` is missing, which is required for both role rewards and level up"
-                             " notifications. Both of these features have been disabled!")
-            return
+        try:
+            await self.db.open()
+        except _ServiceError as e:
+            self.bot.ph.warn(f"{e} Retrying on the next request.")
+
+        for guild_id, channel_id in self._channel_ids.items():
+            channel = self.bot.get_channel(channel_id)
+            if channel is None:
+                self.bot.ph.warn(f"Notification channel `{channel_id}` of guild `{guild_id}` could not be found, so no "
+                                 f"level up notifications will be sent in that guild.")
+                continue
 
-        self._notifications_guild = self.bot.get_guild(self._notifications_guild)
+            self.notification_channels[guild_id] = channel
 
-        if self.notifications_channel:
-            self.notifications_channel = self._notifications_guild.get_channel(self.notifications_channel)
+        self.__resolve_roles()
 
-        usable = {}
-        for lvl, role in self.roles.items():
-            fetched = get(self._notifications_guild.roles, id=role)
-            if fetched is None:
-                self.bot.ph.warn(f"Role with id `{role}` could not be found in guild `{self._notifications_guild.name}`"
-                                 f" (`{self._notifications_guild.id}`), so no role shall be given for level {lvl}. "
-                                 f"Please check the `exp_roles.py` file contents.")
-                continue
+        # With an exp service, the service runs the decay.
+        if self.decay_after > 0 and self.decay_interval > 0 and self.__decay_task is None and not self._service:
+            self.__decay_task = self.bot.loop.create_task(_run_decay(
+                self.db, self.bot.ph, self.decay_after, self.decay_rate, self.decay_interval,
+                lambda decayed: self.metrics.inc("decayed_members", decayed), **self.__maintenance_options()))
+
+    def __maintenance_options(self) -> Dict[str, Any]:
+        return {"chunk_size": self._get_cfg("maintenance_chunk_size", 5000),
+                "pause": self._get_cfg("maintenance_pause", 10) / 1000}
+
+    @Cog.listener()
+    async def on_disconnect(self):
+        # The bot might be shutting down, so persist everything that is still buffered.
+        if not self._service:
+            await self.db.flush()
+
+    async def __send_levelup(self, levelup: _LevelUp):
+        """
+        Send a (merged) level up notification, this is invoked by the notification dispatcher.
+        """
+        with self.metrics.timed("notification_send"):
+            await levelup.channel.send(
+                embed=await self.embed(
+                    levelup.channel,
+                    exp_system.get("levelup_message").format(author=levelup.member, lvl=levelup.level) +
+                    "".join(exp_system.get("levelup_message_role").format(role=role) for role in levelup.roles),
+                    get_embed=True),
+            )
+
+    async def __grant_roles(self, grant: _RoleGrant):
+        """
+        Give a member their missing reward roles, this is invoked by the role reconciler.
+        """
+        # The member might have received some of the roles while the grant was queued.
+        current = {role.id for role in grant.member.roles}
+        roles = [role for role in grant.roles if role.id not in current]
+
+        if roles:
+            with self.metrics.timed("role_grant"):
+                await grant.member.add_roles(*roles, reason=f"Leveled up to {grant.level}!")
+            self.metrics.inc("roles_granted", len(roles))
+            self.events.publish(RewardRoleGranted(grant.member.guild.id, grant.member.id, grant.level,
+                                                  [role.id for role in roles]))
+
+    def __exp_rewritten(self, changes: List[Tuple[int, int, int, int]]):
+        """
+        Publish the level changes of a chunk of a decay or a season reset, invoked by the database interactions.
+        """
+        if self.events.wants(LevelChanged):
+            levels = self.db.curve.transitions((old, new) for _, _, old, new in changes)
+            for (guild_id, user_id, _, _), (ori, lvl) in zip(changes, levels):
+                if ori != lvl:
+                    self.events.publish(LevelChanged(guild_id, user_id, ori, lvl))
+
+    def __publish_position(self, guild_id: int, user_id: int, old: int, new: int):
+        """
+        Publish the new leaderboard position of a member who earned exp, if it changed.
 
-            usable[lvl] = fetched
+        The positions are read from the in-memory rank index right away, the member might earn exp again before the
+        event is delivered.
+        """
+        ranks = self.db.ranks.get(guild_id)
+        if ranks is None:
+            return
 
-        self.roles = usable
+        position = ranks.count_above(new) + 1
+        # The member is counted at its new exp, which is above its old exp.
+        previous = ranks.count_above(old) if old > 0 else None
+        if position != previous:
+            self.events.publish(LeaderboardPositionChanged(guild_id, user_id, previous, position))
 
     @Cog.listener()
     async def on_message(self, message: Message):
-        if message.author.bot:
+        if message.author.bot or message.guild is None:
             return
 
-        earned = random.randint(1, 6)
-        exp: int = await self.db.add_experience(message.author.id, earned) or 0
+        earned = self.policy.award(message, random.randint(1, 6))
+        if not earned:
+            return
 
-        new = self.db.convert_exp_to_level(exp + earned)
+        with self.metrics.timed("add_experience"):
+            exp: int = await self.db.add_experience(message.guild.id, message.author.id, earned) or 0
+        self.metrics.inc("exp_awarded", earned)
+        if self.events.wants(ExpAwarded):
+            self.events.publish(ExpAwarded(message.guild.id, message.author.id, earned, exp + earned))
 
-        role_reward = self.roles.get(new)
+        # The positions are read from the in-memory rank index, without one there are no position events.
+        if self.db.rank_index and self.events.wants(LeaderboardPositionChanged):
+            self.__publish_position(message.guild.id, message.author.id, exp, exp + earned)
 
-        if self._notifications_guild and self.notifications_channel and (
-                not (new == 0 or new < 50 or new % 5 != 0) or role_reward):
-            ori = self.db.convert_exp_to_level(exp)
+        (ori, new), = self.db.curve.transitions([(exp, exp + earned)])
 
-            if ori < new:
-                async def send_levelup():
-                    try:
-                        await self.notifications_channel.send(
-                            embed=await self.embed(
-                                message.channel,
-                                exp_system.get("levelup_message").format(author=message.author, lvl=new) +
-                                exp_system.get("levelup_message_role").format(role=role_reward),
-                                get_embed=True),
-                        )
-                    except AttributeError:
-                        await sleep(0.5)
-                        await send_levelup()
-
-                await send_levelup()
-
-        if role_reward:
-            async def add_role(role):
-                if not isinstance(role, Role):
-                    role = self.roles.get(new)
-
-                if isinstance(self._notifications_guild, Guild) and isinstance(role, Role):
-                    return await message.author.add_roles(role, reason=f"Leveled up to {new}!")
-                await sleep(0.5)
-                await add_role(role)
-
-            await add_role(role_reward)
+        if ori >= new:
+            return
+
+        self.metrics.inc("level_ups")
+        self.events.publish(LevelChanged(message.guild.id, message.author.id, ori, new))
+
+        rewards = self.roles.get(message.guild.id)
+        role_reward = rewards.get(new) if rewards else None
+        notifications_channel = self.notification_channels.get(message.guild.id)
+
+        if notifications_channel and (not (new == 0 or new < 50 or new % 5 != 0) or role_reward):
+            self.notifications.notify(notifications_channel, message.author, new, role_reward)
+
+        if rewards:
+            self.rewards.reconcile(message.author, rewards, new)
 
     @commands.command(aliases=['lvl', 'level'])
+    @commands.guild_only()
     async def rank(self, ctx: Context, user: Member = None):
         """
         Retrieve the rank of a user.
@@ -334,12 +3514,14 @@ class ExpSystem(Cog):
         """
         user = user or ctx.author
         msg = await self.embed(ctx, exp_system.get("fetching"))
-        data = await self.db.get_user_data(ctx.author.id)
+        with self.metrics.timed("get_user_data"):
+            data = await self.db.get_user_data(ctx.guild.id, user.id)
         await msg.edit(embed=await self.embed(ctx, get_embed=True, color=user.top_role.color,
                                               title=exp_system.get("title").format(user=user),
                                               message=exp_system.get("message").format(user=user, data=data)))
 
-    @commands.command()
+    @commands.group(invoke_without_command=True)
+    @commands.guild_only()
     async def top(self, ctx: Context, amount: int = 10):
         """
         Fetch the top x members with the highest exp.
@@ -352,14 +3534,328 @@ class ExpSystem(Cog):
 
             // Get the top 15 members
             top 15
+
+            // Browse the leaderboard, page 40 shows positions 391 to 400
+            top page 40
         """
         if 1 <= amount <= exp_system.get("max_top", 25):
+            with self.metrics.timed("get_top"):
+                users = await self.db.get_top(ctx.guild.id, amount)
+
             return await self.embed(ctx, "\n".join(
-                [exp_system.get("top_line").format(idx=idx + 1, user=usr) for idx, usr in
-                 enumerate(await self.db.get_top(amount))]), title=exp_system.get("top_title"))
+                [exp_system.get("top_line").format(idx=idx + 1, user=usr) for idx, usr in enumerate(users)]),
+                                    title=exp_system.get("top_title"))
 
         await ctx.send(embed=await self.embed(ctx, exp_system.get("top_msg"), get_embed=True), delete_after=10)
 
+    @top.command(name="page")
+    async def top_page(self, ctx: Context, page: int = 1):
+        """
+        Browse the leaderboard page by page.
+
+        Default page is 1.
+
+        Usage examples:
+            // Get the second page
+            top page 2
+        """
+        size = self._get_cfg("page_size", 10)
+        with self.metrics.timed("get_page"):
+            pages = ceil(await self.db.get_member_count(ctx.guild.id) / size)
+            if 1 <= page <= pages:
+                users = await self.db.get_page(ctx.guild.id, page, size)
+            else:
+                users = []
+
+        if pages and page > pages:
+            return await ctx.send(embed=await self.embed(
+                ctx, exp_system.get("top_page_max", "There are only {pages} pages!").format(page=page, pages=pages),
+                get_embed=True), delete_after=10)
+
+        if not users:
+            return await ctx.send(embed=await self.embed(
+                ctx, exp_system.get("top_page_empty", "There are no members on page {page}!").format(page=page),
+                get_embed=True), delete_after=10)
+
+        await self.embed(ctx, "\n".join(
+            [exp_system.get("top_line").format(idx=(page - 1) * size + idx + 1, user=usr) for idx, usr in
+             enumerate(users)]),
+                         title=exp_system.get("top_page_title", "Top Users (page {page})").format(page=page))
+
+    @commands.group(invoke_without_command=True)
+    @commands.guild_only()
+    @commands.has_permissions(administrator=True)
+    async def expadmin(self, ctx: Context):
+        """
+        Administrative commands of the exp system.
+
+        Requires the administrator permission.
+
+        Usage examples:
+            // Give every member the reward roles they are missing
+            expadmin resync
+
+            // Back up the exp of every member
+            expadmin export
+
+            // Add the exp of the attached file
+            expadmin import
+
+            // Archive the current exp as `Season 1` and start over
+            expadmin season Season 1
+        """
+        await ctx.send_help(ctx.command)
+
+    @expadmin.command(name="resync")
+    async def expadmin_resync(self, ctx: Context):
+        """
+        Reload the `exp_roles.py` file and give every member the reward roles they are missing.
+
+        Usage examples:
+            expadmin resync
+        """
+        self._role_ids = self.__parse_roles(reload(config.exp_roles).exp_roles)
+        self.__resolve_roles()
+
+        rewards = self.roles.get(ctx.guild.id)
+        if not rewards:
+            return await self.embed(ctx, exp_system.get("resync_no_roles", "There are no reward roles configured for "
+                                                                           "this server!"))
+
+        msg = await self.embed(ctx, exp_system.get("resync_started", "Checking the reward roles of every member..."))
+        checked = queued = 0
+
+        async for chunk in self.db.iter_guild(ctx.guild.id, self._get_cfg("resync_chunk_size", 1000)):
+            for user_id, exp in chunk:
+                member = ctx.guild.get_member(user_id)
+                if member is None:
+                    continue
+
+                checked += 1
+                queued += await self.rewards.reconcile_wait(member, rewards, self.db.convert_exp_to_level(exp))
+
+        await msg.edit(embed=await self.embed(
+            ctx, exp_system.get("resync_finished", "Checked {checked} members, {queued} of them are receiving their "
+                                                   "missing roles.").format(checked=checked, queued=queued),
+            get_embed=True))
+
+    @expadmin.command(name="decay")
+    async def expadmin_decay(self, ctx: Context):
+        """
+        Decay the exp of the inactive members of this server now, instead of waiting for the next scheduled decay.
+
+        Usage examples:
+            expadmin decay
+        """
+        if self.decay_after <= 0:
+            return await self.embed(ctx, exp_system.get("decay_disabled", "Exp decay is not enabled!"))
+
+        msg = await self.embed(ctx, exp_system.get("decay_started", "Decaying the exp of inactive members..."))
+        decayed = await self.db.decay(time() - self.decay_after, self.decay_rate, ctx.guild.id,
+                                      **self.__maintenance_options())
+        self.metrics.inc("decayed_members", decayed)
+
+        await msg.edit(embed=await self.embed(
+            ctx, exp_system.get("decay_finished", "Decayed the exp of {count} inactive members.").format(count=decayed),
+            get_embed=True))
+
+    @expadmin.command(name="season")
+    async def expadmin_season(self, ctx: Context, *, name: str = None):
+        """
+        Reset the exp of every member of this server to start a new season.
+
+        The exp gets archived under the name of the season, which defaults to the current date.
+
+        Usage examples:
+            expadmin season
+            expadmin season Season 1
+        """
+        name = name or f"{datetime.utcnow():%Y-%m-%d}"
+        archive = self._get_cfg("season_archive", True, strtobool)
+
+        msg = await self.embed(ctx, exp_system.get("season_started", "Resetting the exp of every member..."))
+        reset = await self.db.reset_season(ctx.guild.id, name if archive else None, **self.__maintenance_options())
+
+        await msg.edit(embed=await self.embed(
+            ctx, exp_system.get("season_finished", "Season `{season}` has ended, the exp of {count} members has been "
+                                                   "reset.").format(season=name, count=reset),
+            get_embed=True))
+
+    def __transfer_dir(self, name: str) -> str:
+        """
+        A folder next to the database file, which gets created if it doesn't exist.
+        """
+        directory = path.join(path.dirname(self.db.store.file) if self.db.store.file else "db", name)
+        makedirs(directory, exist_ok=True)
+        return directory
+
+    @expadmin.command(name="export")
+    async def expadmin_export(self, ctx: Context, fmt: str = "csv"):
+        """
+        Export the exp of every member of this server to a `csv` or `jsonl` file.
+
+        The file is kept in the `exports` folder next to the database, and uploaded if it is small enough.
+
+        Usage examples:
+            expadmin export
+            expadmin export jsonl
+        """
+        if fmt not in ("csv", "jsonl"):
+            return await self.embed(ctx, exp_system.get("export_format", "The format has to be `csv` or `jsonl`!"))
+
+        file = path.join(self.__transfer_dir("exports"), f"exp_{ctx.guild.id}_{datetime.utcnow():%Y%m%d-%H%M%S}.{fmt}")
+        msg = await self.embed(ctx, exp_system.get("export_started", "Exporting the exp of every member..."))
+        count = await _export_file(self.db, file, ctx.guild.id, self._get_cfg("transfer_chunk_size", 1000))
+
+        await msg.edit(embed=await self.embed(
+            ctx, exp_system.get("export_finished", "Exported {count} members to `{file}`.").format(count=count,
+                                                                                                  file=file),
+            get_embed=True))
+
+        if path.getsize(file) <= ctx.guild.filesize_limit:
+            await ctx.send(file=File(file))
+
+    @expadmin.command(name="import")
+    async def expadmin_import(self, ctx: Context, mode: str = "add"):
+        """
+        Import the exp of an attached `csv` or `jsonl` file.
+
+        Every row needs a `user_id` and an `exp` value, the `add` mode adds it to the exp members already have and the
+        `replace` mode overwrites it.
+
+        Usage examples:
+            // With an attached file
+            expadmin import
+            expadmin import replace
+        """
+        if mode not in ("add", "replace"):
+            return await self.embed(ctx, exp_system.get("import_mode", "The mode has to be `add` or `replace`!"))
+
+        if not ctx.message.attachments:
+            return await self.embed(ctx, exp_system.get("import_no_file", "Please attach a `csv` or `jsonl` file!"))
+
+        attachment = ctx.message.attachments[0]
+        failed = exp_system.get("import_failed", "The import failed: {error}")
+        try:
+            _transfer_format(attachment.filename)
+        except ValueError as e:
+            return await self.embed(ctx, failed.format(error=e))
+
+        file = path.join(self.__transfer_dir("imports"), f"{ctx.guild.id}_{path.basename(attachment.filename)}")
+        await attachment.save(file)
+        msg = await self.embed(ctx, exp_system.get("import_started", "Importing the exp..."))
+
+        try:
+            count = await _import_file(self.db, file, ctx.guild.id, mode == "replace",
+                                       self._get_cfg("transfer_chunk_size", 1000))
+        except (ValueError, _ServiceError) as e:
+            return await msg.edit(embed=await self.embed(ctx, failed.format(error=e), get_embed=True))
+        finally:
+            remove(file)
+
+        await msg.edit(embed=await self.embed(
+            ctx, exp_system.get("import_finished", "Imported the exp of {count} members.").format(count=count),
+            get_embed=True))
+
 
 def setup(bot):
     bot.add_cog(ExpSystem(bot))
+
+
+class _ConsoleHandler:
+    """
+    Stands in for the print handler of the bot when this file is run on its own.
+    """
+
+    @staticmethod
+    def info(message: str) -> None:
+        print(message)
+
+    @staticmethod
+    def warn(message: str) -> None:
+        print(message, file=stderr)
+
+    fatal = warn
+
+
+def _main() -> None:
+    """
+    Import or export the exp, or serve the database to several bot processes, without starting the bot.
+    """
+    common = ArgumentParser(add_help=False)
+    common.add_argument("--storage", choices=("sqlite", "journal"), default="sqlite", help="The storage backend.")
+    common.add_argument("--db", help="The database file, or the journal file. (default: `db/exp_system.db` or "
+                                     "`db/exp_system.journal`)")
+
+    parser = ArgumentParser(description="Manage the database of the exp system.")
+    actions = parser.add_subparsers(dest="action", required=True)
+    for action in ("import", "export"):
+        transfer = actions.add_parser(action, parents=[common], help=f"{action.capitalize()} the exp.",
+                                      epilog="Stop the bot and the exp service first, or use the `expadmin` commands.")
+        transfer.add_argument("file", help="A .csv or .jsonl file.")
+        transfer.add_argument("--guild", type=int, help="Only export this guild, or import every row into this guild. "
+                                                        "(default: the `guild_id` column)")
+        transfer.add_argument("--chunk-size", type=int, default=1000, help="The amount of rows per transaction.")
+        if action == "import":
+            transfer.add_argument("--mode", choices=("add", "replace"), default="add",
+                                  help="Whether imported exp gets added to or replaces the current exp.")
+
+    serve = actions.add_parser("serve", parents=[common], help="Serve the database to several bot processes.")
+    serve.add_argument("--socket", default="exp_system.sock", help="The path of the unix socket.")
+    serve.add_argument("--flush-interval", type=int, default=1000, help="The milliseconds between two batch writes.")
+    serve.add_argument("--flush-size", type=int, default=500,
+                       help="The amount of pending members which triggers an early batch write.")
+    serve.add_argument("--leaderboard-size", type=int, default=100,
+                       help="The amount of top users per guild which are kept in memory.")
+    serve.add_argument("--decay-after", type=float, default=0,
+                       help="The days without earning exp after which a member is inactive, 0 to disable decay.")
+    serve.add_argument("--decay-rate", type=float, default=10, help="The percentage of exp which gets decayed.")
+    serve.add_argument("--decay-interval", type=float, default=24, help="The hours between two decay runs.")
+    args = parser.parse_args()
+
+    async def transfer():
+        logging = _ConsoleHandler()
+        db = _DatabaseInteractions(logging, rank_index=False, leaderboard_size=0, write_behind=False,
+                                   store=_create_store(logging, args.storage, args.db, read_pool_size=0))
+        try:
+            if args.action == "import":
+                count = await _import_file(db, args.file, args.guild, args.mode == "replace", args.chunk_size)
+            else:
+                count = await _export_file(db, args.file, args.guild, args.chunk_size)
+        finally:
+            await db.close()
+
+        print(f"{args.action.capitalize()}ed {count} row(s).")
+
+    async def serve():
+        logging = _ConsoleHandler()
+        db = _DatabaseInteractions(logging, leaderboard_size=args.leaderboard_size,
+                                   flush_interval=args.flush_interval / 1000, flush_size=args.flush_size,
+                                   store=_create_store(logging, args.storage, args.db))
+        service = _ExpService(logging, db, args.socket)
+        await service.start()
+
+        stopped = Event()
+        loop = get_event_loop()
+        for signal in (SIGINT, SIGTERM):
+            loop.add_signal_handler(signal, stopped.set)
+
+        decay = None
+        if args.decay_after > 0 and args.decay_interval > 0:
+            rate = min(max(args.decay_rate, 0), 100) / 100
+            decay = ensure_future(_run_decay(db, logging, args.decay_after * 86400, rate, args.decay_interval * 3600))
+
+        await stopped.wait()
+        if decay is not None:
+            decay.cancel()
+        await service.stop()
+        logging.info("[EXP] Stopped the exp service.")
+
+    try:
+        run(serve() if args.action == "serve" else transfer())
+    except (OSError, ValueError) as e:
+        parser.exit(1, f"error: {e}\n")
+
+
+if __name__ == "__main__":
+    _main()
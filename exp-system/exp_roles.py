@@ -26,12 +26,16 @@ SOFTWARE.
 """
 Format:
 exp_roles = {
-    level: role_id,
-    level: role_id
+    guild_id: {
+        level: role_id,
+        level: role_id
+    }
 }
 """
 
 exp_roles = {
-    1: 123456789987654321,
-    2: 123456789987654321
+    123456789987654321: {
+        1: 123456789987654321,
+        2: 123456789987654321
+    }
 }
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+MIT License
+
+Copyright (c) 2019-2020 Arthur
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+from asyncio import sleep, Task, CancelledError
+from os import replace
+from typing import Any, Callable, Dict, List, Optional
+
+from discord.ext import commands
+from discord.ext.commands import Context
+from utilsx.discord import Cog
+
+from config.lang import metrics_exporter
+
+
+class MetricsExporter(Cog):
+    """
+    Exports the metrics which the other extensions register in `bot.extension_metrics`.
+    """
+
+    def __init__(self, bot):
+        super().__init__()
+        self.bot = bot
+        try:
+            self.cfg = self.bot.cfg["METRICS"]
+        except KeyError:
+            self.cfg = None
+
+        self.file: str = self._get_cfg("file", "metrics.prom", str)
+        self.interval: float = self._get_cfg("interval", 15, float)
+        self.__task: Optional[Task] = None
+
+        if not hasattr(self.bot, "extension_metrics"):
+            self.bot.extension_metrics = {}
+
+    def _get_cfg(self, key: str, fallback: Any, cast: Callable[[str], Any] = int) -> Any:
+        """
+        Fetch an optional value from the `METRICS` section.
+
+        @param key: The name of the config value.
+        @param fallback: The value which gets used if the key is missing or invalid.
+        @param cast: Converts the raw config string.
+        """
+        if not self.cfg or self.cfg.get(key) is None:
+            return fallback
+
+        try:
+            return cast(self.cfg.get(key))
+        except ValueError:
+            self.bot.ph.warn(f"Invalid value for `{key}` in the `METRICS` section, falling back to `{fallback}`.")
+            return fallback
+
+    def cog_unload(self):
+        if self.__task is not None:
+            self.__task.cancel()
+
+    @staticmethod
+    def render(registry: Dict[str, Any]) -> str:
+        """
+        Render all metrics in the Prometheus text format.
+
+        @param registry: Maps the namespace of an extension to its metrics.
+        """
+        lines = []
+        for namespace, metrics in sorted(registry.items()):
+            for name, value in sorted(metrics.counters.items()):
+                lines.append(f"# TYPE {namespace}_{name}_total counter")
+                lines.append(f"{namespace}_{name}_total {value}")
+
+            for name, (kind, value) in sorted(metrics.callbacks.items()):
+                metric = f"{namespace}_{name}_total" if kind == "counter" else f"{namespace}_{name}"
+                lines.append(f"# TYPE {metric} {kind}")
+                lines.append(f"{metric} {value()}")
+
+            for name, (counts, total) in sorted(metrics.histograms.items()):
+                metric = f"{namespace}_{name}_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+
+                cumulative = 0
+                for bound, count in zip((*metrics.buckets, "+Inf"), counts):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+
+                lines.append(f"{metric}_sum {total[0]}")
+                lines.append(f"{metric}_count {cumulative}")
+
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def quantile(buckets: tuple, counts: List[int], q: float) -> Optional[float]:
+        """
+        The upper bound of the bucket which contains a quantile, `None` if it lies in the `+Inf` bucket.
+        """
+        target, cumulative = q * sum(counts), 0
+        for bound, count in zip(buckets, counts):
+            cumulative += count
+            if cumulative >= target:
+                return bound
+        return None
+
+    def write(self) -> None:
+        """
+        Write the metrics file, through a temporary file so a scraper never reads a half written file.
+        """
+        with open(f"{self.file}.tmp", "w") as file:
+            file.write(self.render(self.bot.extension_metrics))
+        replace(f"{self.file}.tmp", self.file)
+
+    async def __run(self) -> None:
+        while True:
+            try:
+                self.write()
+            except OSError as e:
+                self.bot.ph.warn(f"[METRICS] Could not write `{self.file}`. ({e})")
+
+            try:
+                await sleep(self.interval)
+            except CancelledError:
+                return
+
+    @Cog.listener()
+    async def on_ready(self):
+        if self.file and self.interval > 0 and self.__task is None:
+            self.__task = self.bot.loop.create_task(self.__run())
+
+    @commands.command()
+    @commands.guild_only()
+    @commands.has_permissions(administrator=True)
+    async def stats(self, ctx: Context):
+        """
+        Show the metrics of the loaded extensions.
+
+        Requires the administrator permission.
+
+        Usage examples:
+            stats
+        """
+        lines = []
+        for namespace, metrics in sorted(self.bot.extension_metrics.items()):
+            lines.append(metrics_exporter.get("stats_namespace", "**{namespace}**").format(namespace=namespace))
+
+            values = {**metrics.counters, **{name: value() for name, (_, value) in metrics.callbacks.items()}}
+            lines.extend(metrics_exporter.get("stats_value", "`{name}`: {value}").format(name=name, value=value)
+                         for name, value in sorted(values.items()))
+
+            for name, (counts, total) in sorted(metrics.histograms.items()):
+                amount = sum(counts)
+                p99 = self.quantile(metrics.buckets, counts, 0.99)
+                lines.append(metrics_exporter.get(
+                    "stats_latency", "`{name}`: {count} calls, {avg:.2f} ms average, p99 {p99}").format(
+                    name=name, count=amount, avg=total[0] / amount * 1000 if amount else 0,
+                    p99=f"<= {p99 * 1000:g} ms" if p99 is not None else f"> {metrics.buckets[-1] * 1000:g} ms"))
+
+        await self.embed(ctx, "\n".join(lines) or metrics_exporter.get("stats_empty", "No extension has registered "
+                                                                                      "metrics!"),
+                         title=metrics_exporter.get("stats_title", "Extension statistics"))
+
+
+def setup(bot):
+    bot.add_cog(MetricsExporter(bot))
@@ -22,10 +22,18 @@ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
+import re
+from asyncio import sleep, gather, ensure_future, Semaphore, Task, CancelledError
+from bisect import bisect_left
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
 from functools import partial
-from typing import Union
+from shlex import shlex
+from time import monotonic, perf_counter
+from typing import Union, Dict, List, Tuple, Callable, Iterator, Any, Awaitable, Optional, Set
 
-from discord import Member, NotFound
+from discord import Member, Message, TextChannel, CategoryChannel, HTTPException, NotFound, Object
 from discord.abc import GuildChannel
 from discord.ext import commands
 from discord.ext.commands import Context, Greedy
@@ -34,6 +42,466 @@ from utilsx.discord import Cog
 
 from config.lang import purge_command
 
+# Discord only bulk deletes messages which are younger than 14 days, a minute of margin is kept for clock drift.
+_BULK_DELETE_AGE = timedelta(days=14, minutes=-1)
+# The maximum amount of messages per bulk delete.
+_BULK_DELETE_SIZE = 100
+# The first second of 2015 in milliseconds, discord snowflakes count from this moment.
+_DISCORD_EPOCH = 1420070400000
+
+_LINK = re.compile(r"https?://\S", re.IGNORECASE)
+_DURATION = re.compile(r"(\d+)([smhdw])")
+_DURATION_UNITS = {"s": "seconds", "m": "minutes", "h": "hours", "d": "days", "w": "weeks"}
+# A channel mention or a bare channel id.
+_CHANNEL_REFERENCE = re.compile(r"<#(\d{15,20})>|(\d{15,20})")
+
+
+# Every extension carries the same copy of this helper, tests/test_shared_helpers.py keeps them in sync.
+class _Metrics:
+    """
+    Counters and latency histograms of an extension.
+
+    The metrics get registered in `bot.extension_metrics`, from where the metrics exporter extension renders them.
+    """
+
+    # The upper bounds in seconds of the latency histogram buckets.
+    buckets = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+    def __init__(self, namespace: str):
+        """
+        @param namespace: The prefix of every metric name.
+        """
+        self.namespace = namespace
+        self.counters: Dict[str, int] = {}
+        # Maps a name to the (non cumulative) bucket counts, with a last `+Inf` bucket, and the sum of the observations.
+        self.histograms: Dict[str, Tuple[List[int], List[float]]] = {}
+        # Maps a name to the kind (`counter` or `gauge`) and a callable which reads the current value.
+        self.callbacks: Dict[str, Tuple[str, Callable[[], float]]] = {}
+
+    def register(self, bot) -> None:
+        if not hasattr(bot, "extension_metrics"):
+            bot.extension_metrics = {}
+        bot.extension_metrics[self.namespace] = self
+
+    def unregister(self, bot) -> None:
+        getattr(bot, "extension_metrics", {}).pop(self.namespace, None)
+
+    def inc(self, name: str, amount: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def track(self, name: str, value: Callable[[], float], kind: str = "gauge") -> None:
+        """
+        Expose a value which is already kept somewhere else.
+        """
+        self.callbacks[name] = (kind, value)
+
+    def observe(self, name: str, seconds: float) -> None:
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = ([0] * (len(self.buckets) + 1), [0.0])
+
+        histogram[0][bisect_left(self.buckets, seconds)] += 1
+        histogram[1][0] += seconds
+
+    @contextmanager
+    def timed(self, name: str) -> Iterator[None]:
+        """
+        Observe the duration of the block, failures are also counted in the `{name}_errors` counter.
+        """
+        start = perf_counter()
+        try:
+            yield
+        except Exception:
+            self.inc(f"{name}_errors")
+            raise
+        finally:
+            self.observe(name, perf_counter() - start)
+
+
+# Every extension carries the same copy of this helper, tests/test_shared_helpers.py keeps them in sync.
+class _RateLimiter:
+    """
+    Token bucket which allows `rate` calls per `per` seconds.
+    """
+
+    def __init__(self, rate: int, per: float):
+        self.rate = rate
+        self.per = per
+        self.__tokens = float(rate)
+        self.__updated = monotonic()
+
+    async def acquire(self) -> None:
+        """
+        Wait until a call is allowed.
+        """
+        while True:
+            now = monotonic()
+            self.__tokens = min(self.rate, self.__tokens + (now - self.__updated) * self.rate / self.per)
+            self.__updated = now
+
+            if self.__tokens >= 1:
+                self.__tokens -= 1
+                return
+
+            await sleep((1 - self.__tokens) * self.per / self.rate)
+
+
+@dataclass
+class _ChannelTarget(commands.Converter):
+    """
+    A text channel or a category, given by its mention or id.
+
+    Channel names aren't accepted, a server with a `bots` channel would otherwise turn the `bots` filter into a target.
+    """
+
+    async def convert(self, ctx: Context, argument: str) -> Union[TextChannel, CategoryChannel]:
+        match = _CHANNEL_REFERENCE.fullmatch(argument)
+        channel = ctx.guild.get_channel(int(match.group(1) or match.group(2))) if match else None
+        if not isinstance(channel, (TextChannel, CategoryChannel)):
+            raise commands.BadArgument(f"`{argument}` is not the mention or id of a text channel or category.")
+        return channel
+
+
+class _PurgeResult:
+    # The amount of messages which have been read from the history.
+    scanned: int = 0
+    # The amount of messages which have been deleted, including the old ones.
+    deleted: int = 0
+    # The amount of matches which were too old to be bulk deleted, these are deleted one by one.
+    old: int = 0
+    # The amount of messages which could not be deleted.
+    failed: int = 0
+
+
+def _snowflake(moment: datetime) -> int:
+    """
+    The lowest snowflake of a moment, naive datetimes are in UTC.
+    """
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return max(int(moment.timestamp() * 1000) - _DISCORD_EPOCH, 0) << 22
+
+
+def _parse_bound(value: str) -> int:
+    """
+    Convert the value of a `before` or `after` filter to a snowflake.
+
+    @param value: A message id, a duration which is that long ago (`30m`, `2h`, `1d12h`) or a UTC date. (`2020-05-01`,
+                  `2020-05-01T12:00`)
+    """
+    if value.isdigit() and len(value) > 10:
+        return int(value)
+
+    durations = _DURATION.findall(value.lower())
+    if durations and "".join(amount + unit for amount, unit in durations) == value.lower():
+        ago = timedelta(**{_DURATION_UNITS[unit]: int(amount) for amount, unit in durations})
+        return _snowflake(datetime.utcnow() - ago)
+
+    try:
+        return _snowflake(datetime.fromisoformat(value))
+    except ValueError:
+        raise ValueError(f"`{value}` is not a message id, duration or date.")
+
+
+@dataclass
+class _PurgeFilter:
+    # Only messages between these snowflakes get fetched.
+    before: Optional[int] = None
+    after: Optional[int] = None
+    # Whether a fetched message should be deleted, every message matches if left empty.
+    check: Optional[Callable[[Message], bool]] = None
+
+
+def _compile_filter(options: str, author_ids: Optional[Set[int]] = None) -> _PurgeFilter:
+    """
+    Compile the filters of a purge into a single check and the bounds of the history.
+
+    @param options: The filters, delimited by spaces: `before:<bound>`, `after:<bound>`, `contains:<text>`,
+                    `regex:<pattern>`, `has:attachments`, `has:embeds`, `has:links` and `bots`. Values with spaces
+                    can be quoted.
+    @param author_ids: Only messages of these users match, if given.
+    @raise ValueError: An option is unknown or invalid.
+    """
+    result = _PurgeFilter()
+    # Ordered from cheap to expensive, so the regular expressions only run on messages which passed the rest.
+    checks: List[Callable[[Message], bool]] = []
+    text: List[Callable[[Message], bool]] = []
+
+    if author_ids:
+        checks.append(lambda m: m.author.id in author_ids)
+
+    # Backslashes are kept as is, they are common in regular expressions.
+    lexer = shlex(options or "", posix=True)
+    lexer.whitespace_split = True
+    lexer.escape = ""
+
+    for option in lexer:
+        key, _, value = option.partition(":")
+        key = key.lower()
+
+        if key in ("before", "after"):
+            bound = _parse_bound(value)
+            if key == "before":
+                result.before = bound if result.before is None else min(result.before, bound)
+            else:
+                result.after = bound if result.after is None else max(result.after, bound)
+        elif key == "bots" and not value:
+            checks.append(lambda m: m.author.bot)
+        elif key == "has" and value.lower() == "attachments":
+            checks.append(lambda m: bool(m.attachments))
+        elif key == "has" and value.lower() == "embeds":
+            checks.append(lambda m: bool(m.embeds))
+        elif key == "has" and value.lower() == "links":
+            text.append(lambda m: _LINK.search(m.content) is not None)
+        elif key == "contains" and value:
+            text.insert(0, lambda m, v=value.lower(): v in m.content.lower())
+        elif key == "regex" and value:
+            try:
+                pattern = re.compile(value)
+            except re.error as e:
+                raise ValueError(f"`{value}` is not a valid regular expression. ({e})")
+            text.append(lambda m, p=pattern: p.search(m.content) is not None)
+        else:
+            raise ValueError(f"`{option}` is not a known filter.")
+
+    if result.before is not None and result.after is not None and result.before <= result.after:
+        raise ValueError("`before` has to be later than `after`.")
+
+    checks.extend(text)
+    if len(checks) == 1:
+        result.check = checks[0]
+    elif checks:
+        result.check = lambda m: all(check(m) for check in checks)
+    return result
+
+
+class _PurgeEngine:
+    """
+    Streams the history of a channel and deletes the matching messages while it goes.
+
+    Matches are bulk deleted per 100 messages. Messages which are too old to be bulk deleted are deleted one by one
+    within a rate limit, which is shared by every purge.
+    """
+
+    def __init__(self, scan_limit: int = 10_000, old_rate: int = 1, old_per: float = 1.0,
+                 progress_interval: float = 2.0):
+        """
+        @param scan_limit: The maximum amount of messages which are read from the history of a channel.
+        @param old_rate: The amount of old messages which can be deleted...
+        @param old_per: ...within this amount of seconds.
+        @param progress_interval: The minimum amount of seconds between two progress reports.
+        """
+        self.scan_limit = scan_limit
+        self.progress_interval = progress_interval
+        self.limiter = _RateLimiter(old_rate, old_per)
+
+    async def purge(self, channel: TextChannel, count: int, check: Optional[Callable[[Message], bool]] = None,
+                    before: Optional[int] = None, after: Optional[int] = None,
+                    progress: Optional[Callable[[_PurgeResult], Awaitable[Any]]] = None,
+                    result: Optional[_PurgeResult] = None) -> _PurgeResult:
+        """
+        Delete the newest messages of a channel which match a check.
+
+        @param channel: The channel which gets purged.
+        @param count: The amount of matching messages which get deleted.
+        @param check: Whether a message should be deleted, every message matches if left empty.
+        @param before: Only messages before this snowflake are fetched.
+        @param after: Only messages after this snowflake are fetched.
+        @param progress: Gets called with the intermediate result every `progress_interval` seconds.
+        @param result: The result which gets updated while the purge runs, a new one if left empty.
+        @return: The amount of scanned and deleted messages.
+        """
+        result = result or _PurgeResult()
+        pending: List[Message] = []
+        matched = 0
+        cutoff = datetime.utcnow() - _BULK_DELETE_AGE
+        next_progress = monotonic() + self.progress_interval
+
+        # The newest messages are purged first, also when only an `after` bound is given.
+        async for message in channel.history(limit=self.scan_limit, before=None if before is None else Object(before),
+                                             after=None if after is None else Object(after), oldest_first=False):
+            result.scanned += 1
+            if check is None or check(message):
+                matched += 1
+                # Discord 2.x returns aware datetimes, both are in UTC.
+                if message.created_at.replace(tzinfo=None) < cutoff:
+                    result.old += 1
+                    await self.__delete_single(message, result)
+                else:
+                    pending.append(message)
+                    if len(pending) >= _BULK_DELETE_SIZE:
+                        await self.__delete_bulk(channel, pending, result)
+                        pending = []
+
+                if matched >= count:
+                    break
+
+            if progress is not None and monotonic() >= next_progress:
+                await progress(result)
+                next_progress = monotonic() + self.progress_interval
+
+        if pending:
+            await self.__delete_bulk(channel, pending, result)
+        return result
+
+    async def __delete_bulk(self, channel: TextChannel, messages: List[Message], result: _PurgeResult) -> None:
+        try:
+            await channel.delete_messages(messages)
+        except NotFound:
+            # One of the messages has been deleted in the meantime, which fails the whole request.
+            for message in messages:
+                await self.__delete_single(message, result)
+            return
+        except HTTPException:
+            result.failed += len(messages)
+            return
+
+        result.deleted += len(messages)
+
+    async def __delete_single(self, message: Message, result: _PurgeResult) -> None:
+        await self.limiter.acquire()
+        try:
+            await message.delete()
+        except NotFound:
+            return
+        except HTTPException:
+            result.failed += 1
+            return
+
+        result.deleted += 1
+
+
+class _PurgeJob:
+    """
+    A purge of one or more channels, which runs in the background.
+    """
+
+    def __init__(self, job_id: int, author: Member, channels: List[TextChannel], count: int, query: _PurgeFilter,
+                 before: int):
+        """
+        @param job_id: The number of the job, which is used to cancel it.
+        @param author: The member who started the purge.
+        @param channels: The channels which get purged.
+        @param count: The amount of matching messages which get deleted per channel.
+        @param query: The filter of the messages.
+        @param before: Only messages before this snowflake are purged.
+        """
+        self.id = job_id
+        self.author = author
+        self.guild_id: int = author.guild.id
+        self.channels = channels
+        self.count = count
+        self.query = query
+        self.before = before
+
+        self.results: Dict[int, _PurgeResult] = {channel.id: _PurgeResult() for channel in channels}
+        # The error of every channel which could not be purged.
+        self.errors: Dict[int, str] = {}
+        self.finished = 0
+        self.cancelled = False
+        self.started = perf_counter()
+        self.task: Optional[Task] = None
+
+    @property
+    def deleted(self) -> int:
+        return sum(result.deleted for result in self.results.values())
+
+    @property
+    def scanned(self) -> int:
+        return sum(result.scanned for result in self.results.values())
+
+
+class _PurgeScheduler:
+    """
+    Runs purge jobs in the background.
+
+    At most `concurrency` channels of a guild are purged at the same time, other channels wait for their turn. The
+    rate limits of discord apply per channel, so this keeps a large cleanup from running into them.
+    """
+
+    def __init__(self, engine: _PurgeEngine, concurrency: int = 2):
+        """
+        @param engine: Purges the channels.
+        @param concurrency: The amount of channels per guild which can be purged at the same time.
+        """
+        self.engine = engine
+        self.concurrency = max(concurrency, 1)
+        # The running and waiting jobs by their id.
+        self.jobs: Dict[int, _PurgeJob] = {}
+
+        self.__limits: Dict[int, Semaphore] = {}
+        self.__last_id = 0
+
+    def submit(self, author: Member, channels: List[TextChannel], count: int, query: _PurgeFilter, before: int,
+               progress: Callable[[_PurgeJob], Awaitable[Any]],
+               finished: Callable[[_PurgeJob], Awaitable[Any]]) -> _PurgeJob:
+        """
+        Start purging channels.
+
+        @param progress: Gets called while the job runs, at most every `progress_interval` seconds per channel.
+        @param finished: Gets called once the job has finished or has been cancelled.
+        """
+        self.__last_id += 1
+        job = _PurgeJob(self.__last_id, author, channels, count, query, before)
+        self.jobs[job.id] = job
+        job.task = ensure_future(self.__run(job, progress, finished))
+        # A job which gets cancelled before it started never runs `__run`.
+        job.task.add_done_callback(lambda _: self.jobs.pop(job.id, None))
+        return job
+
+    def cancel(self, job_id: int, guild_id: int) -> bool:
+        """
+        Stop a job of a guild, the messages which are already deleted stay deleted.
+
+        @return: Whether the job was running.
+        """
+        job = self.jobs.get(job_id)
+        if job is None or job.guild_id != guild_id:
+            return False
+
+        job.task.cancel()
+        return True
+
+    def guild_jobs(self, guild_id: int) -> List[_PurgeJob]:
+        return [job for job in self.jobs.values() if job.guild_id == guild_id]
+
+    async def wait(self) -> None:
+        """
+        Wait until every current job has finished.
+        """
+        await gather(*(job.task for job in list(self.jobs.values())), return_exceptions=True)
+
+    def stop(self) -> None:
+        for job in self.jobs.values():
+            job.task.cancel()
+
+    async def __run(self, job: _PurgeJob, progress: Callable[[_PurgeJob], Awaitable[Any]],
+                    finished: Callable[[_PurgeJob], Awaitable[Any]]) -> None:
+        try:
+            await gather(*(self.__purge_channel(job, channel, progress) for channel in job.channels))
+        except CancelledError:
+            job.cancelled = True
+        finally:
+            self.jobs.pop(job.id, None)
+
+        await finished(job)
+
+    async def __purge_channel(self, job: _PurgeJob, channel: TextChannel,
+                              progress: Callable[[_PurgeJob], Awaitable[Any]]) -> None:
+        limit = self.__limits.get(job.guild_id)
+        if limit is None:
+            limit = self.__limits[job.guild_id] = Semaphore(self.concurrency)
+
+        async with limit:
+            try:
+                await self.engine.purge(channel, job.count, job.query.check, before=job.before, after=job.query.after,
+                                        progress=lambda _: progress(job), result=job.results[channel.id])
+            except HTTPException as e:
+                # Mostly missing permissions in one of the channels, the other channels are still purged.
+                job.errors[channel.id] = e.text or str(e.status)
+
+        job.finished += 1
+
 
 class PurgeCommand(Cog):
     """
@@ -57,11 +525,67 @@ class PurgeCommand(Cog):
 
         self.allowed = [convert_if_number(p.strip()) for p in purge_allowed.split(",")]
 
-    @commands.command()
-    async def purge(self, ctx: Context, count: int = 100, authors: Greedy[Union[Member]] = None):
+        self.engine = _PurgeEngine(scan_limit=self._get_cfg("purge_scan_limit", 10_000),
+                                   old_rate=self._get_cfg("purge_old_rate", 1),
+                                   old_per=self._get_cfg("purge_old_per", 1, float),
+                                   progress_interval=self._get_cfg("purge_progress_interval", 2, float))
+        self.scheduler = _PurgeScheduler(self.engine, self._get_cfg("purge_concurrency", 2))
+
+        self.metrics = _Metrics("purge_command")
+        self.metrics.track("running_purges", lambda: len(self.scheduler.jobs))
+        self.metrics.register(self.bot)
+
+    def _get_cfg(self, key: str, fallback: Any, cast: Callable[[str], Any] = int) -> Any:
+        """
+        Fetch an optional value from the `MODERATION` section.
+
+        @param key: The name of the config value.
+        @param fallback: The value which gets used if the key is missing or invalid.
+        @param cast: Converts the raw config string.
+        """
+        value = self.bot.cfg["MODERATION"].get(key)
+        if value is None:
+            return fallback
+
+        try:
+            return cast(value)
+        except ValueError:
+            self.bot.ph.warn(f"Invalid value for `{key}` in the `MODERATION` section, falling back to `{fallback}`.")
+            return fallback
+
+    def cog_unload(self):
+        self.metrics.unregister(self.bot)
+        self.scheduler.stop()
+
+    def __allowed(self, ctx: Context) -> bool:
+        getter = partial(get, ctx.author.roles)
+        return any(getter(id=role) is not None if isinstance(role, int) else getter(name=role) is not None for role in
+                   self.allowed)
+
+    @staticmethod
+    def __may_purge(member: Member, channel: TextChannel) -> bool:
+        permissions = channel.permissions_for(member)
+        return permissions.read_messages and permissions.manage_messages
+
+    @commands.group(invoke_without_command=True)
+    async def purge(self, ctx: Context, count: int = 100,
+                    channels: Greedy[_ChannelTarget] = None,
+                    authors: Greedy[Union[Member]] = None, *, filters: str = ""):
         """
-        Removes a certain amount of messages in the current channel.
-        This can be filtered by certain members.
+        Removes a certain amount of messages in the current channel, or in each of the given channels.
+        This can be filtered by certain members and the filters below, in which case that amount of matching
+        messages is removed.
+
+        The purge runs in the background, use `purge status` to see the running purges and `purge cancel <id>` to
+        stop one.
+
+        Filters:
+            before:<id|date|duration> / after:<id|date|duration> - Messages around a message, a UTC date
+                (2020-05-01 or 2020-05-01T12:00) or a time ago (30m, 2h, 1d).
+            contains:<text> - Messages which contain a text, quote the text if it has spaces.
+            regex:<pattern> - Messages which match a regular expression.
+            has:attachments / has:embeds / has:links - Messages with files, embeds or links.
+            bots - Messages of bots.
 
         Default amount is 100.
 
@@ -71,24 +595,154 @@ class PurgeCommand(Cog):
 
             // Removes 10 messages from @Arthur and a user whom has the id of 640625683797639181.
             purge 10 @Arthur 640625683797639181
+
+            // Removes the last 50 messages with a link of the last 2 hours.
+            purge 50 after:2h has:links
+
+            // Removes 20 messages from bots which contain "level up".
+            purge 20 bots contains:"level up"
+
+            // Removes 100 messages of @Arthur in #general and in every channel of the category with that id.
+            purge 100 #general 776227062230548502 @Arthur
         """
         if not isinstance(ctx.channel, GuildChannel):
             return await self.embed(ctx, "This command can only be used in a discord server!")
 
-        getter = partial(get, ctx.author.roles)
-        if not any(getter(id=role) is not None if isinstance(role, int) else getter(name=role) is not None for role in
-                   self.allowed):
+        if not self.__allowed(ctx):
             return await self.embed(ctx, "You don't have the required role!")
 
+        try:
+            query = _compile_filter(filters, {author.id for author in authors} if authors is not None else None)
+        except ValueError as e:
+            return await self.embed(ctx, purge_command.get("invalid_filter", "Invalid filter: {error}").format(error=e))
+
+        targets: List[TextChannel] = []
+        for channel in channels or [ctx.channel]:
+            for target in channel.text_channels if isinstance(channel, CategoryChannel) else [channel]:
+                if target not in targets:
+                    targets.append(target)
+
+        # The purge role isn't enough, the author has to be able to remove messages in every channel themselves.
+        refused = [target for target in targets if not self.__may_purge(ctx.author, target)]
+        if refused:
+            targets = [target for target in targets if target not in refused]
+            await self.embed(ctx, purge_command.get(
+                "refused", "You can't remove messages in {channels}, these channels are skipped.").format(
+                channels=", ".join(target.mention for target in refused)))
+
+        if not targets:
+            return await self.embed(ctx, purge_command.get("no_channels", "There are no channels to purge!"))
+
         _ending = f" {purge_command.get('from')} " + ", ".join([a.mention for a in authors]) if authors is not None else ""
+        if channels:
+            _ending += f" {purge_command.get('in', 'in')} " + ", ".join(target.mention for target in targets)
+        if filters:
+            _ending += f" ({filters})"
         msg = await self.embed(ctx, purge_command.get("started").format(count=count, ending=_ending))
-        deleted = await ctx.channel.purge(limit=count, check=lambda m: authors is None or m.author in authors)
-        em = await self.embed(ctx, purge_command.get("finished").format(count=len(deleted), ending=_ending), get_embed=True, color=purge_command.get("finished_color", 0x00ff00))
 
-        try:
-            await msg.edit(embed=em, delete_after=10)
-        except NotFound:
-            await ctx.send(embed=em, delete_after=10)
+        async def progress(job: _PurgeJob):
+            try:
+                await msg.edit(embed=await self.embed(ctx, purge_command.get(
+                    "progress", "Removed {count} messages{ending}, {scanned} messages checked so far...").format(
+                    count=job.deleted, scanned=job.scanned, ending=_ending), title=self.__title(job), get_embed=True))
+            except HTTPException:
+                pass
+
+        async def finished(job: _PurgeJob):
+            self.__record(job)
+
+            if job.cancelled:
+                text = purge_command.get("cancelled", "Cancelled, {count} messages{ending} have been removed.")
+            else:
+                text = purge_command.get("finished")
+            text = text.format(count=job.deleted, scanned=job.scanned, ending=_ending)
+
+            # The amount of every channel, when more than one channel was purged or something went wrong.
+            if len(job.channels) > 1 or job.errors:
+                text += "\n" + "\n".join(self.__summary(job, channel) for channel in job.channels)
+
+            em = await self.embed(ctx, text, title=self.__title(job), get_embed=True,
+                                  color=purge_command.get("finished_color", 0x00ff00))
+            delete_after = 10 if len(job.channels) == 1 and not job.errors else None
+            try:
+                await msg.edit(embed=em, delete_after=delete_after)
+            except NotFound:
+                await ctx.send(embed=em, delete_after=delete_after)
+
+        # Messages which are sent during the purge, like the status message, are never purged.
+        before = ctx.message.id if query.before is None else min(query.before, ctx.message.id)
+        self.scheduler.submit(ctx.author, targets, count, query, before, progress, finished)
+
+    @purge.command(name="status")
+    async def purge_status(self, ctx: Context):
+        """
+        Shows the purges which are running in this server.
+
+        Usage examples:
+            purge status
+        """
+        if not isinstance(ctx.channel, GuildChannel):
+            return await self.embed(ctx, "This command can only be used in a discord server!")
+
+        if not self.__allowed(ctx):
+            return await self.embed(ctx, "You don't have the required role!")
+
+        jobs = self.scheduler.guild_jobs(ctx.guild.id)
+        if not jobs:
+            return await self.embed(ctx, purge_command.get("status_none", "There are no running purges."))
+
+        line = purge_command.get("status_line", "`#{job.id}` by {job.author.mention}: {job.finished}/{channels} "
+                                                "channels done, {count} messages removed, {scanned} checked.")
+        await self.embed(ctx, "\n".join(line.format(job=job, channels=len(job.channels), count=job.deleted,
+                                                     scanned=job.scanned) for job in jobs))
+
+    @purge.command(name="cancel")
+    async def purge_cancel(self, ctx: Context, job_id: int):
+        """
+        Stops a running purge, the messages which have already been removed stay removed.
+
+        Usage examples:
+            purge cancel 3
+        """
+        if not isinstance(ctx.channel, GuildChannel):
+            return await self.embed(ctx, "This command can only be used in a discord server!")
+
+        if not self.__allowed(ctx):
+            return await self.embed(ctx, "You don't have the required role!")
+
+        if not self.scheduler.cancel(job_id, ctx.guild.id):
+            return await self.embed(ctx, purge_command.get("cancel_unknown", "There is no running purge "
+                                                                             "`#{id}`!").format(id=job_id))
+
+        await self.embed(ctx, purge_command.get("cancel_done", "Cancelling purge `#{id}`...").format(id=job_id))
+
+    @staticmethod
+    def __title(job: _PurgeJob) -> str:
+        return purge_command.get("title", "Purge #{id}").format(id=job.id)
+
+    @staticmethod
+    def __summary(job: _PurgeJob, channel: TextChannel) -> str:
+        if channel.id in job.errors:
+            return purge_command.get("summary_failed", "{channel.mention}: failed ({error})").format(
+                channel=channel, error=job.errors[channel.id])
+
+        result = job.results[channel.id]
+        return purge_command.get("summary_line", "{channel.mention}: {count} removed").format(
+            channel=channel, count=result.deleted, scanned=result.scanned)
+
+    def __record(self, job: _PurgeJob) -> None:
+        self.metrics.observe("purge", perf_counter() - job.started)
+        self.metrics.inc("purges")
+        if job.cancelled:
+            self.metrics.inc("purges_cancelled")
+        if job.errors:
+            self.metrics.inc("purge_errors")
+
+        for result in job.results.values():
+            self.metrics.inc("messages_deleted", result.deleted)
+            self.metrics.inc("messages_scanned", result.scanned)
+            self.metrics.inc("old_messages", result.old)
+            self.metrics.inc("delete_failures", result.failed)
 
 
 def setup(bot):
@@ -18,53 +18,373 @@ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
+from asyncio import Queue, Task, ensure_future, sleep
+from bisect import bisect_left
+from contextlib import contextmanager
+from dataclasses import dataclass
 from distutils.util import strtobool
 from sys import exit
+from time import monotonic, perf_counter
+from typing import Dict, List, Tuple, Callable, Iterator, FrozenSet, Optional, Any, Awaitable
 
 from config.lang import role_notifier
-from discord import Member, Role, Guild
+from discord import Member, Role, Guild, Forbidden, NotFound, HTTPException
 from run import cfg
 from utilsx.discord import Cog
 from utilsx.discord.objects import Footer
 
 
+# Every extension carries the same copy of this helper, tests/test_shared_helpers.py keeps them in sync.
+class _Metrics:
+    """
+    Counters and latency histograms of an extension.
+
+    The metrics get registered in `bot.extension_metrics`, from where the metrics exporter extension renders them.
+    """
+
+    # The upper bounds in seconds of the latency histogram buckets.
+    buckets = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+    def __init__(self, namespace: str):
+        """
+        @param namespace: The prefix of every metric name.
+        """
+        self.namespace = namespace
+        self.counters: Dict[str, int] = {}
+        # Maps a name to the (non cumulative) bucket counts, with a last `+Inf` bucket, and the sum of the observations.
+        self.histograms: Dict[str, Tuple[List[int], List[float]]] = {}
+        # Maps a name to the kind (`counter` or `gauge`) and a callable which reads the current value.
+        self.callbacks: Dict[str, Tuple[str, Callable[[], float]]] = {}
+
+    def register(self, bot) -> None:
+        if not hasattr(bot, "extension_metrics"):
+            bot.extension_metrics = {}
+        bot.extension_metrics[self.namespace] = self
+
+    def unregister(self, bot) -> None:
+        getattr(bot, "extension_metrics", {}).pop(self.namespace, None)
+
+    def inc(self, name: str, amount: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def track(self, name: str, value: Callable[[], float], kind: str = "gauge") -> None:
+        """
+        Expose a value which is already kept somewhere else.
+        """
+        self.callbacks[name] = (kind, value)
+
+    def observe(self, name: str, seconds: float) -> None:
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = ([0] * (len(self.buckets) + 1), [0.0])
+
+        histogram[0][bisect_left(self.buckets, seconds)] += 1
+        histogram[1][0] += seconds
+
+    @contextmanager
+    def timed(self, name: str) -> Iterator[None]:
+        """
+        Observe the duration of the block, failures are also counted in the `{name}_errors` counter.
+        """
+        start = perf_counter()
+        try:
+            yield
+        except Exception:
+            self.inc(f"{name}_errors")
+            raise
+        finally:
+            self.observe(name, perf_counter() - start)
+
+
+# Every extension carries the same copy of this helper, tests/test_shared_helpers.py keeps them in sync.
+class _RateLimiter:
+    """
+    Token bucket which allows `rate` calls per `per` seconds.
+    """
+
+    def __init__(self, rate: int, per: float):
+        self.rate = rate
+        self.per = per
+        self.__tokens = float(rate)
+        self.__updated = monotonic()
+
+    async def acquire(self) -> None:
+        """
+        Wait until a call is allowed.
+        """
+        while True:
+            now = monotonic()
+            self.__tokens = min(self.rate, self.__tokens + (now - self.__updated) * self.rate / self.per)
+            self.__updated = now
+
+            if self.__tokens >= 1:
+                self.__tokens -= 1
+                return
+
+            await sleep((1 - self.__tokens) * self.per / self.rate)
+
+
+class _Template:
+    """
+    The embed of a state (`added` or `removed`) from `lang.py`, which is looked up once.
+    """
+
+    def __init__(self, lang: dict):
+        footer = lang.get("footer", {})
+        color = lang.get("color", {})
+
+        self.title: str = lang.get("title", "Invalid lang.py")
+        self.content: Callable[..., str] = lang.get("content", "Invalid lang.py").format
+        self.footer_text: str = footer.get("text", "Invalid lang.py")
+        self.footer_icon: Callable[..., str] = footer.get("icon", "").format
+        self.timestamp: bool = footer.get("timestamp", True)
+        self.color: Optional[int] = None if color.get("random", True) else color.get("color", 0xf0f0f0)
+
+
+@dataclass
+class _Notification:
+    member: Member
+    role: Role
+    # `added` or `removed`, `None` if the role was added and removed again before the member was notified.
+    state: Optional[str]
+
+
+class _DMDispatcher:
+    """
+    Sends the role notifications in the background.
+
+    Notifications wait in a bounded queue and are sent by a few workers within one rate limit for every DM. A change of
+    a role which is still waiting is merged into the waiting notification, so adding and removing a role again only
+    sends something if the role actually changed. Members who don't accept DMs are skipped for a while.
+    """
+
+    def __init__(self, logging, deliver: Callable[[Member, Role, str], Awaitable[Any]], max_queue: int = 5000,
+                 workers: int = 2, rate: int = 5, per: float = 5.0, retries: int = 2, closed_ttl: float = 3600.0):
+        """
+        @param logging: The print handler of the bot.
+        @param deliver: Sends a single notification.
+        @param max_queue: The amount of notifications that can wait, new ones are dropped after.
+        @param workers: The amount of notifications which can be sent at the same time.
+        @param rate: The amount of DMs within `per` seconds.
+        @param per: The rate limit window in seconds.
+        @param retries: The amount of times a failed DM gets retried.
+        @param closed_ttl: The amount of seconds a member who doesn't accept DMs is skipped.
+        """
+        self.log = logging
+        self.__deliver = deliver
+        self.workers = workers
+        self.retries = retries
+        self.closed_ttl = closed_ttl
+        self.limiter = _RateLimiter(rate, per)
+
+        self.__queue: Queue = Queue(max_queue)
+        self.__pending: Dict[Tuple[int, int, int], _Notification] = {}
+        # Maps the members who don't accept DMs to the moment they are tried again.
+        self.__closed: Dict[int, float] = {}
+        self.__tasks: List[Task] = []
+
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.skipped = 0
+        self.failed = 0
+
+    @property
+    def depth(self) -> int:
+        return self.__queue.qsize()
+
+    def start(self) -> None:
+        if not self.__tasks:
+            self.__tasks = [ensure_future(self.__work()) for _ in range(self.workers)]
+
+    def stop(self) -> None:
+        for task in self.__tasks:
+            task.cancel()
+        self.__tasks = []
+
+    def notify(self, member: Member, role: Role, state: str) -> None:
+        """
+        Queue a notification, this never waits.
+
+        @param state: `added` or `removed`.
+        """
+        if self.__is_closed(member.id):
+            self.skipped += 1
+            return
+
+        key = (member.guild.id, member.id, role.id)
+        queued = self.__pending.get(key)
+        if queued is not None:
+            if queued.state is None:
+                queued.state = state
+            elif queued.state != state:
+                queued.state = None
+            queued.member = member
+            self.coalesced += 1
+            return
+
+        if self.__queue.full():
+            if not self.dropped % 100:
+                self.log.warn(f"[ROLE NOTIFIER] The DM queue is full, {self.dropped + 1} DM(s) dropped so far.")
+            self.dropped += 1
+            return
+
+        self.__pending[key] = _Notification(member, role, state)
+        self.__queue.put_nowait(key)
+        self.start()
+
+    def __is_closed(self, user_id: int) -> bool:
+        until = self.__closed.get(user_id)
+        if until is None:
+            return False
+        if until > monotonic():
+            return True
+
+        del self.__closed[user_id]
+        return False
+
+    def __close(self, user_id: int) -> None:
+        now = monotonic()
+        if len(self.__closed) >= 10_000:
+            self.__closed = {user: until for user, until in self.__closed.items() if until > now}
+        self.__closed[user_id] = now + self.closed_ttl
+
+    async def __attempt(self, notification: _Notification) -> None:
+        member = notification.member
+        for attempt in range(self.retries + 1):
+            # The member could have been added to the cache while this notification was waiting.
+            if self.__is_closed(member.id):
+                self.skipped += 1
+                return
+
+            await self.limiter.acquire()
+            try:
+                await self.__deliver(member, notification.role, notification.state)
+                self.sent += 1
+                return
+            except Forbidden:
+                # The member doesn't accept DMs from this server, retrying won't help.
+                self.__close(member.id)
+                self.skipped += 1
+                return
+            except NotFound:
+                break
+            except HTTPException as e:
+                if attempt == self.retries:
+                    self.log.warn(f"[ROLE NOTIFIER] Giving up on a DM to `{member.id}`. ({e})")
+                    break
+                await sleep(2 ** attempt)
+
+        self.failed += 1
+
+    async def __work(self) -> None:
+        while True:
+            key = await self.__queue.get()
+            # Removing the entry first makes new changes of the role queue a new notification.
+            notification = self.__pending.pop(key)
+            if notification.state is None:
+                continue
+
+            try:
+                await self.__attempt(notification)
+            except Exception as e:
+                self.failed += 1
+                self.log.warn(f"[ROLE NOTIFIER] Failed to send a DM. ({e})")
+
+
 class RoleNotifier(Cog):
     specific = strtobool(cfg["ROLE_NOTIFIER"].get("specific", "false"))
 
     def __init__(self, bot):
         super().__init__()
         self.bot = bot
+        # The ids of the roles which are notified, every role if this is `None`.
+        self.specific_roles: Optional[FrozenSet[int]] = None
         if self.specific:
             try:
-                self.specific_roles = [int(role) for role in cfg["ROLE_NOTIFIER"].get("roles", "").split(",")
-                                       if role != ""]
+                self.specific_roles = frozenset(int(role) for role in cfg["ROLE_NOTIFIER"].get("roles", "").split(",")
+                                                if role.strip() != "")
             except ValueError:
                 self.bot.ph.fatal("Invalid value for `ROLE_NOTIFIER` `roles`")
                 exit(1)
 
+        self.templates: Dict[str, _Template] = {state: _Template(role_notifier.get(state, {}))
+                                                for state in ("added", "removed")}
+        self.dispatcher = _DMDispatcher(self.bot.ph, self.__deliver,
+                                        max_queue=self._get_cfg("dm_queue_size", 5000),
+                                        workers=self._get_cfg("dm_workers", 2),
+                                        rate=self._get_cfg("dm_rate", 5),
+                                        per=self._get_cfg("dm_per", 5, float),
+                                        retries=self._get_cfg("dm_retries", 2),
+                                        closed_ttl=self._get_cfg("closed_dm_ttl", 3600, float))
+
+        self.metrics = _Metrics("role_notifier")
+        self.metrics.track("dm_queue_depth", lambda: self.dispatcher.depth)
+        for stat in ("coalesced", "dropped", "skipped", "failed"):
+            self.metrics.track(f"dms_{stat}", lambda s=stat: getattr(self.dispatcher, s), "counter")
+        self.metrics.register(self.bot)
+
+    def _get_cfg(self, key: str, fallback: Any, cast: Callable[[str], Any] = int) -> Any:
+        """
+        Fetch an optional value from the `ROLE_NOTIFIER` section.
+
+        @param key: The name of the config value.
+        @param fallback: The value which gets used if the key is missing or invalid.
+        @param cast: Converts the raw config string.
+        """
+        value = cfg["ROLE_NOTIFIER"].get(key)
+        if value is None:
+            return fallback
+
+        try:
+            return cast(value)
+        except ValueError:
+            self.bot.ph.warn(f"Invalid value for `{key}` in the `ROLE_NOTIFIER` section, falling back to `{fallback}`.")
+            return fallback
+
+    def cog_unload(self):
+        self.metrics.unregister(self.bot)
+        self.dispatcher.stop()
+
     async def send_message(self, user: Member, role: Role, guild: Guild, state: str):
-        if self.specific:
-            if role.id not in self.specific_roles:
-                return
+        """
+        DM a member about a role change, the roles are filtered by `on_member_update`.
+        This waits for the DM, `on_member_update` queues the notifications instead.
 
-        await self.embed(user, role_notifier[state].get("content", "Invalid lang.py").format(role=role, guild=guild,
-                                                                                             user=user),
-                         title=role_notifier[state].get("title", "Invalid lang.py"),
-                         footer=Footer(
-                             role_notifier[state]["footer"].get("text", "Invalid lang.py"),
-                             role_notifier[state]["footer"].get("icon", "").format(guild=guild),
-                             role_notifier[state]["footer"].get("timestamp", True)),
-                         color=(None if role_notifier[state]["color"].get("random", True) else
-                                role_notifier[state]["color"].get("color", 0xf0f0f0)))
+        @param state: `added` or `removed`.
+        """
+        template = self.templates[state]
+        with self.metrics.timed("dm_send"):
+            await self.embed(user, template.content(role=role, guild=guild, user=user), title=template.title,
+                             footer=Footer(template.footer_text, template.footer_icon(guild=guild), template.timestamp),
+                             color=template.color)
+        self.metrics.inc(f"dms_{state}")
+
+    async def __deliver(self, member: Member, role: Role, state: str):
+        await self.send_message(member, role, member.guild, state)
 
     @Cog.listener()
     async def on_member_update(self, before: Member, after: Member):
-        if before.roles != after.roles:
-            removed = len(before.roles) >= len(after.roles)
-            difference = [role for role in (before.roles if removed else after.roles) if
-                          role not in (before.roles if not removed else after.roles)]
-            for role in difference:
-                await self.send_message(after, role, after.guild, "removed" if removed else "added")
+        if before.roles == after.roles:
+            return
+
+        # One update can add and remove roles at the same time.
+        before_ids = {role.id for role in before.roles}
+        after_ids = {role.id for role in after.roles}
+        added = after_ids - before_ids
+        removed = before_ids - after_ids
+        if self.specific_roles is not None:
+            added &= self.specific_roles
+            removed &= self.specific_roles
+
+        if removed:
+            for role in before.roles:
+                if role.id in removed:
+                    self.dispatcher.notify(after, role, "removed")
+        if added:
+            for role in after.roles:
+                if role.id in added:
+                    self.dispatcher.notify(after, role, "added")
 
 
 def setup(bot):
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+Regression tests for the exp system, the extension is loaded with the stand-ins of the benchmark.
+
+Requires the same dependencies as the benchmark. (`discord.py`, `utilsx`, `humanize` and `aiosqlite`)
+
+Usage:
+    python -m pytest tests
+"""
+import asyncio
+import sys
+import unittest
+from configparser import ConfigParser
+from os import path
+
+sys.path.insert(0, path.join(path.dirname(path.dirname(path.abspath(__file__))), "benchmarks"))
+
+import bench_extensions  # noqa: E402
+
+bench_extensions._install_bot_modules(ConfigParser(), [])
+exp_system = bench_extensions._load_extension("exp-system/ExpSystem.py", "ExpSystem")
+
+
+class LeaderboardTest(unittest.TestCase):
+    def setUp(self):
+        self.leaderboard = exp_system._Leaderboard(lambda user_id, exp: (user_id, exp), capacity=5)
+
+    def test_lower_user_on_full_cache(self):
+        for user_id in range(1, 6):
+            self.leaderboard.update(user_id, 0, user_id * 10)
+        self.assertTrue(self.leaderboard.complete)
+
+        # A sixth user with less exp than every cached user doesn't fit anymore.
+        self.leaderboard.update(6, 0, 5)
+
+        self.assertFalse(self.leaderboard.complete)
+        self.assertFalse(self.leaderboard.covers(10))
+        self.assertEqual([user_id for user_id, _ in self.leaderboard.slice(0, 5)], [5, 4, 3, 2, 1])
+
+
+class PositionEventTest(unittest.TestCase):
+    def test_positions_of_batched_events(self):
+        guild = bench_extensions.FakeGuild(1)
+        channel = guild.channels[10] = bench_extensions.FakeTextChannel(10, guild)
+        for user_id in range(100, 106):
+            guild.members[user_id] = bench_extensions.FakeMember(user_id, guild)
+
+        cfg = ConfigParser()
+        cfg.read_dict({"LEVELING": {"storage": "memory"}})
+
+        async def run():
+            cog = exp_system.ExpSystem(bench_extensions.FakeBot(cfg, [guild]))
+            await cog.on_ready()
+            # Disable the cooldown, so every message earns exp.
+            cog.policy.award = lambda message, amount: 10
+            for user_id, exp in zip(range(101, 106), (15, 25, 35, 45, 55)):
+                await cog.db.add_experience(1, user_id, exp)
+
+            events = []
+
+            async def collect(batch):
+                events.extend(batch)
+
+            cog.events.subscribe(collect, exp_system.LeaderboardPositionChanged, batch_size=10, batch_delay=0.05)
+            # The member earns exp twice before the first event is delivered.
+            for idx in range(2):
+                message = bench_extensions.FakeMessage(guild.next_id(), guild.members[100], channel, str(idx))
+                await cog.on_message(message)
+            await asyncio.sleep(0.1)
+            cog.cog_unload()
+            return [(event.old_position, event.new_position) for event in events]
+
+        self.assertEqual(asyncio.run(run()), [(None, 6), (6, 5)])
+
+
+if __name__ == "__main__":
+    unittest.main()
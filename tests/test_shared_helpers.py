@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""
+Checks that the helpers which every extension carries are the same in each extension.
+
+The extensions are single-file drop-ins, the bot loads every file in its `extensions` folder as an extension, so the
+helpers can't live in a shared module. Each extension has its own copy instead, which has to stay identical.
+
+Usage:
+    python -m pytest tests
+"""
+import ast
+import unittest
+from os import path
+
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+EXTENSIONS = ("exp-system/ExpSystem.py", "purge-command/PurgeCommand.py", "role-notifier/RoleNotifier.py")
+SHARED = ("_Metrics", "_RateLimiter")
+
+
+def _classes(file: str) -> dict:
+    """
+    The source of every top level class of a file, by name.
+    """
+    with open(path.join(ROOT, file), encoding="utf-8") as handle:
+        source = handle.read()
+
+    return {node.name: ast.get_source_segment(source, node) for node in ast.parse(source).body
+            if isinstance(node, ast.ClassDef)}
+
+
+class SharedHelpersTest(unittest.TestCase):
+    def test_copies_are_identical(self):
+        sources = {file: _classes(file) for file in EXTENSIONS}
+
+        for name in SHARED:
+            with self.subTest(name=name):
+                copies = {file: classes.get(name) for file, classes in sources.items()}
+                self.assertNotIn(None, copies.values())
+                self.assertEqual(len(set(copies.values())), 1, f"The copies of `{name}` differ.")
+
+
+if __name__ == "__main__":
+    unittest.main()